@@ -0,0 +1,195 @@
+"""
+Command line entry point of the assistants.
+
+Only the chosen variant is imported. Its imports load in a background thread while the
+first prompt waits for the user, so a session can be typed into at once. The LLM clients
+and the LangGraph graphs are created when the first question arrives.
+
+--profile runs the startup of a variant in a fresh interpreter with -X importtime and
+reports the time to the first prompt and the import time by top-level package, to track
+the cold start of short-lived CLI and serverless invocations.
+
+Usage (from the repository root):
+
+    python -m core basic
+    python -m core langGraph_multi_agent --profile --profile-output startup.json
+
+"""
+
+import argparse
+import ast
+import builtins
+import importlib
+import json
+import os
+import re
+import runpy
+import subprocess
+import sys
+import threading
+import time
+from collections import defaultdict
+
+CORE_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(CORE_DIR)
+
+from common.benchmark import VARIANTS
+
+IMPORT_TIME_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|( +)(\S+)")
+
+
+class _Ready(Exception):
+    """
+    Raised by input() in --startup-only runs once the variant shows its first prompt.
+    """
+
+
+def variant_imports(script):
+    """
+    Modules imported at the top level of a main.py, in order.
+    """
+    with open(script, "r", encoding="utf-8") as f:
+        tree = ast.parse(f.read(), filename=script)
+
+    modules = []
+    for node in tree.body:
+        if isinstance(node, ast.Import):
+            modules.extend(alias.name for alias in node.names)
+        elif isinstance(node, ast.ImportFrom) and node.level == 0:
+            modules.append(node.module)
+    return modules
+
+
+def preload(modules):
+    for module in modules:
+        try:
+            importlib.import_module(module)
+        except Exception:
+            ## main.py reports the error when it imports the module itself
+            pass
+
+
+def run_variant(variant, startup_only=False):
+    """
+    Run the main.py of a variant in this process.
+
+    Parameters:
+    variant (str): Name of the variant directory.
+    startup_only (bool): Return at the first prompt instead of starting the conversation.
+    """
+    script = os.path.join(CORE_DIR, variant, "main.py")
+    ## The variants use flat imports (agents, utils, tools) relative to their own directory
+    sys.path.insert(0, os.path.dirname(script))
+    sys.argv = [script]
+    original_input = builtins.input
+
+    if startup_only:
+        def ready(prompt=""):
+            raise _Ready
+
+        builtins.input = ready
+        try:
+            runpy.run_path(script, run_name="__main__")
+        except _Ready:
+            pass
+        finally:
+            builtins.input = original_input
+        return
+
+    loader = threading.Thread(target=preload, args=(variant_imports(script),), daemon=True)
+    loader.start()
+    try:
+        first_query = original_input("User: ")
+    except (EOFError, KeyboardInterrupt):
+        return
+    loader.join()
+
+    def first_input(prompt=""):
+        ## The prompt of the first question is already on the screen
+        builtins.input = original_input
+        return first_query
+
+    builtins.input = first_input
+    try:
+        runpy.run_path(script, run_name="__main__")
+    except (EOFError, KeyboardInterrupt):
+        pass
+    finally:
+        builtins.input = original_input
+
+
+def profile_startup(variant):
+    """
+    Start a variant in a fresh interpreter up to its first prompt.
+
+    Returns:
+    dict: Wall time to the first prompt, total import time and the import time of every
+        top-level package, in seconds.
+    """
+    command = [sys.executable, "-X", "importtime", "-m", "core", variant, "--startup-only"]
+    start = time.perf_counter()
+    completed = subprocess.run(
+        command,
+        cwd=os.path.dirname(CORE_DIR),
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        text=True,
+    )
+    wall_time = time.perf_counter() - start
+    if completed.returncode != 0:
+        raise RuntimeError(f"{variant} failed to start:\n{completed.stderr}")
+
+    packages = defaultdict(float)
+    import_time = 0.0
+    modules = 0
+    for line in completed.stderr.splitlines():
+        match = IMPORT_TIME_LINE.match(line)
+        if not match:
+            continue
+        self_us, cumulative_us, indent, name = match.groups()
+        modules += 1
+        packages[name.split(".")[0]] += int(self_us) / 1e6
+        if len(indent) == 1:
+            import_time += int(cumulative_us) / 1e6
+
+    return {
+        "variant": variant,
+        "wall_time": wall_time,
+        "import_time": import_time,
+        "modules": modules,
+        "packages": dict(sorted(packages.items(), key=lambda item: -item[1])),
+    }
+
+
+def print_profile(report, top):
+    print(f"{report['variant']}: first prompt after {report['wall_time']:.2f} s, {report['import_time']:.2f} s importing {report['modules']} modules")
+    header = f"{'package':<32}{'ms':>9}{'share %':>9}"
+    print(header)
+    print("-" * len(header))
+    for package, seconds in list(report["packages"].items())[:top]:
+        print(f"{package:<32}{1000 * seconds:>9.1f}{100 * seconds / max(report['import_time'], 1e-9):>9.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m core", description="Talk to one of the travel assistants.")
+    parser.add_argument("variant", choices=VARIANTS)
+    parser.add_argument("--profile", action="store_true", help="Report the startup time of the variant instead of running it")
+    parser.add_argument("--profile-output", help="Write the startup report to this JSON file")
+    parser.add_argument("--top", type=int, default=15, help="Packages listed in the startup report")
+    parser.add_argument("--startup-only", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if not args.profile:
+        run_variant(args.variant, args.startup_only)
+        return
+
+    report = profile_startup(args.variant)
+    print_profile(report, args.top)
+    if args.profile_output:
+        with open(args.profile_output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
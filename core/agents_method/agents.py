@@ -5,49 +5,67 @@ Agent and function definitions for an AI assistant that answers questions relate
 This implementation is based on https://cookbook.openai.com/examples/orchestrating_agents?utm_source=www.therundown.ai&utm_medium=newsletter&utm_campaign=anthropic-ceo-predicts-ai-utopia&_bhlid=db30852b7747db2f62cd8fde276efcf151c6c21a
 """
 
-from openai import OpenAI
-import openai
-import requests
-from dotenv import load_dotenv
-import os
-from pydantic import BaseModel
+from typing import Optional
+
+from pydantic import BaseModel, PrivateAttr
+
+from common.tool_registry import ToolRegistry
+from common.prompt_layout import PromptPrefix
+from common.tool_runtime import get_tool_runtime
+
+## Gazetteer, offline engines, Maps lookups and the travel duration cache, shared by every variant in the process
+tool_runtime = get_tool_runtime()
 
 class Agent(BaseModel): 
     name: str = "Agent"
     model: str = "gpt-4o-mini"
     instructions: str = "Your are a helpful Agent"
     tools: list = []
+    ## None caches completions unless they are sampled with a temperature above 0.
+    ## True also caches sampled completions, False never serves this agent from the completion cache.
+    cache_completions: Optional[bool] = None
+
+    ## Tool schemas and dispatch table, compiled once when the agent is defined
+    _registry: ToolRegistry = PrivateAttr()
+    ## System message and tool schemas, identical in every request of the agent
+    _prompt: PromptPrefix = PrivateAttr()
+
+    def model_post_init(self, __context):
+        self._registry = ToolRegistry(self.tools)
+        self._prompt = PromptPrefix(self.instructions, self._registry.schemas)
+
+    @property
+    def registry(self) -> ToolRegistry:
+        return self._registry
+
+    @property
+    def prompt(self) -> PromptPrefix:
+        return self._prompt
 
 def compute_travel_duration(origin, destination, mode_of_travel):
     """
     Function to compute travel duration given origin, destination and mode of travel.
     The output of this function is a string, that is used by the LLM to produce the response.
     """
-    ## Time is hard-coded. In reality, this would be an API call.
-    output = f'Time to travel from  {origin} to {destination} by {mode_of_travel} is 1 hour.'
-    return output
+    return tool_runtime.compute_travel_duration(origin, destination, mode_of_travel)
 
 def traffic_condition(route):
     """
     This function takes route a input and returns real-time traffic updates.
     """
-    return f'There is heavey traffic between cityA and cityB on {route}, which could add 20 minutes to the journey'
+    return tool_runtime.traffic_condition(route)
 
 def find_route(origin, destination, mode_of_travel):
     """
     This function takes origin, destination, mode of travel and returns the transite route number. 
     """
-    route_number = "425"
-    print(f'Found {mode_of_travel} route from {origin} to {destination}: {route_number}')
-    return route_number
+    return tool_runtime.find_route(origin, destination, mode_of_travel)
 
-def find_transit_schedule(route_number, mode_of_travel):
+def find_transit_schedule(route_number, mode_of_travel, stop=None):
     """
-    This function returns the schedule for the route number.
+    This function returns the schedule for the route number, from the stop if one is given.
     """
-    print("Looking up transit schedules.")
-    output = f'The next {route_number} {mode_of_travel} leaves at 10.30AM. Next one is scheduled at 11.30 AM.'
-    return output
+    return tool_runtime.find_transit_schedule(route_number, mode_of_travel, stop)
 
 def transfer_to_travel_duration_agent():
     """
@@ -119,4 +137,6 @@ other_queries_agent = Agent(
                     "Be open to follow-up questions. "
                     "If the question is not relevant, ask the user to ask relevant questions or pass back to triage. ",
     tools = [transfer_back_to_triage_agent],
+    ## Made-up answers should vary between sessions
+    cache_completions = False,
 )
\ No newline at end of file
@@ -30,22 +30,35 @@ This implementation is purely based on OpenAI API, without other libraries such
 
 """
 
-from openai import OpenAI
-import openai
-import requests
+from openai import OpenAI, AsyncOpenAI
 from dotenv import load_dotenv
 import os
 from pydantic import BaseModel
 from typing import Optional
+import asyncio
+import sys
+from concurrent.futures import ThreadPoolExecutor
 
-from utils import execute_tool_call, function_to_schema
+## Shared modules live in core/common
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils import execute_tool_call
+from common.tool_registry import execute_tool_calls_async, collect_tool_result
 from agents import *
+from common.history import ConversationHistory, make_openai_summarizer
+from common.prompt_layout import canonical_message
+from common.streaming import stream_message
+from common.completion_cache import get_completion_cache, chat_completion, achat_completion
+from common.tracing import tracer
+from common.resilience import llm_resilience, RetryBudget, LLMUnavailableError, UNAVAILABLE_MESSAGE
+from common.intent_router import IntentRouter, TRAVEL_DURATION, TRAFFIC_UPDATES, TRANSIT_DETAILS, OTHER
 
 
 class Response(BaseModel):
     agent: Optional[Agent]
     messages: list
 
+@tracer.traced("turn")
 def run_assistant(agent, messages):
 
     """
@@ -65,19 +78,21 @@ def run_assistant(agent, messages):
 
     while True:
 
-        ## Convert Python functions to schemas
-        tool_schemas = [function_to_schema(tool) for tool in current_agent.tools]
-        tool_map = {tool.__name__: tool for tool in current_agent.tools}
-
-        ## Get chat completion
-        response = client.chat.completions.create(
-            model= current_agent.model,
-            messages=[{"role": "system", "content": current_agent.instructions}] + messages,
-            tools= tool_schemas or None,
-        )
+        ## Get chat completion. Each loop iteration records one llm span.
+        with tracer.span("chat_completion", "llm", model=current_agent.model, agent=current_agent.name) as span:
+            response = llm_resilience.call(
+                chat_completion,
+                client,
+                completion_cache,
+                budget=retry_budget,
+                use_cache= current_agent.cache_completions,
+                model= current_agent.model,
+                **current_agent.prompt.request(messages),
+            )
+            span.record_usage(response.usage)
 
         message = response.choices[0].message
-        messages.append(message)
+        messages.append(canonical_message(message))
 
         if message.content:
             print("Assistant:", message.content)
@@ -87,7 +102,7 @@ def run_assistant(agent, messages):
 
         ## Execute tool calls (if any)
         for tool_call in message.tool_calls:
-            result = execute_tool_call(tool_call, tool_map, current_agent.name)
+            result = execute_tool_call(tool_call, current_agent.registry, current_agent.name)
 
             if type(result) == Agent:
                 current_agent = result
@@ -101,20 +116,241 @@ def run_assistant(agent, messages):
                 "content": result,
             }
 
-            messages.append(result_message)
+            messages.append(canonical_message(result_message))
     
     ## Return recent messages
     return Response(agent=current_agent, messages=messages[num_init_messages:])
 
+@tracer.traced("turn")
+def run_assistant_streaming(agent, messages):
+
+    """
+    Run the AI assistant pipeline, printing tokens as they are generated.
+    Each tool call starts executing as soon as its arguments have been streamed.
+
+    Parameters:
+    agent (Agent): The current agent that controls the application.
+    messages (list): Conversation history.
+
+    Returns:
+    Response: The agent in control at the end of the turn and the messages added during the turn.
+    """
+
+    current_agent = agent
+    num_init_messages = len(messages)
+    messages = messages.copy()
+
+    while True:
+
+        ## Stream the chat completion. Tool calls are dispatched while the message is streaming.
+        ## Streamed completions are not cached.
+        ## Bind the agent now, a handoff later in the turn must not change who ran the tool.
+        registry, agent_name = current_agent.registry, current_agent.name
+        with tracer.span("chat_completion", "llm", model=current_agent.model, agent=current_agent.name, stream=True) as span:
+            message, futures, usage = stream_message(
+                client,
+                tool_executor,
+                lambda tool_call: execute_tool_call(tool_call, registry, agent_name),
+                create=llm_resilience.wrap(client.chat.completions.create, retry_budget),
+                model= current_agent.model,
+                **current_agent.prompt.request(messages),
+            )
+            span.record_usage(usage)
+        messages.append(canonical_message(message))
+
+        if not message.tool_calls:
+            break
+
+        for tool_call, future in zip(message.tool_calls, futures):
+            timeout = TOOL_TIMEOUTS.get(tool_call.function.name, DEFAULT_TOOL_TIMEOUT)
+            result = collect_tool_result(future, tool_call, timeout)
+
+            if type(result) == Agent:
+                current_agent = result
+                result = (
+                    f'Transfered to {current_agent.name}. Adopt persona immediately.'
+                )
+
+            result_message = {
+                "role": "tool",
+                "tool_call_id": tool_call.id,
+                "content": result,
+            }
+
+            messages.append(canonical_message(result_message))
+
+    ## Return recent messages
+    return Response(agent=current_agent, messages=messages[num_init_messages:])
+
+@tracer.traced("turn")
+async def run_assistant_async(agent, messages):
+
+    """
+    Run the AI assistant pipeline with the async client.
+    Tool calls requested in the same assistant message are executed concurrently.
+
+    Parameters:
+    agent (Agent): The current agent that controls the application.
+    messages (list): Conversation history.
+
+    Returns:
+    Response: The agent in control at the end of the turn and the messages added during the turn.
+    """
+
+    current_agent = agent
+    num_init_messages = len(messages)
+    messages = messages.copy()
+
+    while True:
+
+        ## Get chat completion. Each loop iteration records one llm span.
+        with tracer.span("chat_completion", "llm", model=current_agent.model, agent=current_agent.name) as span:
+            response = await llm_resilience.acall(
+                achat_completion,
+                async_client,
+                completion_cache,
+                budget=retry_budget,
+                use_cache= current_agent.cache_completions,
+                model= current_agent.model,
+                **current_agent.prompt.request(messages),
+            )
+            span.record_usage(response.usage)
+
+        message = response.choices[0].message
+        messages.append(canonical_message(message))
+
+        if message.content:
+            print("Assistant:", message.content)
+
+        if not message.tool_calls:
+            break
+
+        ## Execute tool calls concurrently. Results come back in the order of the tool calls,
+        ## so handoffs are applied in the same order as in run_assistant.
+        registry, agent_name = current_agent.registry, current_agent.name
+        results = await execute_tool_calls_async(
+            lambda tool_call: execute_tool_call(tool_call, registry, agent_name),
+            message.tool_calls, TOOL_TIMEOUTS, DEFAULT_TOOL_TIMEOUT,
+        )
+
+        for tool_call, result in zip(message.tool_calls, results):
+
+            if type(result) == Agent:
+                current_agent = result
+                result = (
+                    f'Transfered to {current_agent.name}. Adopt persona immediately.'
+                )
+
+            result_message = {
+                "role": "tool",
+                "tool_call_id": tool_call.id,
+                "content": result,
+            }
+
+            messages.append(canonical_message(result_message))
+
+    ## Return recent messages
+    return Response(agent=current_agent, messages=messages[num_init_messages:])
+
+def route_query(agent, user_query):
+    """
+    Pick the agent for a new user query. When the triage agent is in control and the local
+    intent router is confident, the query goes straight to the specialist and the triage
+    LLM call is skipped.
+
+    Parameters:
+    agent (Agent): The current agent.
+    user_query (str): The new user query.
+
+    Returns:
+    Agent: The agent that handles the query.
+    """
+    if not USE_INTENT_ROUTER or agent is not triage_Agent:
+        return agent
+    with tracer.span("intent_router", "routing") as span:
+        label = intent_router.route(user_query)
+        span.set(label=label)
+    return INTENT_AGENTS.get(label, agent)
+
+def log_triage_decision(agent, response, user_query):
+    """
+    Log the specialist the triage LLM picked, or OTHER when it answered the query itself,
+    as training data for the intent router.
+    """
+    if agent is not triage_Agent:
+        return
+    if response.agent is triage_Agent:
+        if not any(message.get("tool_calls") for message in response.messages):
+            intent_router.log_turn(user_query, OTHER)
+        return
+    ## A transfer to the other_queries_agent is an "other" turn too
+    label = next((label for label, specialist in INTENT_AGENTS.items() if response.agent is specialist), OTHER)
+    intent_router.log_turn(user_query, label)
+
+async def chat_async(agent, history):
+    """
+    Interactive loop for the async pipeline. All turns share one event loop,
+    so the async client can reuse its connections.
+    """
+    while True:
+        user_query = await asyncio.to_thread(input, "User: ")
+        history.append({"role": "user", "content": user_query})
+        agent = route_query(agent, user_query)
+
+        try:
+            response = await run_assistant_async(agent, history.window())
+        except LLMUnavailableError:
+            print("Assistant:", UNAVAILABLE_MESSAGE)
+            continue
+        log_triage_decision(agent, response, user_query)
+        agent = response.agent
+        ## Summarizing evicted turns is a blocking LLM call
+        await asyncio.to_thread(history.extend, response.messages)
+
 
 load_dotenv()
 
 ## If you want LangSmith to trace your runs, set this environmental variable
 #os.environ["LANGCHAIN_TRACING_V2"] = "true"
 
-client = OpenAI(api_key = os.getenv("OPENAI_API_KEY"))
+## Retries are made by llm_resilience, which also opens a circuit breaker when the API is degraded.
+## LLM_TIMEOUT and LLM_MAX_ATTEMPTS configure it.
+client = OpenAI(api_key = os.getenv("OPENAI_API_KEY"), timeout=llm_resilience.policy.timeout, max_retries=0)
+async_client = AsyncOpenAI(api_key = os.getenv("OPENAI_API_KEY"), timeout=llm_resilience.policy.timeout, max_retries=0)
+
+## One conversation per process, so one retry budget
+retry_budget = RetryBudget()
 map_api_key = os.getenv("GOOGLE_MAPS_API_KEY")
 
+## Run the async pipeline with concurrent tool calls
+USE_ASYNC = False
+
+## On-disk completion cache, enabled by setting COMPLETION_CACHE_DIR
+completion_cache = get_completion_cache()
+
+## Tokens of recent conversation resent with every request. Older turns are summarized.
+HISTORY_TOKEN_BUDGET = 2000
+
+## Print tokens as they arrive and start tools before the message is complete
+USE_STREAMING = False
+tool_executor = ThreadPoolExecutor(max_workers=8)
+
+## Seconds a tool may run before its result is replaced by an error message
+DEFAULT_TOOL_TIMEOUT = 30
+TOOL_TIMEOUTS = {
+    "compute_travel_duration": 10,
+}
+
+## Route confident queries to the specialist without the triage LLM call.
+## INTENT_MODEL_PATH, INTENT_LOG_PATH and INTENT_ROUTER_THRESHOLD configure the router.
+USE_INTENT_ROUTER = True
+intent_router = IntentRouter.from_env()
+INTENT_AGENTS = {
+    TRAVEL_DURATION: travel_duration_agent,
+    TRAFFIC_UPDATES: traffic_updates_agent,
+    TRANSIT_DETAILS: transit_schedule_agent,
+}
+
 questions = [
     "How much time will it take me to go from Sunnyvale to Mountain View by car?",
     "How is the traffic situation on this route?",
@@ -127,13 +363,28 @@ questions = [
     "How much time will it take to drive from there to Golden Gate Park?",
 ]
 
-messages = []
+## Conversation history kept within HISTORY_TOKEN_BUDGET
+history = ConversationHistory(make_openai_summarizer(client, create=llm_resilience.wrap(client.chat.completions.create, retry_budget)), token_budget=HISTORY_TOKEN_BUDGET)
 agent = triage_Agent
-while True:
-    user_query = input("User: ")
-    messages.append({"role": "user", "content": user_query})
 
-    response = run_assistant(agent, messages)
-    agent = response.agent
-    messages.extend(response.messages)
+if USE_ASYNC:
+    asyncio.run(chat_async(agent, history))
+else:
+    while True:
+        user_query = input("User: ")
+        history.append({"role": "user", "content": user_query})
+        agent = route_query(agent, user_query)
+
+        try:
+            if USE_STREAMING:
+                response = run_assistant_streaming(agent, history.window())
+            else:
+                response = run_assistant(agent, history.window())
+        except LLMUnavailableError:
+            ## The question stays in the history, so the next turn can pick it up
+            print("Assistant:", UNAVAILABLE_MESSAGE)
+            continue
+        log_triage_decision(agent, response, user_query)
+        agent = response.agent
+        history.extend(response.messages)
 
@@ -26,61 +26,24 @@ SOFTWARE.
 """
 
 
-import json
-import inspect
+from common.tracing import tracer
 
-def execute_tool_call(tool_call, tools_map, agent_name):
+def execute_tool_call(tool_call, registry, agent_name):
     name = tool_call.function.name
-    args = json.loads(tool_call.function.arguments)
+    args, error = registry.parse_arguments(name, tool_call.function.arguments)
+
+    if error:
+        ## Malformed arguments go back to the LLM instead of reaching the tool
+        print(f"{agent_name}: {name} rejected: {error}")
+        return error
 
     print(f"{agent_name}: {name}({args})")
 
     # call corresponding function with provided arguments
-    return tools_map[name](**args)
-
-def function_to_schema(func) -> dict:
-    type_map = {
-        str: "string",
-        int: "integer",
-        float: "number",
-        bool: "boolean",
-        list: "array",
-        dict: "object",
-        type(None): "null",
-    }
-
-    try:
-        signature = inspect.signature(func)
-    except ValueError as e:
-        raise ValueError(
-            f"Failed to get signature for function {func.__name__}: {str(e)}"
-        )
-
-    parameters = {}
-    for param in signature.parameters.values():
-        try:
-            param_type = type_map.get(param.annotation, "string")
-        except KeyError as e:
-            raise KeyError(
-                f"Unknown type annotation {param.annotation} for parameter {param.name}: {str(e)}"
-            )
-        parameters[param.name] = {"type": param_type}
-
-    required = [
-        param.name
-        for param in signature.parameters.values()
-        if param.default == inspect._empty
-    ]
-
-    return {
-        "type": "function",
-        "function": {
-            "name": func.__name__,
-            "description": (func.__doc__ or "").strip(),
-            "parameters": {
-                "type": "object",
-                "properties": parameters,
-                "required": required,
-            },
-        },
-    }
+    with tracer.span(name, "tool", agent=agent_name) as span:
+        result = registry.tool_map[name](**args)
+        ## Transfer functions return the next agent instead of a string
+        if not isinstance(result, str) and hasattr(result, "instructions"):
+            span.stage = "handoff"
+            span.set(to_agent=result.name)
+        return result
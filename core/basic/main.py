@@ -29,22 +29,28 @@ AI assistant that answers questions related to travel information including trav
 
 """
 
-from openai import OpenAI
-import openai
-import requests
+from openai import OpenAI, AsyncOpenAI
 from dotenv import load_dotenv
 import os
-from langchain_openai import ChatOpenAI
-from langchain_core.messages import HumanMessage, SystemMessage, AIMessage
-from langchain_core.output_parsers import StrOutputParser
-from langchain_core.chat_history import BaseChatMessageHistory, InMemoryChatMessageHistory
-from langchain_core.runnables.history import RunnableWithMessageHistory
-from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
-
-from utils import execute_tool_call, function_to_schema
+import sys
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+## Shared modules live in core/common
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils import execute_tool_call
+from common.tool_registry import ToolRegistry, execute_tool_calls_async, collect_tool_result
 from tools import *
+from common.history import ConversationHistory, make_openai_summarizer
+from common.prompt_layout import PromptPrefix, canonical_message
+from common.streaming import stream_message
+from common.completion_cache import get_completion_cache, chat_completion, achat_completion
+from common.tracing import tracer
+from common.resilience import llm_resilience, RetryBudget, LLMUnavailableError, UNAVAILABLE_MESSAGE
 
-def run_assistant(system_message, messages, tools):
+@tracer.traced("turn")
+def run_assistant(prompt, messages, registry):
 
     """
     Run the AI assistant pipeline.
@@ -59,21 +65,22 @@ def run_assistant(system_message, messages, tools):
     num_init_messages = len(messages)
     messages = messages.copy()
 
-    ## Convert Python functions to schemas
-    tool_schemas = [function_to_schema(tool) for tool in tools]
-    tool_map = {tool.__name__: tool for tool in tools}
-
     while True:
 
-        ## Get chat completion
-        response = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[{"role": "system", "content": system_message}] + messages,
-            tools= tool_schemas or None,
-        )
+        ## Get chat completion. Each loop iteration records one llm span.
+        with tracer.span("chat_completion", "llm", model="gpt-4o-mini") as span:
+            response = llm_resilience.call(
+                chat_completion,
+                client,
+                completion_cache,
+                budget=retry_budget,
+                model="gpt-4o-mini",
+                **prompt.request(messages),
+            )
+            span.record_usage(response.usage)
 
         message = response.choices[0].message
-        messages.append(message)
+        messages.append(canonical_message(message))
 
         if message.content:
             print("Assistant:", message.content)
@@ -83,7 +90,7 @@ def run_assistant(system_message, messages, tools):
 
         ## Execute tool calls (if any)
         for tool_call in message.tool_calls:
-            result = execute_tool_call(tool_call, tool_map)
+            result = execute_tool_call(tool_call, registry)
 
             result_message = {
                 "role": "tool",
@@ -91,18 +98,171 @@ def run_assistant(system_message, messages, tools):
                 "content": result,
             }
 
-            messages.append(result_message)
+            messages.append(canonical_message(result_message))
     
     ## Return recent messages
     return messages[num_init_messages:]
 
+@tracer.traced("turn")
+def run_assistant_streaming(prompt, messages, registry):
+
+    """
+    Run the AI assistant pipeline, printing tokens as they are generated.
+    Each tool call starts executing as soon as its arguments have been streamed.
+
+    Parameters:
+    prompt (PromptPrefix): System message and tool schemas.
+    messages (list): Conversation history.
+    registry (ToolRegistry): Compiled tools the assistant can call.
+
+    Returns:
+    list: Messages added during this turn.
+    """
+
+    num_init_messages = len(messages)
+    messages = messages.copy()
+
+    while True:
+
+        ## Stream the chat completion. Tool calls are dispatched while the message is streaming.
+        ## Streamed completions are not cached.
+        with tracer.span("chat_completion", "llm", model="gpt-4o-mini", stream=True) as span:
+            message, futures, usage = stream_message(
+                client,
+                tool_executor,
+                lambda tool_call: execute_tool_call(tool_call, registry),
+                create=llm_resilience.wrap(client.chat.completions.create, retry_budget),
+                model="gpt-4o-mini",
+                **prompt.request(messages),
+            )
+            span.record_usage(usage)
+        messages.append(canonical_message(message))
+
+        if not message.tool_calls:
+            break
+
+        for tool_call, future in zip(message.tool_calls, futures):
+            timeout = TOOL_TIMEOUTS.get(tool_call.function.name, DEFAULT_TOOL_TIMEOUT)
+            result_message = {
+                "role": "tool",
+                "tool_call_id": tool_call.id,
+                "content": collect_tool_result(future, tool_call, timeout),
+            }
+
+            messages.append(canonical_message(result_message))
+
+    ## Return recent messages
+    return messages[num_init_messages:]
+
+@tracer.traced("turn")
+async def run_assistant_async(prompt, messages, registry):
+
+    """
+    Run the AI assistant pipeline with the async client.
+    Tool calls requested in the same assistant message are executed concurrently.
+
+    Parameters:
+    prompt (PromptPrefix): System message and tool schemas.
+    messages (list): Conversation history.
+    registry (ToolRegistry): Compiled tools the assistant can call.
+
+    Returns:
+    list: Messages added during this turn.
+    """
+
+    num_init_messages = len(messages)
+    messages = messages.copy()
+
+    while True:
+
+        ## Get chat completion. Each loop iteration records one llm span.
+        with tracer.span("chat_completion", "llm", model="gpt-4o-mini") as span:
+            response = await llm_resilience.acall(
+                achat_completion,
+                async_client,
+                completion_cache,
+                budget=retry_budget,
+                model="gpt-4o-mini",
+                **prompt.request(messages),
+            )
+            span.record_usage(response.usage)
+
+        message = response.choices[0].message
+        messages.append(canonical_message(message))
+
+        if message.content:
+            print("Assistant:", message.content)
+
+        if not message.tool_calls:
+            break
+
+        ## Execute tool calls concurrently. Results come back in the order of the tool calls.
+        results = await execute_tool_calls_async(
+            lambda tool_call: execute_tool_call(tool_call, registry), message.tool_calls, TOOL_TIMEOUTS, DEFAULT_TOOL_TIMEOUT
+        )
+
+        for tool_call, result in zip(message.tool_calls, results):
+            result_message = {
+                "role": "tool",
+                "tool_call_id": tool_call.id,
+                "content": result,
+            }
+
+            messages.append(canonical_message(result_message))
+
+    ## Return recent messages
+    return messages[num_init_messages:]
+
+async def chat_async(prompt, history, registry):
+    """
+    Interactive loop for the async pipeline. All turns share one event loop,
+    so the async client can reuse its connections.
+    """
+    while True:
+        user_query = await asyncio.to_thread(input, "User: ")
+        history.append({"role": "user", "content": user_query})
+
+        try:
+            result = await run_assistant_async(prompt, history.window(), registry)
+        except LLMUnavailableError:
+            print("Assistant:", UNAVAILABLE_MESSAGE)
+            continue
+
+        ## Summarizing evicted turns is a blocking LLM call
+        await asyncio.to_thread(history.extend, result)
+
 
 load_dotenv()
 
-client = OpenAI(api_key = os.getenv("OPENAI_API_KEY"))
+## Retries are made by llm_resilience, which also opens a circuit breaker when the API is degraded.
+## LLM_TIMEOUT and LLM_MAX_ATTEMPTS configure it.
+client = OpenAI(api_key = os.getenv("OPENAI_API_KEY"), timeout=llm_resilience.policy.timeout, max_retries=0)
+async_client = AsyncOpenAI(api_key = os.getenv("OPENAI_API_KEY"), timeout=llm_resilience.policy.timeout, max_retries=0)
+
+## One conversation per process, so one retry budget
+retry_budget = RetryBudget()
 
 USE_API = False
 
+## On-disk completion cache, enabled by setting COMPLETION_CACHE_DIR
+completion_cache = get_completion_cache()
+
+## Tokens of recent conversation resent with every request. Older turns are summarized.
+HISTORY_TOKEN_BUDGET = 2000
+
+## Run the async pipeline with concurrent tool calls
+USE_ASYNC = False
+
+## Print tokens as they arrive and start tools before the message is complete
+USE_STREAMING = False
+tool_executor = ThreadPoolExecutor(max_workers=8)
+
+## Seconds a tool may run before its result is replaced by an error message
+DEFAULT_TOOL_TIMEOUT = 30
+TOOL_TIMEOUTS = {
+    "compute_travel_duration": 10,
+}
+
 system_message = (
     "You are a helpful assistant that processes user queries related to travel information."
     "Answer in one sentence."
@@ -130,15 +290,33 @@ questions = [
 
 tools = [compute_travel_duration, traffic_condition, find_route, find_transit_schedule]
 
-messages = []
+## Schemas and dispatch table are compiled once instead of on every turn
+registry = ToolRegistry(tools)
 
-while True:
-    user_query = input("User: ")
-    messages.append({"role": "user", "content": user_query})
+## Every request starts with the same system message and tool schemas, so the API can reuse its prompt cache
+prompt = PromptPrefix(system_message, registry.schemas)
 
-    result = run_assistant(system_message, messages, tools)
+## Conversation history kept within HISTORY_TOKEN_BUDGET
+history = ConversationHistory(make_openai_summarizer(client, create=llm_resilience.wrap(client.chat.completions.create, retry_budget)), token_budget=HISTORY_TOKEN_BUDGET)
 
-    messages.extend(result)
+if USE_ASYNC:
+    asyncio.run(chat_async(prompt, history, registry))
+else:
+    while True:
+        user_query = input("User: ")
+        history.append({"role": "user", "content": user_query})
+
+        try:
+            if USE_STREAMING:
+                result = run_assistant_streaming(prompt, history.window(), registry)
+            else:
+                result = run_assistant(prompt, history.window(), registry)
+        except LLMUnavailableError:
+            ## The question stays in the history, so the next turn can pick it up
+            print("Assistant:", UNAVAILABLE_MESSAGE)
+            continue
+
+        history.extend(result)
 
 
 
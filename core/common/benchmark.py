@@ -0,0 +1,155 @@
+"""
+Cross-variant latency benchmark.
+
+Pushes the `questions` list of each variant through its main.py with the OpenAI and Maps
+calls served from cassettes, and reports wall time, LLM round-trips, tool calls, tokens
+per turn and the share of prompt tokens the provider served from its prompt cache. Each
+variant runs in its own process because the variants share module names (agents, tools,
+utils).
+
+Usage (from the repository root):
+
+    ## Record the cassettes once against the live APIs
+    python core/common/benchmark.py --record
+
+    ## Replay offline with the recorded latencies, save the report and compare against an older one
+    python core/common/benchmark.py --output report.json --baseline old_report.json
+
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+CORE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CASSETTE_SCRIPT = os.path.join(CORE_DIR, "common", "cassette.py")
+
+VARIANTS = ["basic", "agents_method", "langGraph_single_agent", "langGraph_multi_agent"]
+
+## Per-turn metrics compared against the baseline. Larger is worse for all of them.
+REGRESSION_METRICS = ["wall_time", "llm_calls", "tool_calls", "total_tokens"]
+
+
+def run_variant(variant, cassette_path, mode, latency_scale, verbose=False):
+    """
+    Run one variant in a subprocess and return its per-turn statistics.
+    """
+    script = os.path.join(CORE_DIR, variant, "main.py")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        stats_path = os.path.join(tmp, "stats.json")
+        command = [
+            sys.executable, CASSETTE_SCRIPT, mode, cassette_path, script,
+            "--questions", "--latency-scale", str(latency_scale), "--stats", stats_path,
+        ]
+        completed = subprocess.run(
+            command,
+            cwd=os.path.dirname(script),
+            stdout=None if verbose else subprocess.DEVNULL,
+            stderr=subprocess.PIPE,
+            text=True,
+        )
+        if completed.returncode != 0:
+            raise RuntimeError(f"{variant} failed:\n{completed.stderr}")
+
+        with open(stats_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+
+def summarize(turns):
+    """
+    Reduce per-turn statistics to the numbers reported for a variant.
+    """
+    wall_times = [t["wall_time"] for t in turns]
+    num_turns = len(turns) or 1
+
+    def per_turn(field):
+        return sum(t[field] for t in turns) / num_turns
+
+    return {
+        "turns": len(turns),
+        "total_time": sum(wall_times),
+        "wall_time": per_turn("wall_time"),
+        "p50_wall_time": statistics.median(wall_times) if wall_times else 0.0,
+        "max_wall_time": max(wall_times, default=0.0),
+        "llm_calls": per_turn("llm_calls"),
+        "tool_calls": per_turn("tool_calls"),
+        "maps_calls": per_turn("maps_calls"),
+        "prompt_tokens": per_turn("prompt_tokens"),
+        "completion_tokens": per_turn("completion_tokens"),
+        "total_tokens": per_turn("prompt_tokens") + per_turn("completion_tokens"),
+        "cached_tokens": per_turn("cached_tokens"),
+        "cache_hit_rate": sum(t["cached_tokens"] for t in turns) / max(1, sum(t["prompt_tokens"] for t in turns)),
+    }
+
+
+def print_report(report):
+    header = f"{'variant':<24}{'turns':>6}{'total s':>9}{'s/turn':>8}{'p50 s':>8}{'LLM/turn':>10}{'tools/turn':>11}{'tokens/turn':>12}{'cached %':>10}"
+    print(header)
+    print("-" * len(header))
+    for variant, s in report.items():
+        print(
+            f"{variant:<24}{s['turns']:>6}{s['total_time']:>9.2f}{s['wall_time']:>8.2f}{s['p50_wall_time']:>8.2f}"
+            f"{s['llm_calls']:>10.2f}{s['tool_calls']:>11.2f}{s['total_tokens']:>12.0f}{100 * s['cache_hit_rate']:>10.1f}"
+        )
+
+
+def find_regressions(report, baseline, tolerance):
+    """
+    Compare a report against a baseline report.
+
+    Returns:
+    list: Human readable descriptions of every metric that grew by more than the tolerance.
+    """
+    regressions = []
+    for variant, stats in report.items():
+        if variant not in baseline:
+            continue
+        for metric in REGRESSION_METRICS:
+            old, new = baseline[variant][metric], stats[metric]
+            if new > old * (1 + tolerance) and new - old > 1e-9:
+                regressions.append(f"{variant}: {metric} {old:.2f} -> {new:.2f}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the assistant variants on recorded conversations.")
+    parser.add_argument("--variants", nargs="+", default=VARIANTS, choices=VARIANTS)
+    parser.add_argument("--cassette-dir", default="cassettes", help="Directory holding one cassette per variant")
+    parser.add_argument("--record", action="store_true", help="Record new cassettes against the live APIs")
+    parser.add_argument("--latency-scale", type=float, default=1.0, help="Replay latency multiplier, 0 for no delays")
+    parser.add_argument("--output", help="Write the report to this JSON file")
+    parser.add_argument("--baseline", help="Report JSON to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="Allowed relative growth before a metric counts as a regression")
+    parser.add_argument("--verbose", action="store_true", help="Show the assistant output")
+    args = parser.parse_args()
+
+    mode = "record" if args.record else "replay"
+    report = {}
+    for variant in args.variants:
+        cassette_path = os.path.abspath(os.path.join(args.cassette_dir, variant + ".json"))
+        turns = run_variant(variant, cassette_path, mode, args.latency_scale, args.verbose)
+        report[variant] = summarize(turns)
+
+    print_report(report)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = find_regressions(report, baseline, args.tolerance)
+        for regression in regressions:
+            print("REGRESSION", regression)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,491 @@
+"""
+Record/replay layer for the OpenAI and Google Maps calls made by the assistants.
+
+In record mode every chat completion (the OpenAI and AsyncOpenAI client paths and ChatOpenAI,
+which goes through the same clients) and every Google Maps GET request is captured into a
+cassette file together with its latency. In replay mode the cassette is served back
+deterministically, optionally with the recorded latencies scaled by a factor, so the
+applications can be run and compared offline.
+
+Usage (from the repository root):
+
+    python core/common/cassette.py record cassettes/basic.json core/basic/main.py --questions
+    python core/common/cassette.py replay cassettes/basic.json core/basic/main.py --questions --latency-scale 0
+
+"""
+
+import argparse
+import ast
+import asyncio
+import builtins
+import functools
+import hashlib
+import json
+import os
+import runpy
+import sys
+import time
+from collections import defaultdict, deque
+
+import requests
+from openai.resources.chat.completions import AsyncCompletions, Completions
+from openai.types.chat import ChatCompletion, ChatCompletionChunk
+
+CASSETTE_VERSION = 1
+MAPS_HOST = "maps.googleapis.com"
+
+## Request fields that do not change the response and must not be part of the key
+IGNORED_REQUEST_FIELDS = ("timeout", "extra_headers", "extra_query", "extra_body")
+
+
+class CassetteMissError(LookupError):
+    """
+    Raised in replay mode when a request has no recorded response left in the cassette.
+    """
+
+
+def _to_jsonable(value):
+    if hasattr(value, "model_dump"):
+        return _to_jsonable(value.model_dump(exclude_none=True))
+    if isinstance(value, dict):
+        return {str(k): _to_jsonable(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_to_jsonable(v) for v in value]
+    if isinstance(value, (str, int, float, bool)) or value is None:
+        return value
+    return repr(value)
+
+
+def request_key(kind, request):
+    """
+    Stable hash of a normalized request. Identical requests map to the same key.
+    """
+    payload = json.dumps([kind, _to_jsonable(request)], sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class _ReplayResponse:
+    """
+    Minimal stand-in for requests.Response, serving a recorded Maps response.
+    """
+
+    def __init__(self, status_code, body, url):
+        self.status_code = status_code
+        self.url = url
+        self._body = body
+
+    @property
+    def ok(self):
+        return self.status_code < 400
+
+    @property
+    def text(self):
+        return json.dumps(self._body)
+
+    def json(self):
+        return json.loads(json.dumps(self._body))
+
+    def raise_for_status(self):
+        if not self.ok:
+            raise requests.HTTPError(f"{self.status_code} error for url: {self.url}", response=self)
+
+
+class _RecordingStream:
+    """
+    Wraps a streaming response while recording. The chunks are stored once the stream is consumed.
+    """
+
+    def __init__(self, cassette, request, stream, start):
+        self._cassette = cassette
+        self._request = request
+        self._stream = stream
+        self._start = start
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self._stream.close()
+
+    def __iter__(self):
+        chunks, offsets = [], []
+        for chunk in self._stream:
+            chunks.append(chunk.model_dump(exclude_none=True))
+            offsets.append(time.perf_counter() - self._start)
+            yield chunk
+        self._cassette._store("llm", self._request, {"chunks": chunks, "offsets": offsets}, time.perf_counter() - self._start)
+
+
+class _AsyncRecordingStream(_RecordingStream):
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self._stream.close()
+
+    async def __aiter__(self):
+        chunks, offsets = [], []
+        async for chunk in self._stream:
+            chunks.append(chunk.model_dump(exclude_none=True))
+            offsets.append(time.perf_counter() - self._start)
+            yield chunk
+        self._cassette._store("llm", self._request, {"chunks": chunks, "offsets": offsets}, time.perf_counter() - self._start)
+
+
+class _ReplayStream:
+    """
+    Serves recorded stream chunks with the recorded inter-chunk timing, scaled.
+    """
+
+    def __init__(self, recorded, latency_scale):
+        self._chunks = recorded["chunks"]
+        self._offsets = recorded["offsets"]
+        self._latency_scale = latency_scale
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        pass
+
+    def close(self):
+        pass
+
+    def _delays(self):
+        previous = 0.0
+        for offset in self._offsets:
+            yield (offset - previous) * self._latency_scale
+            previous = offset
+
+    def __iter__(self):
+        for chunk, delay in zip(self._chunks, self._delays()):
+            time.sleep(delay)
+            yield ChatCompletionChunk.model_validate(chunk)
+
+    async def __aiter__(self):
+        for chunk, delay in zip(self._chunks, self._delays()):
+            await asyncio.sleep(delay)
+            yield ChatCompletionChunk.model_validate(chunk)
+
+
+class Cassette:
+    """
+    Patches the OpenAI chat completions endpoint, requests.get and requests.Session.get while installed.
+
+    Parameters:
+    path (str): Cassette file to write (record) or read (replay).
+    mode (str): "record" or "replay".
+    latency_scale (float): Replay only. Recorded latencies are multiplied by this factor
+        before sleeping, 0 disables the delays.
+    """
+
+    def __init__(self, path, mode="replay", latency_scale=1.0):
+        if mode not in ("record", "replay"):
+            raise ValueError(f"Unknown cassette mode {mode}")
+
+        self.path = path
+        self.mode = mode
+        self.latency_scale = latency_scale
+        self.interactions = []
+        ## Every served interaction, in call order. Used for statistics.
+        self.events = []
+        self._pending = defaultdict(deque)
+        self._originals = {}
+
+        if mode == "replay":
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("version") != CASSETTE_VERSION:
+                raise ValueError(f"Unsupported cassette version {data.get('version')} in {path}")
+            self.interactions = data["interactions"]
+            for interaction in self.interactions:
+                self._pending[interaction["key"]].append(interaction)
+
+    def __enter__(self):
+        self.install()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.uninstall()
+
+    def install(self):
+        cassette = self
+        original_create = Completions.create
+        original_acreate = AsyncCompletions.create
+        original_get = requests.get
+        original_session_get = requests.Session.get
+
+        def create(completions, *args, **kwargs):
+            return cassette._chat_completion(original_create, completions, *args, **kwargs)
+
+        async def acreate(completions, *args, **kwargs):
+            return await cassette._achat_completion(original_acreate, completions, *args, **kwargs)
+
+        def get(url, params=None, **kwargs):
+            if MAPS_HOST not in str(url):
+                return original_get(url, params=params, **kwargs)
+            return cassette._maps_get(original_get, url, params, **kwargs)
+
+        def session_get(session, url, params=None, **kwargs):
+            if MAPS_HOST not in str(url):
+                return original_session_get(session, url, params=params, **kwargs)
+            return cassette._maps_get(functools.partial(original_session_get, session), url, params, **kwargs)
+
+        self._originals = {"create": original_create, "acreate": original_acreate, "get": original_get, "session_get": original_session_get}
+        Completions.create = create
+        AsyncCompletions.create = acreate
+        requests.get = get
+        requests.Session.get = session_get
+
+    def uninstall(self):
+        if not self._originals:
+            return
+        Completions.create = self._originals["create"]
+        AsyncCompletions.create = self._originals["acreate"]
+        requests.get = self._originals["get"]
+        requests.Session.get = self._originals["session_get"]
+        self._originals = {}
+        if self.mode == "record":
+            self.save()
+
+    def save(self):
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        with open(self.path, "w", encoding="utf-8") as f:
+            json.dump({"version": CASSETTE_VERSION, "interactions": self.interactions}, f, indent=1)
+
+    def _store(self, kind, request, response, latency):
+        interaction = {
+            "kind": kind,
+            "key": request_key(kind, request),
+            "request": _to_jsonable(request),
+            "response": response,
+            "latency": latency,
+        }
+        self.interactions.append(interaction)
+        self.events.append(interaction)
+
+    def _take(self, kind, request):
+        key = request_key(kind, request)
+        if not self._pending[key]:
+            raise CassetteMissError(f"No recorded {kind} response for request {key[:12]} in {self.path}")
+
+        interaction = self._pending[key].popleft()
+        self.events.append(interaction)
+        return interaction
+
+    def _delay(self, interaction):
+        return interaction["latency"] * self.latency_scale
+
+    def _chat_completion(self, original_create, completions, *args, **kwargs):
+        request = {k: v for k, v in kwargs.items() if k not in IGNORED_REQUEST_FIELDS}
+
+        if self.mode == "record":
+            start = time.perf_counter()
+            response = original_create(completions, *args, **kwargs)
+            if kwargs.get("stream"):
+                return _RecordingStream(self, request, response, start)
+            self._store("llm", request, response.model_dump(exclude_none=True), time.perf_counter() - start)
+            return response
+
+        interaction = self._take("llm", request)
+        if "chunks" in interaction["response"]:
+            return _ReplayStream(interaction["response"], self.latency_scale)
+        time.sleep(self._delay(interaction))
+        return ChatCompletion.model_validate(interaction["response"])
+
+    async def _achat_completion(self, original_create, completions, *args, **kwargs):
+        request = {k: v for k, v in kwargs.items() if k not in IGNORED_REQUEST_FIELDS}
+
+        if self.mode == "record":
+            start = time.perf_counter()
+            response = await original_create(completions, *args, **kwargs)
+            if kwargs.get("stream"):
+                return _AsyncRecordingStream(self, request, response, start)
+            self._store("llm", request, response.model_dump(exclude_none=True), time.perf_counter() - start)
+            return response
+
+        interaction = self._take("llm", request)
+        if "chunks" in interaction["response"]:
+            return _ReplayStream(interaction["response"], self.latency_scale)
+        await asyncio.sleep(self._delay(interaction))
+        return ChatCompletion.model_validate(interaction["response"])
+
+    def _maps_get(self, original_get, url, params, **kwargs):
+        ## Never write the API key into the cassette
+        request = {"url": url, "params": {k: v for k, v in (params or {}).items() if k != "key"}}
+
+        if self.mode == "record":
+            start = time.perf_counter()
+            response = original_get(url, params=params, **kwargs)
+            recorded = {"status_code": response.status_code, "body": response.json()}
+            self._store("maps", request, recorded, time.perf_counter() - start)
+            return response
+
+        interaction = self._take("maps", request)
+        time.sleep(self._delay(interaction))
+        recorded = interaction["response"]
+        return _ReplayResponse(recorded["status_code"], recorded["body"], url)
+
+
+def load_questions(script):
+    """
+    Read the `questions` list of a main.py without executing the script.
+    """
+    with open(script, "r", encoding="utf-8") as f:
+        tree = ast.parse(f.read(), filename=script)
+
+    for node in tree.body:
+        if isinstance(node, ast.Assign) and any(
+            isinstance(t, ast.Name) and t.id == "questions" for t in node.targets
+        ):
+            return ast.literal_eval(node.value)
+
+    raise ValueError(f"No questions list found in {script}")
+
+
+def response_tool_calls(response):
+    """
+    Name and JSON arguments of every tool call in a recorded response, streamed or not.
+    """
+    calls = {}
+    if "chunks" in response:
+        ## Streamed response: the name and the arguments of a call are spread over the deltas
+        for chunk in response["chunks"]:
+            for choice in chunk.get("choices", []):
+                for call in choice.get("delta", {}).get("tool_calls") or []:
+                    entry = calls.setdefault((choice.get("index", 0), call.get("index", 0)), {"name": "", "arguments": ""})
+                    function = call.get("function") or {}
+                    entry["name"] += function.get("name") or ""
+                    entry["arguments"] += function.get("arguments") or ""
+    else:
+        for choice in response.get("choices", []):
+            for index, call in enumerate(choice.get("message", {}).get("tool_calls") or []):
+                function = call.get("function") or {}
+                calls[(choice.get("index", 0), index)] = {"name": function.get("name", ""), "arguments": function.get("arguments") or ""}
+    return [calls[key] for key in sorted(calls)]
+
+
+def summarize_turn(events, wall_time):
+    """
+    Aggregate the interactions of one user turn into benchmark statistics.
+    """
+    llm_events = [e for e in events if e["kind"] == "llm"]
+    tools = []
+    prompt_tokens = 0
+    completion_tokens = 0
+    cached_tokens = 0
+
+    for event in llm_events:
+        response = event["response"]
+        tools.extend(response_tool_calls(response))
+        if "chunks" in response:
+            ## Streamed response: usage comes with the last chunk
+            usage = {}
+            for chunk in response["chunks"]:
+                usage = chunk.get("usage") or usage
+        else:
+            usage = response.get("usage") or {}
+        prompt_tokens += usage.get("prompt_tokens", 0)
+        completion_tokens += usage.get("completion_tokens", 0)
+        cached_tokens += (usage.get("prompt_tokens_details") or {}).get("cached_tokens") or 0
+
+    return {
+        "wall_time": wall_time,
+        "llm_calls": len(llm_events),
+        "maps_calls": len(events) - len(llm_events),
+        "tool_calls": len(tools),
+        "tools": tools,
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "cached_tokens": cached_tokens,
+    }
+
+
+def run_script(cassette, script, questions=None):
+    """
+    Run a main.py under the cassette and return per-turn statistics.
+
+    Parameters:
+    cassette (Cassette): Cassette that serves or records the calls.
+    script (str): Path to the main.py of a variant.
+    questions (list): User inputs to feed to input(). If None, input() stays interactive.
+
+    Returns:
+    list: One statistics dict per user turn.
+    """
+    script = os.path.abspath(script)
+    turns = []
+    state = {"start": None, "first_event": 0}
+    scripted = deque(questions) if questions is not None else None
+    original_input = builtins.input
+
+    def close_turn():
+        if state["start"] is None:
+            return
+        wall_time = time.perf_counter() - state["start"]
+        turns.append(summarize_turn(cassette.events[state["first_event"]:], wall_time))
+        state["start"] = None
+
+    def scripted_input(prompt=""):
+        close_turn()
+        if scripted is None:
+            user_query = original_input(prompt)
+        elif scripted:
+            user_query = scripted.popleft()
+            print(f"{prompt}{user_query}")
+        else:
+            raise EOFError
+        state["start"] = time.perf_counter()
+        state["first_event"] = len(cassette.events)
+        return user_query
+
+    ## Replayed clients never reach the API, but they refuse to start without a key
+    if cassette.mode == "replay":
+        os.environ.setdefault("OPENAI_API_KEY", "cassette-replay")
+
+    sys.path.insert(0, os.path.dirname(script))
+    sys.argv = [script]
+    builtins.input = scripted_input
+    try:
+        with cassette:
+            runpy.run_path(script, run_name="__main__")
+    except (EOFError, KeyboardInterrupt):
+        close_turn()
+    finally:
+        builtins.input = original_input
+
+    return turns
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run an assistant with recorded or replayed API calls.")
+    parser.add_argument("mode", choices=["record", "replay"])
+    parser.add_argument("cassette", help="Cassette file")
+    parser.add_argument("script", help="main.py of the variant to run")
+    parser.add_argument("--questions", action="store_true", help="Feed the questions list of the script instead of reading stdin")
+    parser.add_argument("--latency-scale", type=float, default=1.0, help="Replay latency multiplier, 0 for no delays")
+    parser.add_argument("--stats", help="Write per-turn statistics to this JSON file")
+    args = parser.parse_args()
+
+    cassette = Cassette(args.cassette, args.mode, args.latency_scale)
+    questions = load_questions(args.script) if args.questions else None
+    turns = run_script(cassette, args.script, questions)
+
+    if args.stats:
+        with open(args.stats, "w", encoding="utf-8") as f:
+            json.dump(turns, f)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,191 @@
+"""
+Compiled, memory-mapped tables for the road network and the transit feed.
+
+Parsing an edge list or a GTFS feed takes seconds and leaves a private copy of every array
+in each process. compile writes the arrays of a RoadNetwork or a TransitFeed once into a
+binary file, and the tools open that file instead: the arrays are NumPy views on a
+read-only memory map, so opening takes milliseconds and every process on the machine reads
+the same pages of the OS page cache. A road network is compiled with the contraction
+hierarchies of its modes, which take minutes to build for a city.
+
+The file layout, all little-endian:
+
+    magic (8 bytes) | format version (uint32) | header length (uint32) | header (JSON)
+    | arrays, each at an offset aligned to 64 bytes
+
+The header holds the kind of data ("roads" or "transit"), the dtype, shape and offset of
+every array, and metadata. A string table is two arrays: the UTF-8 bytes of all strings
+and the int64 offsets of each string in them. Files of another format version are refused
+and have to be compiled again.
+
+Usage (from the repository root):
+
+    python core/common/compiled_tables.py roads edges.csv roads.bin
+    python core/common/compiled_tables.py transit gtfs.zip transit.bin
+
+"""
+
+import argparse
+import json
+import mmap
+import os
+import struct
+import sys
+import time
+from collections.abc import Sequence
+
+import numpy as np
+
+MAGIC = b"TRVLTBLS"
+## Bump when the layout of the file or of the arrays of a kind changes
+FORMAT_VERSION = 1
+ALIGNMENT = 64
+
+_PREAMBLE = struct.Struct("<8sII")
+
+
+class StringTable(Sequence):
+    """
+    Read-only list of str stored as UTF-8 bytes and offsets. Strings are decoded on access.
+    """
+
+    def __init__(self, offsets, data):
+        self.offsets = offsets
+        self.data = data
+
+    @classmethod
+    def from_strings(cls, strings):
+        encoded = [str(string).encode("utf-8") for string in strings]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(string) for string in encoded], out=offsets[1:])
+        return cls(offsets, np.frombuffer(b"".join(encoded), dtype=np.uint8))
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("string table index out of range")
+        return str(memoryview(self.data)[self.offsets[index]:self.offsets[index + 1]], "utf-8")
+
+    def __iter__(self):
+        data, offsets = memoryview(self.data), self.offsets.tolist()
+        for start, end in zip(offsets, offsets[1:]):
+            yield str(data[start:end], "utf-8")
+
+
+def _aligned(offset):
+    return -(-offset // ALIGNMENT) * ALIGNMENT
+
+
+def write_tables(path, kind, arrays, strings=None, meta=None):
+    """
+    Write arrays and string tables into a compiled file. The file is replaced atomically,
+    so processes that have the old file open keep reading it.
+
+    Parameters:
+    path (str): Compiled file.
+    kind (str): What the file holds, checked by read_tables.
+    arrays (dict): Name -> ndarray.
+    strings (dict): Name -> list of str.
+    meta (dict): JSON-serializable metadata.
+    """
+    columns = {name: np.ascontiguousarray(array) for name, array in arrays.items()}
+    for name, values in (strings or {}).items():
+        table = values if isinstance(values, StringTable) else StringTable.from_strings(values)
+        columns[f"{name}.offsets"], columns[f"{name}.data"] = table.offsets, table.data
+
+    layout, offset = {}, 0
+    for name, array in columns.items():
+        ## Explicit little-endian dtypes, so the file reads the same on every machine
+        array = columns[name] = array.astype(array.dtype.newbyteorder("<"), copy=False)
+        layout[name] = {"dtype": array.dtype.str, "shape": list(array.shape), "offset": offset}
+        offset = _aligned(offset + array.nbytes)
+    header = json.dumps({
+        "kind": kind,
+        "arrays": layout,
+        "strings": sorted(strings or {}),
+        "meta": meta or {},
+    }).encode("utf-8")
+    data_start = _aligned(_PREAMBLE.size + len(header))
+
+    temporary = f"{path}.tmp{os.getpid()}"
+    with open(temporary, "wb") as f:
+        f.write(_PREAMBLE.pack(MAGIC, FORMAT_VERSION, len(header)))
+        f.write(header)
+        for name, array in columns.items():
+            f.seek(data_start + layout[name]["offset"])
+            f.write(array.tobytes())
+        f.truncate(data_start + offset)
+    os.replace(temporary, path)
+
+
+def is_compiled(path):
+    """
+    Whether path is a compiled file, of any format version.
+    """
+    if not os.path.isfile(path):
+        return False
+    with open(path, "rb") as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+def read_tables(path, kind):
+    """
+    Open a compiled file without copying it.
+
+    Returns:
+    tuple: (arrays, strings, meta). Arrays are read-only views on the memory map, strings
+        are StringTables.
+    """
+    with open(path, "rb") as f:
+        buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    magic, version, header_length = _PREAMBLE.unpack_from(buffer)
+    if magic != MAGIC:
+        raise ValueError(f"{path} is not a compiled table file.")
+    if version != FORMAT_VERSION:
+        raise ValueError(f"{path} has format version {version}, this code reads version {FORMAT_VERSION}. Compile it again.")
+    header = json.loads(buffer[_PREAMBLE.size:_PREAMBLE.size + header_length].decode("utf-8"))
+    if header["kind"] != kind:
+        raise ValueError(f"{path} holds {header['kind']} tables, not {kind}.")
+
+    data_start = _aligned(_PREAMBLE.size + header_length)
+    arrays = {}
+    for name, spec in header["arrays"].items():
+        dtype = np.dtype(spec["dtype"])
+        count = int(np.prod(spec["shape"], dtype=np.int64))
+        arrays[name] = np.frombuffer(buffer, dtype=dtype, count=count, offset=data_start + spec["offset"]).reshape(spec["shape"])
+    strings = {name: StringTable(arrays.pop(f"{name}.offsets"), arrays.pop(f"{name}.data")) for name in header["strings"]}
+    return arrays, strings, header["meta"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compile a road edge list or a GTFS feed into a memory-mapped table file.")
+    parser.add_argument("kind", choices=["roads", "transit"])
+    parser.add_argument("source", help="edge list CSV, or GTFS zip file or directory")
+    parser.add_argument("output", help="compiled file to write")
+    args = parser.parse_args()
+
+    ## Shared modules live in core/common, which is not on the path when this file runs as a script
+    sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from common.road_network import RoadNetwork
+    from common.transit import TransitFeed
+
+    start = time.perf_counter()
+    data = RoadNetwork.from_csv(args.source) if args.kind == "roads" else TransitFeed.from_gtfs(args.source)
+    parsed = time.perf_counter()
+    print(f"Parsed {args.source} in {parsed - start:.1f} s")
+    if args.kind == "roads":
+        data.contract()
+        print(f"Contracted the network for {', '.join(data.hierarchies)} in {time.perf_counter() - parsed:.1f} s")
+    built = time.perf_counter()
+    data.save(args.output)
+    print(f"Wrote {args.output} ({os.path.getsize(args.output) / 2**20:.1f} MB) in {time.perf_counter() - built:.1f} s")
+
+
+if __name__ == "__main__":
+    main()
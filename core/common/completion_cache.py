@@ -0,0 +1,288 @@
+"""
+Content-addressed on-disk cache for chat completions.
+
+A completion is stored under a stable hash of everything that determines it: the model and
+sampling parameters, the system prompt, the normalized conversation and the tool schemas.
+Tool call ids are generated by the API and differ between sessions, so they are replaced by
+their position in the conversation before hashing. Served responses get fresh tool call ids
+so that a cached response can appear twice in one conversation.
+
+The cache is opt-in: get_completion_cache() returns None unless COMPLETION_CACHE_DIR is set.
+The OpenAI client paths use chat_completion(); the ChatOpenAI runnables use the LangChain
+adapter in langchain_cache.py. Both share the same directory, size bound and metrics, and
+unless an agent opts in, both bypass the cache for completions sampled with a temperature
+above 0.
+
+"""
+
+import hashlib
+import json
+import os
+import threading
+import uuid
+
+from openai.types.chat import ChatCompletion
+
+DEFAULT_MAX_MB = 200
+
+## Request fields that do not change the completion
+IGNORED_REQUEST_FIELDS = ("stream", "stream_options", "timeout", "extra_headers", "extra_query", "extra_body", "user")
+
+
+def _jsonable(value):
+    if hasattr(value, "model_dump"):
+        return value.model_dump(exclude_none=True)
+    return value
+
+
+def normalize_messages(messages):
+    """
+    Canonical form of OpenAI chat messages for hashing.
+    Tool call ids are replaced by their order of appearance.
+    """
+    ids = {}
+
+    def ordinal(call_id):
+        return ids.setdefault(call_id, f"call_{len(ids)}")
+
+    normalized = []
+    for message in messages:
+        message = _jsonable(message)
+        entry = {"role": message.get("role"), "content": message.get("content") or ""}
+        if message.get("name"):
+            entry["name"] = message["name"]
+        if message.get("tool_calls"):
+            entry["tool_calls"] = [
+                {
+                    "id": ordinal(_jsonable(call)["id"]),
+                    "name": _jsonable(call)["function"]["name"],
+                    "arguments": _jsonable(call)["function"]["arguments"],
+                }
+                for call in message["tool_calls"]
+            ]
+        if message.get("tool_call_id"):
+            entry["tool_call_id"] = ordinal(message["tool_call_id"])
+        normalized.append(entry)
+    return normalized
+
+
+def hash_payload(payload):
+    canonical = json.dumps(payload, sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=str)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def request_key(request):
+    """
+    Stable key of a chat.completions.create request.
+    """
+    payload = {k: _jsonable(v) for k, v in request.items() if k not in IGNORED_REQUEST_FIELDS and v is not None}
+    payload["messages"] = normalize_messages(request.get("messages", []))
+    return hash_payload(payload)
+
+
+def fresh_tool_call_ids(response):
+    """
+    Give every tool call of a cached ChatCompletion dict a new id.
+    """
+    for choice in response.get("choices", []):
+        for call in choice.get("message", {}).get("tool_calls") or []:
+            call["id"] = "call_" + uuid.uuid4().hex[:24]
+    return response
+
+
+class CompletionCache:
+    """
+    Size-bounded store of JSON values addressed by content hash.
+
+    Parameters:
+    directory (str): Cache directory. Can be shared between processes.
+    max_bytes (int): When the files exceed this size, the least recently used ones are removed.
+    """
+
+    def __init__(self, directory, max_bytes=DEFAULT_MAX_MB * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.bypassed = 0
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self._size = sum(size for _, size, _ in self._entries())
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], key + ".json")
+
+    def _entries(self):
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if name.endswith(".json"):
+                    path = os.path.join(root, name)
+                    try:
+                        stat = os.stat(path)
+                    except FileNotFoundError:
+                        continue
+                    yield path, stat.st_size, stat.st_mtime
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                value = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            with self._lock:
+                self.misses += 1
+            return None
+
+        ## The modification time doubles as last access time for eviction
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            pass
+        with self._lock:
+            self.hits += 1
+        return value
+
+    def put(self, key, value):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        data = json.dumps(value).encode("utf-8")
+
+        ## Write to a temporary file first so that readers never see a partial entry
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        ## A replaced entry no longer counts towards the size
+        try:
+            replaced = os.stat(path).st_size
+        except FileNotFoundError:
+            replaced = 0
+        os.replace(tmp_path, path)
+
+        with self._lock:
+            self._size += len(data) - replaced
+            over_budget = self._size > self.max_bytes
+        if over_budget:
+            self._evict()
+
+    def _evict(self):
+        entries = sorted(self._entries(), key=lambda entry: entry[2])
+        size = sum(entry[1] for entry in entries)
+        target = self.max_bytes * 0.9
+        for path, entry_size, _ in entries:
+            if size <= target:
+                break
+            try:
+                os.remove(path)
+                size -= entry_size
+            except FileNotFoundError:
+                pass
+        with self._lock:
+            self._size = size
+
+    def clear(self):
+        for path, _, _ in list(self._entries()):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+        with self._lock:
+            self._size = 0
+
+    def bypass(self):
+        with self._lock:
+            self.bypassed += 1
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "bypassed": self.bypassed,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "bytes": self._size,
+        }
+
+    def create(self, client, **kwargs):
+        """
+        Cached client.chat.completions.create.
+        """
+        key = request_key(kwargs)
+        cached = self.get(key)
+        if cached is not None:
+            return ChatCompletion.model_validate(fresh_tool_call_ids(cached))
+
+        response = client.chat.completions.create(**kwargs)
+        self.put(key, response.model_dump(exclude_none=True))
+        return response
+
+    async def acreate(self, client, **kwargs):
+        """
+        Cached chat.completions.create for the async client.
+        """
+        key = request_key(kwargs)
+        cached = self.get(key)
+        if cached is not None:
+            return ChatCompletion.model_validate(fresh_tool_call_ids(cached))
+
+        response = await client.chat.completions.create(**kwargs)
+        self.put(key, response.model_dump(exclude_none=True))
+        return response
+
+
+_shared_cache = None
+_shared_cache_lock = threading.Lock()
+
+
+def get_completion_cache():
+    """
+    The process-wide completion cache, or None when COMPLETION_CACHE_DIR is not set.
+    COMPLETION_CACHE_MAX_MB bounds its size on disk.
+    """
+    global _shared_cache
+    directory = os.getenv("COMPLETION_CACHE_DIR")
+    if not directory:
+        return None
+
+    with _shared_cache_lock:
+        if _shared_cache is None:
+            max_mb = float(os.getenv("COMPLETION_CACHE_MAX_MB", DEFAULT_MAX_MB))
+            _shared_cache = CompletionCache(directory, int(max_mb * 1024 * 1024))
+    return _shared_cache
+
+
+def is_sampled(kwargs):
+    """
+    Whether a request samples with a temperature above 0, the API's default of 1 when unset.
+    A sampled completion must not be replayed as the answer.
+    """
+    return kwargs.get("temperature", 1) > 0
+
+
+def chat_completion(client, cache, use_cache=None, **kwargs):
+    """
+    client.chat.completions.create through the cache.
+    cache=None calls the API directly. use_cache=False bypasses the cache for this call and
+    use_cache=True uses it. By default, sampling with a temperature above 0 bypasses it.
+    """
+    if cache is None:
+        return client.chat.completions.create(**kwargs)
+    if use_cache is None:
+        use_cache = not is_sampled(kwargs)
+    if not use_cache:
+        cache.bypass()
+        return client.chat.completions.create(**kwargs)
+    return cache.create(client, **kwargs)
+
+
+async def achat_completion(client, cache, use_cache=None, **kwargs):
+    """
+    Async version of chat_completion.
+    """
+    if cache is None:
+        return await client.chat.completions.create(**kwargs)
+    if use_cache is None:
+        use_cache = not is_sampled(kwargs)
+    if not use_cache:
+        cache.bypass()
+        return await client.chat.completions.create(**kwargs)
+    return await cache.acreate(client, **kwargs)
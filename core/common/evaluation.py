@@ -0,0 +1,374 @@
+"""
+Batch evaluation of the assistant variants on a dataset of conversations.
+
+Runs every conversation of a JSONL dataset through the main.py of each variant, many
+sessions at a time on a process pool, and scores every user turn: whether the expected
+tools were called with the expected arguments, the wall time, the LLM round-trips and the
+tokens. The report compares the variants side by side, and against an older report to
+catch regressions before a prompt or architecture change ships.
+
+A dataset holds one conversation per line:
+
+    {"id": "commute", "turns": [
+        {"user": "How long does it take to drive from Sunnyvale to Mountain View?",
+         "tools": [{"name": "compute_travel_duration", "arguments": {"origin": "Sunnyvale", "mode_of_travel": "driving"}}]},
+        {"user": "Can you recommend a good place to dine?", "tools": []}]}
+
+"tools" lists the calls the turn has to make. Only the arguments given are checked, places
+are compared through the gazetteer so "Mtn View" matches "Mountain View, CA, USA". An empty
+list means no tool may be called, and a turn without "tools" is measured but not scored.
+Calls that only hand the query to another agent (transfer_* tools) are not scored unless
+they are listed, so the same dataset serves all four variants.
+
+The LLM is one of:
+
+    stand-in  the deterministic local stand-in of stand_in_llm.py, offline and free
+    replay    cassettes recorded per conversation, CASSETTE_DIR/<variant>/<conversation id>.json
+    live      the OpenAI API. --record-dir keeps the cassettes for later replays.
+
+Every worker process serves one variant, because the variants share module names, and has
+its own checkpoint database. The completion cache is disabled, its answers would not show
+which tools were called.
+
+Usage (from the repository root):
+
+    python core/common/evaluation.py --llm stand-in --workers 8 --output report.json
+    python core/common/evaluation.py dataset.jsonl --llm live --record-dir cassettes/evaluation
+    python core/common/evaluation.py dataset.jsonl --llm replay --cassette-dir cassettes/evaluation --baseline report.json
+
+"""
+
+import argparse
+import concurrent.futures
+import json
+import math
+import multiprocessing
+import os
+import re
+import sys
+import tempfile
+
+## Shared modules live in core/common, which is not on the path when this file runs as a script
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from common.benchmark import CORE_DIR, VARIANTS, find_regressions, summarize
+from common.gazetteer import Gazetteer, normalize_name
+
+DEFAULT_DATASET_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "conversations.jsonl")
+LLM_MODES = ["stand-in", "replay", "live"]
+
+## Scores compared against the baseline. Smaller is worse for both.
+QUALITY_METRICS = ["tool_accuracy", "argument_accuracy"]
+
+## Set by _init_worker in every worker process
+_worker = {}
+
+
+def load_dataset(path):
+    """
+    Read the conversations of a JSONL dataset.
+    """
+    conversations = []
+    with open(path, "r", encoding="utf-8") as f:
+        for number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            conversation = json.loads(line)
+            if not conversation.get("turns"):
+                raise ValueError(f"{path}:{number}: conversation without turns")
+            conversation.setdefault("id", f"conversation-{number}")
+            conversations.append(conversation)
+    return conversations
+
+
+def cassette_path(directory, variant, conversation_id):
+    return os.path.join(directory, variant, re.sub(r"[^\w.-]", "_", str(conversation_id)) + ".json")
+
+
+def _init_worker(variant, llm, options):
+    ## Sessions must not contend on one SQLite file, nor add to the checkpoints of real sessions
+    os.environ["CHECKPOINT_PATH"] = os.path.join(options["scratch_dir"], f"checkpoints-{os.getpid()}.sqlite3")
+    os.environ.pop("COMPLETION_CACHE_DIR", None)
+    ## Nor read travel durations and aliases cached by earlier runs, nor teach the user's gazetteer evaluation aliases
+    os.environ["TRAVEL_CACHE_PATH"] = os.path.join(options["scratch_dir"], "travel_durations.sqlite3")
+    os.environ["GAZETTEER_PATH"] = os.path.join(options["scratch_dir"], "places_learned.csv")
+    ## Evaluation turns are no training data for the intent router
+    os.environ.pop("INTENT_LOG_PATH", None)
+    if llm == "stand-in":
+        os.environ.setdefault("OPENAI_API_KEY", "stand-in")
+    if not options["verbose"]:
+        sys.stdout = open(os.devnull, "w")
+
+    os.chdir(os.path.join(CORE_DIR, variant))
+    _worker.update(variant=variant, llm=llm, **options)
+
+
+def _run_session(conversation):
+    """
+    Run one conversation in the variant of this worker.
+
+    Returns:
+    dict: The conversation id, the per-turn statistics and the error that ended the session early, if any.
+    """
+    from common.cassette import Cassette, run_script
+    from common.stand_in_llm import StandInLLM
+
+    variant, llm = _worker["variant"], _worker["llm"]
+    script = os.path.join(CORE_DIR, variant, "main.py")
+    questions = [turn["user"] for turn in conversation["turns"]]
+
+    try:
+        if llm == "replay":
+            cassette = Cassette(cassette_path(_worker["cassette_dir"], variant, conversation["id"]), "replay", _worker["latency_scale"])
+        elif _worker["record_dir"]:
+            cassette = Cassette(cassette_path(_worker["record_dir"], variant, conversation["id"]), "record")
+        else:
+            cassette = Cassette(os.path.join(_worker["scratch_dir"], f"cassette-{os.getpid()}.json"), "record")
+
+        if llm == "stand-in":
+            with StandInLLM(_worker["stand_in_latency"]):
+                turns = run_script(cassette, script, questions)
+        else:
+            turns = run_script(cassette, script, questions)
+        return {"id": conversation["id"], "turns": turns, "error": None}
+    except Exception as e:
+        return {"id": conversation["id"], "turns": [], "error": f"{type(e).__name__}: {e}"}
+
+
+def run_variant(variant, conversations, llm, workers, options):
+    """
+    Run all conversations through one variant on a pool of worker processes.
+
+    Returns:
+    list: One session result per conversation, in dataset order.
+    """
+    with tempfile.TemporaryDirectory() as scratch_dir:
+        with concurrent.futures.ProcessPoolExecutor(
+            max_workers=workers,
+            ## A fresh interpreter per worker, the variants cannot share one
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(variant, llm, {**options, "scratch_dir": scratch_dir}),
+        ) as executor:
+            return list(executor.map(_run_session, conversations))
+
+
+def is_routing(name):
+    """
+    Whether a tool only hands the query to another agent.
+    """
+    return name.startswith("transfer_")
+
+
+def values_match(expected, actual, gazetteer):
+    """
+    Whether an argument has the expected value. Places and routes are compared by the
+    places they resolve to.
+    """
+    if actual is None:
+        return False
+    expected, actual = str(expected), str(actual)
+    if normalize_name(expected) == normalize_name(actual):
+        return True
+    return normalize_name(gazetteer.canonicalize_route(expected)) == normalize_name(gazetteer.canonicalize_route(actual))
+
+
+def _arguments(call):
+    try:
+        arguments = json.loads(call["arguments"] or "{}")
+    except json.JSONDecodeError:
+        return {}
+    return arguments if isinstance(arguments, dict) else {}
+
+
+def score_turn(expected, calls, gazetteer):
+    """
+    Compare the tool calls of a turn with the expected ones.
+
+    Parameters:
+    expected (list): Expected calls, dicts with a name and optional arguments.
+    calls (list): Calls made, dicts with a name and JSON arguments.
+    gazetteer (Gazetteer): Resolves the places in arguments.
+
+    Returns:
+    dict: tools_correct when every expected tool and no other was called, arguments_correct
+        when in addition every expected call had the expected arguments, and the names of
+        the missing and unexpected tools.
+    """
+    expected_names = {call["name"] for call in expected}
+    remaining = [call for call in calls if call["name"] in expected_names or not is_routing(call["name"])]
+    missing = []
+    arguments_correct = True
+
+    for expected_call in expected:
+        candidates = [call for call in remaining if call["name"] == expected_call["name"]]
+        if not candidates:
+            missing.append(expected_call["name"])
+            continue
+        wanted = expected_call.get("arguments") or {}
+        match = next(
+            (call for call in candidates if all(values_match(value, _arguments(call).get(name), gazetteer) for name, value in wanted.items())),
+            None,
+        )
+        if match is None:
+            arguments_correct, match = False, candidates[0]
+        remaining.remove(match)
+
+    ## Repeated calls of an expected tool, e.g. after a rejected call, are not unexpected
+    unexpected = [call["name"] for call in remaining if call["name"] not in expected_names]
+    tools_correct = not missing and not unexpected
+    return {
+        "tools_correct": tools_correct,
+        "arguments_correct": tools_correct and arguments_correct,
+        "missing": missing,
+        "unexpected": unexpected,
+    }
+
+
+def percentile(values, fraction):
+    """
+    Nearest-rank percentile, 0.0 for no values.
+    """
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, math.ceil(fraction * len(ordered)) - 1))]
+
+
+def evaluate_variant(conversations, sessions, gazetteer):
+    """
+    Score the sessions of one variant.
+
+    Returns:
+    tuple: (summary, failures). failures lists the scored turns that were not fully correct
+        and the sessions that ended with an error.
+    """
+    turns, failures = [], []
+    scored = tools_correct = arguments_correct = 0
+
+    for conversation, session in zip(conversations, sessions):
+        if session["error"]:
+            failures.append({"conversation": conversation["id"], "error": session["error"]})
+        turns.extend(session["turns"])
+
+        for index, expected_turn in enumerate(conversation["turns"]):
+            if "tools" not in expected_turn:
+                continue
+            scored += 1
+            ## Turns a failed session never reached count as wrong
+            if index >= len(session["turns"]):
+                continue
+            calls = session["turns"][index]["tools"]
+            score = score_turn(expected_turn["tools"], calls, gazetteer)
+            tools_correct += score["tools_correct"]
+            arguments_correct += score["arguments_correct"]
+            if not score["arguments_correct"]:
+                failures.append({
+                    "conversation": conversation["id"],
+                    "turn": index,
+                    "user": expected_turn["user"],
+                    "expected": expected_turn["tools"],
+                    "called": calls,
+                    "missing": score["missing"],
+                    "unexpected": score["unexpected"],
+                })
+
+    summary = summarize(turns)
+    wall_times = [turn["wall_time"] for turn in turns]
+    summary.update({
+        "sessions": len(sessions),
+        "failed_sessions": sum(1 for session in sessions if session["error"]),
+        "p95_wall_time": percentile(wall_times, 0.95),
+        "scored_turns": scored,
+        "tool_accuracy": tools_correct / scored if scored else 0.0,
+        "argument_accuracy": arguments_correct / scored if scored else 0.0,
+    })
+    return summary, failures
+
+
+def print_report(summaries):
+    header = (
+        f"{'variant':<24}{'sessions':>9}{'failed':>7}{'turns':>7}{'tools %':>9}{'args %':>8}"
+        f"{'p50 s':>8}{'p95 s':>8}{'LLM/turn':>10}{'tokens/turn':>12}"
+    )
+    print(header)
+    print("-" * len(header))
+    for variant, s in summaries.items():
+        print(
+            f"{variant:<24}{s['sessions']:>9}{s['failed_sessions']:>7}{s['turns']:>7}"
+            f"{100 * s['tool_accuracy']:>9.1f}{100 * s['argument_accuracy']:>8.1f}"
+            f"{s['p50_wall_time']:>8.2f}{s['p95_wall_time']:>8.2f}{s['llm_calls']:>10.2f}{s['total_tokens']:>12.0f}"
+        )
+
+
+def find_quality_regressions(summaries, baseline, tolerance):
+    """
+    Returns:
+    list: Human readable descriptions of every score that dropped by more than the tolerance.
+    """
+    regressions = []
+    for variant, summary in summaries.items():
+        if variant not in baseline:
+            continue
+        for metric in QUALITY_METRICS:
+            old, new = baseline[variant][metric], summary[metric]
+            if new < old * (1 - tolerance) and old - new > 1e-9:
+                regressions.append(f"{variant}: {metric} {old:.3f} -> {new:.3f}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Evaluate the assistant variants on a dataset of conversations.")
+    parser.add_argument("dataset", nargs="?", default=DEFAULT_DATASET_PATH, help="JSONL file of conversations")
+    parser.add_argument("--variants", nargs="+", default=VARIANTS, choices=VARIANTS)
+    parser.add_argument("--llm", choices=LLM_MODES, default="stand-in")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="Sessions run at the same time per variant")
+    parser.add_argument("--cassette-dir", default="cassettes/evaluation", help="Replay: directory of the recorded cassettes")
+    parser.add_argument("--record-dir", help="Stand-in and live: keep the cassettes of every session in this directory")
+    parser.add_argument("--latency-scale", type=float, default=1.0, help="Replay latency multiplier, 0 for no delays")
+    parser.add_argument("--stand-in-latency", type=float, default=0.0, help="Seconds every stand-in completion takes")
+    parser.add_argument("--output", help="Write the report to this JSON file")
+    parser.add_argument("--baseline", help="Report JSON to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="Allowed relative change before a metric counts as a regression")
+    parser.add_argument("--verbose", action="store_true", help="Show the assistant output")
+    args = parser.parse_args()
+
+    conversations = load_dataset(args.dataset)
+    options = {
+        "cassette_dir": os.path.abspath(args.cassette_dir),
+        "record_dir": os.path.abspath(args.record_dir) if args.record_dir else None,
+        "latency_scale": args.latency_scale,
+        "stand_in_latency": args.stand_in_latency,
+        "verbose": args.verbose,
+    }
+    ## Learned aliases make place comparisons depend on the machine, the bundled places do not
+    gazetteer = Gazetteer()
+    gazetteer.load_csv(os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "places.csv"))
+
+    summaries, failures = {}, {}
+    for variant in args.variants:
+        sessions = run_variant(variant, conversations, args.llm, args.workers, options)
+        summaries[variant], failures[variant] = evaluate_variant(conversations, sessions, gazetteer)
+
+    print_report(summaries)
+    for variant, variant_failures in failures.items():
+        for failure in variant_failures:
+            if "error" in failure:
+                print(f"ERROR {variant} {failure['conversation']}: {failure['error']}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"llm": args.llm, "dataset": args.dataset, "summary": summaries, "failures": failures}, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)["summary"]
+        regressions = find_regressions(summaries, baseline, args.tolerance) + find_quality_regressions(summaries, baseline, args.tolerance)
+        for regression in regressions:
+            print("REGRESSION", regression)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
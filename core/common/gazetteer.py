@@ -0,0 +1,258 @@
+"""
+Local gazetteer that maps free-text place names onto canonical places.
+
+The LLM passes places to the tools as it read them from the conversation: "Eureka, Mountain
+View", "mountain view caltrain", "Mtn View". Spelled differently, the same place misses the
+travel duration cache and costs another Maps lookup. The gazetteer normalizes a name and
+looks it up in a character trie of known names and aliases, so an exact lookup takes time
+proportional to the length of the name. Names that are not found are looked up with the
+words in sorted order, and then in the trie with a bounded number of typos.
+
+Places, their coordinates and aliases come from a bundled CSV (data/places.csv). The
+addresses the Maps API resolves a query to are learned as new aliases and appended to a
+second CSV, so they are known after a restart. GAZETTEER_PATH relocates that file.
+
+Usage (from the repository root):
+
+    python core/common/gazetteer.py "mountain veiw caltrain"
+
+"""
+
+import csv
+import os
+import re
+import sys
+import threading
+
+BUNDLED_PLACES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "places.csv")
+DEFAULT_LEARNED_PATH = os.path.join(os.path.expanduser("~"), ".cache", "ai_travel_assistant", "places_learned.csv")
+
+## Word forms that are spelled out before lookup
+ABBREVIATIONS = {
+    "mtn": "mountain", "mt": "mount", "stn": "station", "ave": "avenue", "blvd": "boulevard",
+    "rd": "road", "univ": "university", "intl": "international", "ctr": "center", "sq": "square",
+}
+
+## Trailing words that do not tell places of the Bay Area apart
+REGION_SUFFIXES = {"usa", "us", "ca", "california"}
+
+## Key of the place id in a trie node. Never a character of a normalized name.
+_PLACE = ""
+
+
+def normalize_name(name):
+    """
+    Lowercase, drop punctuation, spell out abbreviations and drop trailing state, country and zip.
+    """
+    text = str(name).lower().replace("&", " and ")
+    words = [ABBREVIATIONS.get(word, word) for word in re.findall(r"[a-z0-9]+", text)]
+    if words and words[0] == "the":
+        words = words[1:]
+    while len(words) > 1 and (words[-1] in REGION_SUFFIXES or re.fullmatch(r"\d{5}", words[-1])):
+        words.pop()
+    return " ".join(words)
+
+
+def place_id_for(name):
+    """
+    Stable id of a place learned from an address, e.g. "mountain-view-station-mountain-view".
+    """
+    return normalize_name(name).replace(" ", "-")
+
+
+def max_edits_for(name):
+    ## Short names are too close to each other to tolerate typos
+    if len(name) <= 4:
+        return 0
+    return 1 if len(name) <= 8 else 2
+
+
+class Gazetteer:
+    """
+    Places by id, and a trie of their normalized names and aliases.
+
+    Parameters:
+    learned_path (str): CSV that learned aliases are appended to. None keeps them in memory.
+    """
+
+    def __init__(self, learned_path=None):
+        self.learned_path = learned_path
+        ## place_id -> canonical name, as the Maps API formats it
+        self.places = {}
+        ## place_id -> (lat, lon), for the places whose coordinates are known
+        self.coordinates = {}
+        self._trie = {}
+        ## Names with their words sorted -> place_id, for names given in another word order
+        self._sorted_words = {}
+        self._lock = threading.Lock()
+        self.exact = 0
+        self.fuzzy = 0
+        self.misses = 0
+
+    @classmethod
+    def from_env(cls, path=BUNDLED_PLACES_PATH):
+        """
+        Gazetteer with the bundled places and the aliases learned so far (GAZETTEER_PATH).
+        """
+        gazetteer = cls(os.getenv("GAZETTEER_PATH", DEFAULT_LEARNED_PATH))
+        gazetteer.load_csv(path)
+        if os.path.exists(gazetteer.learned_path):
+            gazetteer.load_csv(gazetteer.learned_path)
+        return gazetteer
+
+    def load_csv(self, path):
+        """
+        Load rows of place_id, name, optional lat and lon, and aliases separated by semicolons.
+        """
+        with open(path, newline="", encoding="utf-8") as f:
+            for row in csv.DictReader(f):
+                aliases = [alias for alias in (row.get("aliases") or "").split(";") if alias.strip()]
+                location = (float(row["lat"]), float(row["lon"])) if row.get("lat") and row.get("lon") else None
+                self.add_place(row["place_id"], row["name"], aliases, location)
+
+    def add_place(self, place_id, name, aliases=(), location=None):
+        with self._lock:
+            self.places.setdefault(place_id, name)
+            if location is not None:
+                self.coordinates.setdefault(place_id, location)
+            ## The part of an address before the first comma names the place on its own,
+            ## e.g. "Golden Gate Bridge" in "Golden Gate Bridge, San Francisco, CA, USA"
+            for alias in [name, name.split(",")[0], *aliases]:
+                self._insert(normalize_name(alias), place_id)
+
+    def _insert(self, key, place_id):
+        if not key:
+            return
+        node = self._trie
+        for char in key:
+            node = node.setdefault(char, {})
+        ## The first place to claim a name keeps it, learned aliases do not override the bundled ones
+        node.setdefault(_PLACE, place_id)
+        self._sorted_words.setdefault(" ".join(sorted(key.split())), place_id)
+
+    def _exact(self, key):
+        node = self._trie
+        for char in key:
+            node = node.get(char)
+            if node is None:
+                return None
+        return node.get(_PLACE)
+
+    def _fuzzy(self, key, max_edits):
+        """
+        Place within max_edits edits (insertions, deletions, substitutions and transpositions)
+        of key, or None when there is none or several places are equally close.
+        """
+        best_distance, best = max_edits, set()
+        first_row = list(range(len(key) + 1))
+        ## Each entry: node, its character, the character of its parent, its row and the parent row
+        stack = [(child, char, None, first_row, None) for char, child in self._trie.items() if char != _PLACE]
+
+        while stack:
+            node, char, parent_char, parent_row, grandparent_row = stack.pop()
+            row = [parent_row[0] + 1]
+            for i in range(1, len(key) + 1):
+                cost = 0 if key[i - 1] == char else 1
+                distance = min(row[i - 1] + 1, parent_row[i] + 1, parent_row[i - 1] + cost)
+                if grandparent_row is not None and i > 1 and key[i - 1] == parent_char and key[i - 2] == char:
+                    distance = min(distance, grandparent_row[i - 2] + 1)
+                row.append(distance)
+
+            place_id = node.get(_PLACE)
+            if place_id is not None and row[-1] <= best_distance:
+                if row[-1] < best_distance:
+                    best_distance, best = row[-1], set()
+                best.add(place_id)
+
+            ## No name below this node can get closer than the best of this row
+            if min(row) <= best_distance:
+                stack.extend(
+                    (child, child_char, char, row, parent_row)
+                    for child_char, child in node.items() if child_char != _PLACE
+                )
+
+        return best.pop() if len(best) == 1 else None
+
+    def resolve(self, name):
+        """
+        Returns:
+        str: Id of the place the name refers to, or None when it is unknown or ambiguous.
+        """
+        key = normalize_name(name)
+        if not key:
+            return None
+
+        place_id = self._exact(key) or self._sorted_words.get(" ".join(sorted(key.split())))
+        if place_id is not None:
+            self.exact += 1
+            return place_id
+
+        max_edits = max_edits_for(key)
+        place_id = self._fuzzy(key, max_edits) if max_edits else None
+        if place_id is not None:
+            self.fuzzy += 1
+            return place_id
+
+        self.misses += 1
+        return None
+
+    def canonicalize(self, name):
+        """
+        Canonical name of the place, or the name unchanged when the place is unknown.
+        """
+        place_id = self.resolve(name)
+        return self.places[place_id] if place_id is not None else name
+
+    def location(self, name):
+        """
+        (lat, lon) of the place, or None when the place or its coordinates are unknown.
+        """
+        place_id = self.resolve(name)
+        return self.coordinates.get(place_id) if place_id is not None else None
+
+    def canonicalize_route(self, route):
+        """
+        Canonicalize the places of a route given as "A to B". Route numbers stay unchanged.
+        """
+        parts = re.split(r"\s+to\s+", str(route).strip(), flags=re.IGNORECASE)
+        if len(parts) == 2 and parts[0].lower().startswith("from "):
+            parts[0] = parts[0][len("from "):]
+        return " to ".join(self.canonicalize(part) for part in parts)
+
+    def learn(self, name, resolved_address):
+        """
+        Remember that the Maps API resolved name to resolved_address.
+        """
+        if not name or not resolved_address or self._exact(normalize_name(name)) is not None:
+            return
+        place_id = self._exact(normalize_name(resolved_address)) or place_id_for(resolved_address)
+        self.add_place(place_id, resolved_address, [name])
+        if self.learned_path:
+            self._append_learned(place_id, resolved_address, name)
+
+    def _append_learned(self, place_id, resolved_address, name):
+        with self._lock:
+            os.makedirs(os.path.dirname(os.path.abspath(self.learned_path)), exist_ok=True)
+            new_file = not os.path.exists(self.learned_path)
+            with open(self.learned_path, "a", newline="", encoding="utf-8") as f:
+                writer = csv.writer(f)
+                if new_file:
+                    writer.writerow(["place_id", "name", "lat", "lon", "aliases"])
+                writer.writerow([place_id, resolved_address, "", "", name])
+
+    def stats(self):
+        lookups = self.exact + self.fuzzy + self.misses
+        return {
+            "places": len(self.places),
+            "exact": self.exact,
+            "fuzzy": self.fuzzy,
+            "misses": self.misses,
+            "hit_rate": (self.exact + self.fuzzy) / lookups if lookups else 0.0,
+        }
+
+
+if __name__ == "__main__":
+    gazetteer = Gazetteer.from_env()
+    for name in sys.argv[1:]:
+        place_id = gazetteer.resolve(name)
+        print(f"{name} -> {place_id}: {gazetteer.places.get(place_id)}")
@@ -0,0 +1,280 @@
+"""
+Async HTTP and WebSocket server for the LangGraph assistants.
+
+The interactive main.py scripts serve one conversation through a blocking input() loop.
+This server imports the graph a LangGraph variant compiles at module level, so it is
+compiled once, and serves many conversations from one process. Every client session
+gets its own thread_id, so the checkpointer keeps the conversations apart. The graph is
+driven through astream; turns of the same session run in order, a global semaphore bounds
+the turns in flight across all sessions, and on shutdown the server stops taking new
+turns and lets the running ones finish.
+
+Usage (from the repository root):
+
+    python core/common/graph_server.py langGraph_multi_agent --port 8080
+
+    curl -X POST localhost:8080/sessions
+    curl -X POST localhost:8080/sessions/<session_id>/messages -d '{"message": "How is the traffic?"}'
+
+Latency and token metrics per stage are served on /metrics in the Prometheus text format.
+
+WebSocket clients connect to /sessions/<session_id>/ws and send one text frame per user
+message. The server answers with a {"type": "message"} event per new graph message and a
+{"type": "done"} event at the end of the turn.
+
+"""
+
+import argparse
+import asyncio
+import importlib
+import os
+import re
+import sys
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+
+from aiohttp import WSCloseCode, WSMsgType, web
+
+## Shared modules live in core/common, which is not on the path when this file runs as a script
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from common.tracing import tracer
+from common.langchain_tracing import LangGraphTracer
+from common.resilience import LLMUnavailableError
+
+SESSION_ID_PATTERN = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+
+def message_to_dict(message):
+    """
+    JSON view of a LangChain message.
+    """
+    entry = {"role": message.type, "content": message.content}
+    if getattr(message, "name", None):
+        entry["name"] = message.name
+    if getattr(message, "tool_calls", None):
+        entry["tool_calls"] = [{"name": call["name"], "args": call["args"]} for call in message.tool_calls]
+    return entry
+
+
+def load_graph(variant):
+    """
+    Import main.py of a LangGraph variant and return the graph it compiles.
+    """
+    variant_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), variant)
+    if not os.path.isfile(os.path.join(variant_dir, "main.py")):
+        raise ValueError(f"Unknown variant: {variant}")
+    ## The variants use flat imports (agents, utils, tools) relative to their own directory
+    sys.path.insert(0, variant_dir)
+    return importlib.import_module("main").graph
+
+
+class Session:
+
+    def __init__(self, session_id, callbacks=None):
+        self.session_id = session_id
+        self.config = {"configurable": {"thread_id": session_id}, "callbacks": callbacks or []}
+        self.lock = asyncio.Lock()
+        self.last_seen = time.monotonic()
+
+
+class GraphServer:
+    """
+    Serves a compiled LangGraph graph to many concurrent sessions.
+
+    Parameters:
+    graph (CompiledGraph): Graph compiled with a checkpointer.
+    max_concurrency (int): Turns that may run at the same time across all sessions. Also the
+        size of the thread pool that runs the synchronous graph nodes.
+    session_ttl (float): Seconds after which an idle session is forgotten. Its conversation
+        stays in the checkpointer and resumes when the session id is used again.
+    drain_timeout (float): Seconds to wait for running turns on shutdown.
+    """
+
+    def __init__(self, graph, max_concurrency=64, session_ttl=30 * 60, drain_timeout=30):
+        self.graph = graph
+        self.max_concurrency = max_concurrency
+        self.session_ttl = session_ttl
+        self.drain_timeout = drain_timeout
+        self.sessions = {}
+        self.draining = False
+        self.active_turns = 0
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._websockets = set()
+        self._executor = None
+        ## One handler records the nodes and LLM calls of all sessions
+        self._callbacks = [LangGraphTracer()]
+
+    def app(self):
+        app = web.Application()
+        app.add_routes([
+            web.get("/health", self.handle_health),
+            web.get("/metrics", self.handle_metrics),
+            web.post("/sessions", self.handle_create_session),
+            web.delete("/sessions/{session_id}", self.handle_delete_session),
+            web.post("/sessions/{session_id}/messages", self.handle_message),
+            web.get("/sessions/{session_id}/ws", self.handle_websocket),
+        ])
+        app.on_startup.append(self.on_startup)
+        app.on_shutdown.append(self.on_shutdown)
+        app.on_cleanup.append(self.on_cleanup)
+        return app
+
+    async def on_startup(self, app):
+        ## Synchronous nodes run in the default executor, so it bounds how many turns make progress
+        self._executor = ThreadPoolExecutor(max_workers=self.max_concurrency)
+        asyncio.get_running_loop().set_default_executor(self._executor)
+
+    async def on_shutdown(self, app):
+        self.draining = True
+        try:
+            await asyncio.wait_for(self._idle.wait(), self.drain_timeout)
+        except asyncio.TimeoutError:
+            pass
+        for ws in list(self._websockets):
+            await ws.close(code=WSCloseCode.GOING_AWAY, message=b"Server shutdown")
+
+    async def on_cleanup(self, app):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+
+    def session(self, session_id):
+        now = time.monotonic()
+        session = self.sessions.get(session_id)
+        if session is None:
+            ## Forget idle sessions whenever a new one starts
+            for key, idle in list(self.sessions.items()):
+                if now - idle.last_seen > self.session_ttl and not idle.lock.locked():
+                    del self.sessions[key]
+            session = self.sessions[session_id] = Session(session_id, self._callbacks)
+        session.last_seen = now
+        return session
+
+    @asynccontextmanager
+    async def _turn(self, session):
+        ## Turns of one session run in order, turns of different sessions run concurrently
+        async with session.lock, self._semaphore:
+            self.active_turns += 1
+            self._idle.clear()
+            try:
+                yield
+            finally:
+                self.active_turns -= 1
+                session.last_seen = time.monotonic()
+                if self.active_turns == 0:
+                    self._idle.set()
+
+    async def run_turn(self, session, user_message):
+        """
+        Run one user message through the graph.
+
+        Yields:
+        tuple: (node, message) for every message the graph adds, as soon as its node finishes.
+        """
+        async with self._turn(session):
+            with tracer.span("turn", "turn", session_id=session.session_id):
+                async for update in self.graph.astream(
+                    {"messages": ("user", user_message)}, session.config, stream_mode="updates"
+                ):
+                    for node, values in update.items():
+                        messages = (values or {}).get("messages", [])
+                        for message in messages if isinstance(messages, list) else [messages]:
+                            yield node, message
+
+    def _session_from_request(self, request):
+        session_id = request.match_info["session_id"]
+        if not SESSION_ID_PATTERN.match(session_id):
+            raise web.HTTPBadRequest(reason="Invalid session id")
+        return self.session(session_id)
+
+    async def handle_health(self, request):
+        return web.json_response({
+            "status": "draining" if self.draining else "ok",
+            "sessions": len(self.sessions),
+            "active_turns": self.active_turns,
+        })
+
+    async def handle_metrics(self, request):
+        return web.Response(text=tracer.render_prometheus(), content_type="text/plain")
+
+    async def handle_create_session(self, request):
+        session = self.session(uuid.uuid4().hex)
+        return web.json_response({"session_id": session.session_id}, status=201)
+
+    async def handle_delete_session(self, request):
+        session = self._session_from_request(request)
+        async with session.lock:
+            self.sessions.pop(session.session_id, None)
+            checkpointer = self.graph.checkpointer
+            if checkpointer is not None and hasattr(checkpointer, "adelete_thread"):
+                await checkpointer.adelete_thread(session.session_id)
+        return web.Response(status=204)
+
+    async def handle_message(self, request):
+        if self.draining:
+            raise web.HTTPServiceUnavailable(reason="Server is shutting down")
+        session = self._session_from_request(request)
+        try:
+            body = await request.json()
+            user_message = body["message"]
+        except (ValueError, KeyError, TypeError):
+            raise web.HTTPBadRequest(reason='Expected a JSON body with a "message" field')
+
+        try:
+            messages = [
+                {"node": node, **message_to_dict(message)}
+                async for node, message in self.run_turn(session, user_message)
+            ]
+        except LLMUnavailableError as e:
+            ## The provider is degraded. Clients should back off instead of retrying right away.
+            raise web.HTTPServiceUnavailable(reason=str(e), headers={"Retry-After": "30"})
+        return web.json_response({"session_id": session.session_id, "messages": messages})
+
+    async def handle_websocket(self, request):
+        session = self._session_from_request(request)
+        ws = web.WebSocketResponse(heartbeat=30)
+        await ws.prepare(request)
+        self._websockets.add(ws)
+        try:
+            async for frame in ws:
+                if frame.type != WSMsgType.TEXT:
+                    continue
+                if self.draining:
+                    await ws.send_json({"type": "error", "error": "Server is shutting down"})
+                    break
+                try:
+                    async for node, message in self.run_turn(session, frame.data):
+                        await ws.send_json({"type": "message", "node": node, **message_to_dict(message)})
+                    await ws.send_json({"type": "done"})
+                except Exception as e:
+                    await ws.send_json({"type": "error", "error": str(e)})
+        finally:
+            self._websockets.discard(ws)
+        return ws
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve a LangGraph assistant over HTTP and WebSocket.")
+    parser.add_argument("variant", choices=["langGraph_single_agent", "langGraph_multi_agent"])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--max-concurrency", type=int, default=64, help="Turns in flight across all sessions")
+    parser.add_argument("--session-ttl", type=float, default=30 * 60, help="Seconds before an idle session is forgotten")
+    parser.add_argument("--drain-timeout", type=float, default=30, help="Seconds to let running turns finish on shutdown")
+    args = parser.parse_args()
+
+    server = GraphServer(
+        load_graph(args.variant),
+        max_concurrency=args.max_concurrency,
+        session_ttl=args.session_ttl,
+        drain_timeout=args.drain_timeout,
+    )
+    web.run_app(server.app(), host=args.host, port=args.port, shutdown_timeout=args.drain_timeout)
+
+
+if __name__ == "__main__":
+    main()
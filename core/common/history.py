@@ -0,0 +1,180 @@
+"""
+Token-budgeted conversation history for the OpenAI-native assistants.
+
+Without a limit every turn resends the whole conversation, so prompt tokens and latency
+grow linearly with the session length. ConversationHistory keeps the most recent turns
+within a token budget, counted locally, and folds older turns into a running summary.
+The summary is updated incrementally from the turns that leave the window, it is never
+regenerated from the full conversation. Turns are evicted whole, so an assistant message
+with tool calls always stays together with its tool results.
+
+"""
+
+import json
+
+from common.prompt_layout import canonical_message
+
+SUMMARY_INSTRUCTIONS = (
+    "You maintain a running summary of a conversation between a user and a travel assistant. "
+    "Update the summary with the new messages. Keep every origin, destination, mode of travel, "
+    "route number and open question the user mentioned. Answer with the updated summary only, "
+    "in at most 120 words."
+)
+
+
+def _load_encoding(model):
+    try:
+        import tiktoken
+        try:
+            return tiktoken.encoding_for_model(model)
+        except KeyError:
+            return tiktoken.get_encoding("o200k_base")
+    except Exception:
+        ## tiktoken is missing or cannot fetch its tables. Fall back to an estimate.
+        return None
+
+
+def to_message_dict(message):
+    """
+    Convert an OpenAI message object into the plain dict the API accepts.
+    Messages are stored in the canonical layout, so later turns resend them byte for byte.
+    """
+    return canonical_message(message)
+
+
+class TokenCounter:
+    """
+    Counts chat message tokens locally with tiktoken, or estimates them when it is unavailable.
+    """
+
+    ## Tokens the API adds around every message
+    MESSAGE_OVERHEAD = 4
+
+    def __init__(self, model="gpt-4o-mini"):
+        self.encoding = _load_encoding(model)
+
+    def count_text(self, text):
+        if not text:
+            return 0
+        if self.encoding is None:
+            return len(text) // 4 + 1
+        return len(self.encoding.encode(text))
+
+    def count_message(self, message):
+        message = to_message_dict(message)
+        tokens = self.MESSAGE_OVERHEAD + self.count_text(message.get("content") or "")
+        if message.get("tool_calls"):
+            tokens += self.count_text(json.dumps(message["tool_calls"]))
+        return tokens
+
+
+def make_openai_summarizer(client, model="gpt-4o-mini", create=None):
+    """
+    Create a summarize(previous_summary, messages) function backed by a chat completion.
+    create replaces client.chat.completions.create, e.g. with a version that retries.
+    """
+    create = create or client.chat.completions.create
+
+    def summarize(previous_summary, messages):
+        transcript = "\n".join(_render(message) for message in messages)
+        response = create(
+            model=model,
+            messages=[
+                {"role": "system", "content": SUMMARY_INSTRUCTIONS},
+                {"role": "user", "content": f"Current summary:\n{previous_summary or '(empty)'}\n\nNew messages:\n{transcript}"},
+            ],
+        )
+        return response.choices[0].message.content or previous_summary
+
+    return summarize
+
+
+def _render(message):
+    message = to_message_dict(message)
+    if message.get("tool_calls"):
+        calls = ", ".join(
+            f"{call['function']['name']}({call['function']['arguments']})" for call in message["tool_calls"]
+        )
+        return f"{message['role']}: called {calls}"
+    return f"{message['role']}: {message.get('content') or ''}"
+
+
+class ConversationHistory:
+    """
+    Recent conversation window within a token budget, plus a running summary of older turns.
+
+    Parameters:
+    summarize (function): Called as summarize(previous_summary, evicted_messages) and returns
+        the new summary. See make_openai_summarizer.
+    token_budget (int): Upper bound on the tokens of the recent window. The latest turn is
+        always kept, even when it alone exceeds the budget.
+    model (str): Model whose tokenizer is used for counting.
+    low_watermark (float): Fraction of the budget the window shrinks to when it overflows.
+    """
+
+    def __init__(self, summarize, token_budget=2000, model="gpt-4o-mini", low_watermark=0.6):
+        self.summarize = summarize
+        self.token_budget = token_budget
+        self.low_watermark = low_watermark
+        self.counter = TokenCounter(model)
+        self.summary = ""
+        ## Each turn starts with a user message: [messages, tokens]
+        self._turns = []
+        self._tokens = 0
+
+    def append(self, message):
+        message = to_message_dict(message)
+        tokens = self.counter.count_message(message)
+
+        if message.get("role") == "user" or not self._turns:
+            self._turns.append([[], 0])
+        self._turns[-1][0].append(message)
+        self._turns[-1][1] += tokens
+        self._tokens += tokens
+
+        self._compact()
+
+    def extend(self, messages):
+        for message in messages:
+            self.append(message)
+
+    @property
+    def tokens(self):
+        return self._tokens
+
+    def _compact(self):
+        if self._tokens <= self.token_budget:
+            return
+
+        ## Evict down to a low watermark so that the summary is not updated on every turn
+        target = self.token_budget * self.low_watermark
+        evicted = []
+        evicted_turns = 0
+        evicted_tokens = 0
+        while self._tokens - evicted_tokens > target and evicted_turns < len(self._turns) - 1:
+            messages, tokens = self._turns[evicted_turns]
+            evicted.extend(messages)
+            evicted_turns += 1
+            evicted_tokens += tokens
+
+        if not evicted:
+            return
+
+        ## Turns leave the window only once they are in the summary. When the summary call
+        ## fails, the window stays over budget for this turn and eviction is retried on the next message.
+        try:
+            self.summary = self.summarize(self.summary, evicted)
+        except Exception:
+            return
+        del self._turns[:evicted_turns]
+        self._tokens -= evicted_tokens
+
+    def window(self):
+        """
+        Messages to send to the API: the running summary, if any, followed by the recent turns.
+        """
+        messages = [message for turn, _ in self._turns for message in turn]
+        if self.summary:
+            summary = {"role": "system", "content": f"Summary of the earlier conversation: {self.summary}"}
+            return [summary] + messages
+        return messages
@@ -0,0 +1,260 @@
+"""
+Local intent router that runs before the triage LLM call.
+
+Queries like "How long to drive from X to Y" obviously belong to one specialist, yet the
+triage agent spends a full LLM round-trip to find that out. IntentRouter combines keyword
+rules with an optional naive Bayes model trained on logged turns and routes queries it is
+confident about straight to the specialist. Everything else still goes to the LLM triage.
+
+The labels are the task names of the specialists: travel_duration, traffic_updates and
+transit_details. Turns the LLM triage answers itself are logged as "other", so that the
+model also learns what does not belong to any specialist. Queries are never routed on it.
+
+Usage (from the repository root):
+
+    ## Train a model on the turns of the LLM triage, logged to INTENT_LOG_PATH
+    python core/common/intent_router.py train intents.jsonl intent_model.json
+
+"""
+
+import argparse
+import json
+import math
+import os
+import re
+import threading
+from collections import Counter, defaultdict
+
+TRAVEL_DURATION = "travel_duration"
+TRAFFIC_UPDATES = "traffic_updates"
+TRANSIT_DETAILS = "transit_details"
+LABELS = [TRAVEL_DURATION, TRAFFIC_UPDATES, TRANSIT_DETAILS]
+## Turns the LLM triage answered without a specialist. A training label only, never a route.
+OTHER = "other"
+
+TRANSIT_WORDS = r"(bus|buses|train|trains|tram|trams|subway|metro|light rail|caltrain|bart|transit|shuttle|ferry)"
+TRANSIT_DETAIL_WORDS = r"(route|routes|line|lines|number|schedule|schedules|timetable|departures?|leaves?|leaving|next|stop|stops)"
+
+## A label matches when every pattern of one of its rules matches
+RULES = {
+    TRAVEL_DURATION: [
+        [r"\b(how long|how much time|travel time|how many (minutes|hours)|duration|eta)\b",
+         r"\b(from|to|between|drive|driving|car|walk|walking|cycle|cycling|bike|biking|commute|get|go|trip|travel)\b"],
+    ],
+    TRAFFIC_UPDATES: [
+        [r"\b(traffic|congestion|congested|jam|jams|gridlock|accidents?|road ?works?)\b"],
+    ],
+    TRANSIT_DETAILS: [
+        [rf"\b{TRANSIT_WORDS}\b", rf"\b{TRANSIT_DETAIL_WORDS}\b"],
+        [r"\b(schedule|timetable|departures)\b"],
+        [rf"\bwhich {TRANSIT_WORDS}\b"],
+    ],
+}
+COMPILED_RULES = {
+    label: [[re.compile(pattern) for pattern in rule] for rule in rules]
+    for label, rules in RULES.items()
+}
+
+## Confidence given to an unambiguous rule match
+RULE_CONFIDENCE = 0.9
+
+
+def tokenize(text):
+    """
+    Lower-case word unigrams and bigrams.
+    """
+    words = re.findall(r"[a-z0-9']+", text.lower())
+    return words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+
+
+class NaiveBayesIntentModel:
+    """
+    Multinomial naive Bayes over word unigrams and bigrams, with Laplace smoothing.
+    """
+
+    def __init__(self, class_counts=None, token_counts=None, vocabulary_size=0):
+        self.class_counts = class_counts or {}
+        self.token_counts = token_counts or {}
+        self.vocabulary_size = vocabulary_size
+        self._totals = {label: sum(counts.values()) for label, counts in self.token_counts.items()}
+
+    @classmethod
+    def fit(cls, texts, labels):
+        class_counts = Counter(labels)
+        token_counts = defaultdict(Counter)
+        vocabulary = set()
+        for text, label in zip(texts, labels):
+            tokens = tokenize(text)
+            token_counts[label].update(tokens)
+            vocabulary.update(tokens)
+        return cls(dict(class_counts), {label: dict(counts) for label, counts in token_counts.items()}, len(vocabulary))
+
+    def predict_proba(self, text):
+        tokens = tokenize(text)
+        num_examples = sum(self.class_counts.values())
+        if not num_examples:
+            return {}
+
+        log_scores = {}
+        for label, count in self.class_counts.items():
+            counts = self.token_counts.get(label, {})
+            denominator = self._totals.get(label, 0) + self.vocabulary_size + 1
+            score = math.log(count / num_examples)
+            for token in tokens:
+                score += math.log((counts.get(token, 0) + 1) / denominator)
+            log_scores[label] = score
+
+        top = max(log_scores.values())
+        exp_scores = {label: math.exp(score - top) for label, score in log_scores.items()}
+        total = sum(exp_scores.values())
+        return {label: score / total for label, score in exp_scores.items()}
+
+    def to_dict(self):
+        return {
+            "class_counts": self.class_counts,
+            "token_counts": self.token_counts,
+            "vocabulary_size": self.vocabulary_size,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data["class_counts"], data["token_counts"], data["vocabulary_size"])
+
+    def save(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.to_dict(), f)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "r", encoding="utf-8") as f:
+            return cls.from_dict(json.load(f))
+
+
+class IntentRouter:
+    """
+    Routes confident queries to a specialist, leaves the rest to the LLM triage.
+
+    Parameters:
+    model (NaiveBayesIntentModel): Optional model trained on logged turns. Used to settle
+        queries the rules find ambiguous or do not match.
+    threshold (float): Minimum confidence for routing without the LLM.
+    log_path (str): Optional JSONL file where the routing decisions of the LLM triage are
+        appended, as training data for the model.
+    """
+
+    def __init__(self, model=None, threshold=0.85, log_path=None):
+        self.model = model
+        self.threshold = threshold
+        self.log_path = log_path
+        self.routed = 0
+        self.fallbacks = 0
+        self._log_lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        """
+        Router configured by INTENT_MODEL_PATH, INTENT_LOG_PATH and INTENT_ROUTER_THRESHOLD.
+        """
+        model_path = os.getenv("INTENT_MODEL_PATH")
+        model = NaiveBayesIntentModel.load(model_path) if model_path and os.path.exists(model_path) else None
+        return cls(
+            model=model,
+            threshold=float(os.getenv("INTENT_ROUTER_THRESHOLD", 0.85)),
+            log_path=os.getenv("INTENT_LOG_PATH"),
+        )
+
+    def rule_matches(self, text):
+        text = text.lower()
+        return [
+            label
+            for label, rules in COMPILED_RULES.items()
+            if any(all(pattern.search(text) for pattern in rule) for rule in rules)
+        ]
+
+    def classify(self, text):
+        """
+        Returns:
+        tuple: (label, confidence). label is None when nothing matches.
+        """
+        matches = self.rule_matches(text)
+        probabilities = self.model.predict_proba(text) if self.model is not None else {}
+
+        if len(matches) == 1:
+            label = matches[0]
+            return label, max(RULE_CONFIDENCE, probabilities.get(label, 0.0))
+
+        if matches:
+            ## Several rules match. Only the model can settle it.
+            candidates = {label: p for label, p in probabilities.items() if label in matches}
+        elif OTHER in probabilities:
+            ## No rule matches. The model routes only when it ranks a specialist above "other".
+            candidates = probabilities
+        else:
+            ## A model that never saw an off-topic turn would force one onto a specialist
+            return None, 0.0
+        if not candidates:
+            return None, 0.0
+        label = max(candidates, key=candidates.get)
+        if label not in LABELS:
+            return None, 0.0
+        return label, candidates[label]
+
+    def route(self, text):
+        """
+        The specialist for a query, or None to fall back to the LLM triage.
+        """
+        label, confidence = self.classify(text)
+        if label is not None and confidence >= self.threshold:
+            self.routed += 1
+            return label
+        self.fallbacks += 1
+        return None
+
+    def log_turn(self, text, label):
+        """
+        Record the routing decision of the LLM triage as a training example. label is the
+        specialist, or OTHER when the triage answered the query itself.
+        """
+        if not self.log_path:
+            return
+        with self._log_lock, open(self.log_path, "a", encoding="utf-8") as f:
+            f.write(json.dumps({"text": text, "label": label}) + "\n")
+
+    def stats(self):
+        total = self.routed + self.fallbacks
+        return {
+            "routed": self.routed,
+            "fallbacks": self.fallbacks,
+            "fast_path_rate": self.routed / total if total else 0.0,
+        }
+
+
+def train(log_path, model_path):
+    texts, labels = [], []
+    with open(log_path, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                example = json.loads(line)
+                texts.append(example["text"])
+                labels.append(example["label"])
+
+    model = NaiveBayesIntentModel.fit(texts, labels)
+    model.save(model_path)
+    return model
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Train the local intent router on logged turns.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    train_parser = subparsers.add_parser("train")
+    train_parser.add_argument("log_path", help="JSONL file with text and label fields")
+    train_parser.add_argument("model_path", help="Output model file")
+    args = parser.parse_args()
+
+    if args.command == "train":
+        model = train(args.log_path, args.model_path)
+        print(f"Trained on {sum(model.class_counts.values())} turns: {model.class_counts}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""
+LangChain adapter for the on-disk completion cache.
+
+ChatOpenAI accepts a per-model cache. The prompt LangChain hands to the cache is the
+serialized message list, which contains message ids, response metadata and API-generated
+tool call ids that differ between sessions. They are normalized away before hashing, and
+cached generations are served with fresh ids so that LangGraph does not mistake them for
+messages already in the state.
+
+"""
+
+import json
+import uuid
+
+from langchain_core.caches import BaseCache
+from langchain_core.load import dumps, loads
+
+from common.completion_cache import get_completion_cache, hash_payload
+
+
+def normalize_prompt(prompt):
+    """
+    Canonical form of a serialized LangChain message list for hashing.
+    """
+    try:
+        messages = json.loads(prompt)
+    except json.JSONDecodeError:
+        return prompt
+
+    ids = {}
+
+    def ordinal(call_id):
+        return ids.setdefault(call_id, f"call_{len(ids)}")
+
+    normalized = []
+    for message in messages:
+        kwargs = message.get("kwargs", {}) if isinstance(message, dict) else {}
+        entry = {"role": kwargs.get("type"), "content": kwargs.get("content")}
+        if kwargs.get("name"):
+            entry["name"] = kwargs["name"]
+        if kwargs.get("tool_calls"):
+            entry["tool_calls"] = [
+                {"id": ordinal(call.get("id")), "name": call.get("name"), "args": call.get("args")}
+                for call in kwargs["tool_calls"]
+            ]
+        if kwargs.get("tool_call_id"):
+            entry["tool_call_id"] = ordinal(kwargs["tool_call_id"])
+        normalized.append(entry)
+    return normalized
+
+
+def _fresh_ids(generations):
+    for generation in generations:
+        message = getattr(generation, "message", None)
+        if message is None:
+            continue
+        message.id = None
+        renamed = {}
+        for call in message.tool_calls:
+            renamed[call["id"]] = call["id"] = "call_" + uuid.uuid4().hex[:24]
+        for call in message.additional_kwargs.get("tool_calls") or []:
+            call["id"] = renamed.get(call.get("id"), call.get("id"))
+    return generations
+
+
+class LangChainCompletionCache(BaseCache):
+    """
+    BaseCache backed by a CompletionCache. Pass it as ChatOpenAI(cache=...).
+
+    Parameters:
+    cache (CompletionCache): Shared store and metrics.
+    bypass (bool): Never serve or store completions, only count every call as bypassed.
+    """
+
+    def __init__(self, cache, bypass=False):
+        self.cache = cache
+        self.bypass = bypass
+
+    def _key(self, prompt, llm_string):
+        return hash_payload({"llm": llm_string, "messages": normalize_prompt(prompt)})
+
+    def lookup(self, prompt, llm_string):
+        if self.bypass:
+            self.cache.bypass()
+            return None
+        value = self.cache.get(self._key(prompt, llm_string))
+        if value is None:
+            return None
+        return _fresh_ids(loads(value))
+
+    def update(self, prompt, llm_string, return_val):
+        if self.bypass:
+            return
+        self.cache.put(self._key(prompt, llm_string), dumps(list(return_val)))
+
+    def clear(self, **kwargs):
+        self.cache.clear()
+
+
+def langchain_cache_for(agent):
+    """
+    Value for ChatOpenAI(cache=...) for an agent. False when the cache is off.
+    agent.cache_completions decides whether its calls use the cache. When it is None, agents
+    that sample with a temperature above 0 bypass it: a sampled completion must not be
+    replayed as the answer. A bypassing agent gets a cache that counts and skips every call.
+    """
+    cache = get_completion_cache()
+    if cache is None:
+        return False
+    use_cache = agent.cache_completions
+    if use_cache is None:
+        use_cache = agent.temperature <= 0
+    if not use_cache:
+        return LangChainCompletionCache(cache, bypass=True)
+    return LangChainCompletionCache(cache)
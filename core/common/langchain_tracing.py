@@ -0,0 +1,124 @@
+"""
+LangChain adapter for the tracer in tracing.py.
+
+LangGraphTracer is a callback handler that records every LangGraph node run and every
+chat model call as a span, with the node spans as parents of the chat model spans. It
+needs no changes to the graph: pass it in the callbacks of the config the graph runs with.
+
+"""
+
+import threading
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+from common.tracing import tracer as default_tracer, current_span
+
+
+def langgraph_stage(node):
+    """
+    Stage of a node of the travel assistant graphs.
+    """
+    if node.startswith("__"):
+        ## Internal nodes such as __start__, which writes the input to the state
+        return "graph"
+    if node == "triage":
+        return "triage"
+    if node.startswith("enter_") or node == "leave_skill":
+        return "handoff"
+    if node == "tools" or node.endswith("_tools"):
+        return "tool"
+    return "assistant"
+
+
+def _usage(response):
+    usage = (response.llm_output or {}).get("token_usage")
+    if usage:
+        return usage
+    for generations in response.generations:
+        for generation in generations:
+            metadata = getattr(getattr(generation, "message", None), "usage_metadata", None)
+            if metadata:
+                return {
+                    "prompt_tokens": metadata.get("input_tokens"),
+                    "completion_tokens": metadata.get("output_tokens"),
+                    "prompt_tokens_details": {"cached_tokens": (metadata.get("input_token_details") or {}).get("cache_read")},
+                }
+    return None
+
+
+class LangGraphTracer(BaseCallbackHandler):
+    """
+    Records LangGraph nodes and chat model calls as spans.
+
+    Parameters:
+    tracer (Tracer): Tracer that receives the spans.
+    stage_of (function): Maps a node name to its stage.
+    """
+
+    ## Recording a span is cheap and thread-safe, so async runs need no executor hop
+    run_inline = True
+
+    def __init__(self, tracer=default_tracer, stage_of=langgraph_stage):
+        self.tracer = tracer
+        self.stage_of = stage_of
+        ## Spans of node and chat model runs, by run id
+        self._spans = {}
+        ## Node span that encloses each nested run, by run id
+        self._enclosing = {}
+        self._lock = threading.Lock()
+
+    def _parent(self, parent_run_id):
+        with self._lock:
+            return self._spans.get(parent_run_id) or self._enclosing.get(parent_run_id)
+
+    def _start(self, run_id, parent_run_id, name, stage, **attributes):
+        parent = self._parent(parent_run_id) or current_span()
+        span = self.tracer.start_span(name, stage, parent, **attributes)
+        with self._lock:
+            self._spans[run_id] = span
+
+    def _end(self, run_id, error=None, usage=None):
+        with self._lock:
+            self._enclosing.pop(run_id, None)
+            span = self._spans.pop(run_id, None)
+        if span is not None:
+            span.record_usage(usage)
+            self.tracer.end_span(span, error)
+
+    def on_chain_start(self, serialized, inputs, *, run_id, parent_run_id=None, metadata=None, **kwargs):
+        node = (metadata or {}).get("langgraph_node")
+        if node is not None and kwargs.get("name") == node:
+            self._start(run_id, parent_run_id, node, self.stage_of(node), step=metadata.get("langgraph_step"))
+            return
+        parent = self._parent(parent_run_id)
+        if parent is not None:
+            with self._lock:
+                self._enclosing[run_id] = parent
+
+    def on_chain_end(self, outputs, *, run_id, **kwargs):
+        self._end(run_id)
+
+    def on_chain_error(self, error, *, run_id, **kwargs):
+        self._end(run_id, error)
+
+    def on_tool_start(self, serialized, input_str, *, run_id, parent_run_id=None, **kwargs):
+        parent = self._parent(parent_run_id)
+        if parent is not None:
+            with self._lock:
+                self._enclosing[run_id] = parent
+
+    def on_tool_end(self, output, *, run_id, **kwargs):
+        self._end(run_id)
+
+    def on_tool_error(self, error, *, run_id, **kwargs):
+        self._end(run_id, error)
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, parent_run_id=None, metadata=None, **kwargs):
+        model = (kwargs.get("invocation_params") or {}).get("model_name") or (metadata or {}).get("ls_model_name")
+        self._start(run_id, parent_run_id, "chat_model", "llm", model=model)
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        self._end(run_id, usage=_usage(response))
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        self._end(run_id, error)
@@ -0,0 +1,199 @@
+"""
+Coalescer for Google Maps Distance Matrix lookups.
+
+The Distance Matrix endpoint answers many origins and destinations in one request, but the
+tools ask for one (origin, destination) pair at a time. DistanceMatrixBatcher collects the
+lookups that arrive within a short window, whether they come from parallel tool calls in
+one LLM message or from concurrent sessions, and sends them as a few matrix requests that
+respect the API element limits. Identical lookups that are already in flight share one
+result (single-flight).
+
+"""
+
+import threading
+from concurrent.futures import Future
+
+import requests
+
+from common.travel_cache import normalize_mode, normalize_place
+
+DISTANCE_MATRIX_URL = "https://maps.googleapis.com/maps/api/distancematrix/json"
+
+## Distance Matrix API limits per request
+MAX_ORIGINS = 25
+MAX_DESTINATIONS = 25
+MAX_ELEMENTS = 100
+
+
+def plan_requests(pairs, max_origins=MAX_ORIGINS, max_destinations=MAX_DESTINATIONS, max_elements=MAX_ELEMENTS):
+    """
+    Split (origin, destination) pairs into matrix requests that fit the API limits.
+
+    A request covers every combination of its origins and destinations, so pairs sharing an
+    origin or destination are packed together to keep the number of wasted elements low.
+
+    Returns:
+    list: (origins, destinations) tuples, each a list of unique places.
+    """
+    chunks = []
+    origins, destinations = [], []
+
+    for origin, destination in sorted(pairs):
+        new_origins = origins if origin in origins else origins + [origin]
+        new_destinations = destinations if destination in destinations else destinations + [destination]
+
+        if (
+            len(new_origins) > max_origins
+            or len(new_destinations) > max_destinations
+            or len(new_origins) * len(new_destinations) > max_elements
+        ):
+            chunks.append((origins, destinations))
+            new_origins, new_destinations = [origin], [destination]
+
+        origins, destinations = new_origins, new_destinations
+
+    if origins:
+        chunks.append((origins, destinations))
+    return chunks
+
+
+class DistanceMatrixBatcher:
+    """
+    Merges concurrent travel duration lookups into batched Distance Matrix requests.
+
+    Parameters:
+    api_key (str): Google Maps API key.
+    window (float): Seconds to wait for more lookups after the first one of a batch arrives.
+    session (requests.Session): Keeps the connections to the API open between requests.
+    """
+
+    def __init__(self, api_key, window=0.02, max_origins=MAX_ORIGINS, max_destinations=MAX_DESTINATIONS, max_elements=MAX_ELEMENTS, session=None):
+        self.api_key = api_key
+        self.session = session or requests.Session()
+        self.window = window
+        self.max_origins = max_origins
+        self.max_destinations = max_destinations
+        self.max_elements = max_elements
+        self.requests_sent = 0
+        self.lookups = 0
+        self.deduplicated = 0
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._in_flight = {}
+        self._timer = None
+
+    def lookup(self, origin, destination, mode_of_travel):
+        """
+        Block until the travel duration between origin and destination is known.
+
+        Returns:
+        dict: status of the matrix request, the matrix element for this pair and the
+            addresses resolved by the API.
+        """
+        return self.submit(origin, destination, mode_of_travel).result()
+
+    def submit(self, origin, destination, mode_of_travel):
+        """
+        Queue a lookup and return a Future for its result.
+        """
+        origin, destination, mode = normalize_place(origin), normalize_place(destination), normalize_mode(mode_of_travel)
+        key = (origin, destination, mode)
+        flush_now = False
+
+        with self._lock:
+            self.lookups += 1
+            future = self._in_flight.get(key)
+            if future is not None:
+                self.deduplicated += 1
+                return future
+
+            future = Future()
+            future.add_done_callback(lambda _: self._forget(key))
+            self._in_flight[key] = future
+            self._pending[key] = future
+
+            if len(self._pending) >= self.max_elements:
+                flush_now = True
+            elif self._timer is None:
+                self._timer = threading.Timer(self.window, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+
+        if flush_now:
+            self.flush()
+        return future
+
+    def _forget(self, key):
+        with self._lock:
+            self._in_flight.pop(key, None)
+
+    def flush(self):
+        """
+        Send every pending lookup now.
+        """
+        with self._lock:
+            batch, self._pending = self._pending, {}
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+
+        by_mode = {}
+        for (origin, destination, mode), future in batch.items():
+            by_mode.setdefault(mode, {})[(origin, destination)] = future
+
+        for mode, futures in by_mode.items():
+            chunks = plan_requests(futures, self.max_origins, self.max_destinations, self.max_elements)
+            for origins, destinations in chunks:
+                self._send(mode, origins, destinations, futures)
+
+    def _send(self, mode, origins, destinations, futures):
+        wanted = [
+            (i, j, futures[(origin, destination)])
+            for i, origin in enumerate(origins)
+            for j, destination in enumerate(destinations)
+            ## A pair can also fall inside the matrix of another chunk. Answer it only once.
+            if (origin, destination) in futures and not futures[(origin, destination)].done()
+        ]
+        if not wanted:
+            return
+
+        try:
+            params = {
+                "origins": "|".join(p.replace("|", " ") for p in origins),
+                "destinations": "|".join(p.replace("|", " ") for p in destinations),
+                "mode": mode,
+                "key": self.api_key,
+            }
+            with self._lock:
+                self.requests_sent += 1
+            response = self.session.get(DISTANCE_MATRIX_URL, params=params).json()
+        except Exception as e:
+            for _, _, future in wanted:
+                future.set_exception(e)
+            return
+
+        ## Fan the rows and columns back out to the callers
+        origin_addresses = response.get("origin_addresses") or []
+        destination_addresses = response.get("destination_addresses") or []
+        rows = response.get("rows") or []
+
+        for i, j, future in wanted:
+            try:
+                element = rows[i]["elements"][j]
+            except (IndexError, KeyError):
+                element = {"status": "NOT_FOUND"}
+            future.set_result({
+                "status": response.get("status"),
+                "element": element,
+                "origin_address": origin_addresses[i] if i < len(origin_addresses) else "",
+                "destination_address": destination_addresses[j] if j < len(destination_addresses) else "",
+            })
+
+    def stats(self):
+        ## Under the lock, so the three counters are read at the same moment
+        with self._lock:
+            return {
+                "lookups": self.lookups,
+                "deduplicated": self.deduplicated,
+                "requests": self.requests_sent,
+            }
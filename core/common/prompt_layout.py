@@ -0,0 +1,67 @@
+"""
+Byte-stable prompt layout for the OpenAI-native assistants.
+
+The API caches the longest prompt prefix it has seen recently, so a request only reuses the
+work of earlier requests when it starts with exactly the same tokens. Every request of an
+agent is therefore laid out in the same order: tool schemas, system message, conversation
+summary, older turns and the current turn. Only the tail changes from one call to the next.
+
+PromptPrefix holds the head of the requests of one agent, built once. canonical_message
+gives every message one serialization, whether it comes from the SDK as a
+ChatCompletionMessage or from the history as a dict, so a message is sent the same way in
+the turn that created it and in every later turn.
+
+"""
+
+import json
+
+## Fields sent for a message, in this order. Fields the API returns as null are dropped.
+MESSAGE_FIELDS = ("role", "name", "content", "tool_calls", "tool_call_id")
+
+
+def canonical_message(message):
+    """
+    The message as a plain dict with a fixed field order.
+    """
+    if hasattr(message, "model_dump"):
+        message = message.model_dump(exclude_none=True)
+    canonical = {field: message[field] for field in MESSAGE_FIELDS if message.get(field) is not None}
+    if "tool_calls" in canonical:
+        canonical["tool_calls"] = [
+            {
+                "id": call["id"],
+                "type": call.get("type", "function"),
+                "function": {"name": call["function"]["name"], "arguments": call["function"]["arguments"]},
+            }
+            for call in canonical["tool_calls"]
+        ]
+    return canonical
+
+
+def canonical_tools(schemas):
+    """
+    Tool schemas sorted by name, with the keys of every object in sorted order.
+    """
+    schemas = sorted(schemas or [], key=lambda schema: schema["function"]["name"])
+    return json.loads(json.dumps(schemas, sort_keys=True))
+
+
+class PromptPrefix:
+    """
+    System message and tool schemas of an agent, shared by all its requests.
+
+    Parameters:
+    instructions (str): System message.
+    schemas (list): Tool schemas, e.g. ToolRegistry.schemas.
+    """
+
+    def __init__(self, instructions, schemas=None):
+        self.system = {"role": "system", "content": instructions}
+        self.tools = canonical_tools(schemas) or None
+
+    def request(self, messages):
+        """
+        messages and tools arguments for chat.completions.create.
+        messages should already be canonical, see canonical_message.
+        """
+        return {"messages": [self.system, *messages], "tools": self.tools}
@@ -0,0 +1,305 @@
+"""
+Timeouts, retries and a circuit breaker for LLM calls.
+
+The OpenAI SDK and ChatOpenAI retry on their own, but without a global view: every stuck
+worker keeps retrying while the provider is degraded, which piles up requests and blows
+up tail latency. Here the clients are created without their own retries, and every LLM
+call goes through Resilience.call instead:
+
+- each call has a timeout, set on the client (RetryPolicy.timeout),
+- rate limits (429), server errors (5xx), timeouts and connection errors are retried a
+  bounded number of times with full-jitter exponential backoff, honouring Retry-After,
+- each session has a retry budget, so retries stay a fraction of its requests, and
+- a process-wide circuit breaker opens after consecutive provider failures and fails calls
+  fast until a trial call succeeds.
+
+When a call cannot be made, LLMUnavailableError is raised so that the caller can tell the
+user instead of waiting. Other errors, such as invalid requests, are raised unchanged.
+
+"""
+
+import asyncio
+import os
+import random
+import threading
+import time
+from collections import OrderedDict
+
+import openai
+
+from common.tracing import current_span
+
+## Shown to the user when a turn fails with LLMUnavailableError
+UNAVAILABLE_MESSAGE = "Sorry, I cannot answer right now. Please try again in a moment."
+
+
+class LLMUnavailableError(RuntimeError):
+    """
+    The LLM provider is degraded: the circuit is open, or retries were exhausted.
+    """
+
+
+class RetryPolicy:
+    """
+    Parameters:
+    max_attempts (int): Attempts per call, including the first one.
+    base_delay (float): Backoff before the first retry, doubled for every further retry.
+    max_delay (float): Upper bound on a single backoff.
+    timeout (float): Seconds a single attempt may take. Set it on the client.
+    """
+
+    def __init__(self, max_attempts=3, base_delay=0.5, max_delay=8.0, timeout=30.0):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.timeout = timeout
+
+    @classmethod
+    def from_env(cls):
+        """
+        Policy configured by LLM_MAX_ATTEMPTS and LLM_TIMEOUT.
+        """
+        return cls(
+            max_attempts=int(os.getenv("LLM_MAX_ATTEMPTS", 3)),
+            timeout=float(os.getenv("LLM_TIMEOUT", 30)),
+        )
+
+    def backoff(self, attempt, retry_after=None):
+        """
+        Seconds to wait before retry number attempt (1-based).
+        """
+        if retry_after is not None:
+            return min(self.max_delay, retry_after)
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+
+
+class RetryBudget:
+    """
+    Limits the retries of one session to min_retries plus ratio times its requests.
+
+    Parameters:
+    ratio (float): Retries allowed per request, on average.
+    min_retries (int): Retries allowed regardless of the number of requests.
+    """
+
+    def __init__(self, ratio=0.2, min_retries=3):
+        self.ratio = ratio
+        self.min_retries = min_retries
+        self.requests = 0
+        self.retries = 0
+        self._lock = threading.Lock()
+
+    def record_request(self):
+        with self._lock:
+            self.requests += 1
+
+    def try_spend(self):
+        """
+        Take one retry from the budget. Returns False when the budget is exhausted.
+        """
+        with self._lock:
+            if self.retries >= self.min_retries + self.ratio * self.requests:
+                return False
+            self.retries += 1
+            return True
+
+
+class RetryBudgets:
+    """
+    Retry budgets by session id. Only the most recently used max_sessions are kept.
+    """
+
+    def __init__(self, max_sessions=10000, **budget_kwargs):
+        self.max_sessions = max_sessions
+        self.budget_kwargs = budget_kwargs
+        self._budgets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, session_id):
+        with self._lock:
+            budget = self._budgets.get(session_id)
+            if budget is None:
+                budget = self._budgets[session_id] = RetryBudget(**self.budget_kwargs)
+                if len(self._budgets) > self.max_sessions:
+                    self._budgets.popitem(last=False)
+            else:
+                self._budgets.move_to_end(session_id)
+            return budget
+
+
+class CircuitBreaker:
+    """
+    Opens after failure_threshold consecutive provider failures. While open, calls fail
+    immediately. After reset_timeout seconds one trial call is let through: success
+    closes the circuit, failure opens it again.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        ## Ticket of the trial call while the circuit is half open
+        self._trial = None
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """
+        Admit a call.
+
+        Returns:
+        object: None when the call is rejected, otherwise a ticket to pass to release once
+            the call is over, whatever its outcome.
+        """
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+                self._trial = None
+            if self.state == self.HALF_OPEN and self._trial is None:
+                self._trial = object()
+                return self._trial
+            return None
+
+    def release(self, ticket):
+        """
+        End a call admitted by allow. A trial call that neither succeeded nor failed, such as a
+        rejected request or an interrupted call, lets the next call be the trial.
+        """
+        with self._lock:
+            if ticket is not None and ticket is self._trial:
+                self._trial = None
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+            self._trial = None
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+            self._trial = None
+
+
+def is_retryable(error):
+    """
+    Whether an error means the provider is busy or degraded rather than the request being wrong.
+    """
+    if isinstance(error, (openai.APITimeoutError, openai.APIConnectionError, openai.RateLimitError, openai.InternalServerError)):
+        return True
+    if isinstance(error, openai.APIStatusError):
+        return error.status_code == 429 or error.status_code >= 500
+    return isinstance(error, (TimeoutError, asyncio.TimeoutError))
+
+
+def retry_after(error):
+    response = getattr(error, "response", None)
+    value = response.headers.get("retry-after") if response is not None else None
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+class Resilience:
+    """
+    Runs LLM calls with bounded retries, a per-session retry budget and a circuit breaker.
+
+    Parameters:
+    policy (RetryPolicy): Attempts, backoff and timeout.
+    breaker (CircuitBreaker): Shared by all calls to the same provider.
+    """
+
+    def __init__(self, policy=None, breaker=None):
+        self.policy = policy or RetryPolicy()
+        self.breaker = breaker or CircuitBreaker()
+
+    def _before_attempt(self):
+        ticket = self.breaker.allow()
+        if ticket is None:
+            raise LLMUnavailableError("The LLM provider is unavailable, the circuit breaker is open.")
+        return ticket
+
+    def _after_failure(self, error, attempt, budget):
+        """
+        Returns the backoff before the next attempt, or raises when the call is given up.
+        Errors that are not retried say nothing about the provider and leave the breaker as is.
+        """
+        if not is_retryable(error):
+            raise error
+        self.breaker.record_failure()
+        if attempt >= self.policy.max_attempts or (budget is not None and not budget.try_spend()):
+            raise LLMUnavailableError(f"The LLM call failed after {attempt} attempts: {error!r}") from error
+        span = current_span()
+        if span is not None:
+            span.set(retries=attempt)
+        return self.policy.backoff(attempt, retry_after(error))
+
+    def call(self, func, *args, budget=None, **kwargs):
+        """
+        func(*args, **kwargs) with retries. budget is the RetryBudget of the session.
+        """
+        if budget is not None:
+            budget.record_request()
+        attempt = 0
+        while True:
+            attempt += 1
+            ticket = self._before_attempt()
+            try:
+                result = func(*args, **kwargs)
+            except Exception as e:
+                delay = self._after_failure(e, attempt, budget)
+            else:
+                self.breaker.record_success()
+                return result
+            finally:
+                ## Also on errors that are not retried and on interrupts, which record no outcome
+                self.breaker.release(ticket)
+            time.sleep(delay)
+
+    async def acall(self, func, *args, budget=None, **kwargs):
+        """
+        Async version of call for coroutine functions.
+        """
+        if budget is not None:
+            budget.record_request()
+        attempt = 0
+        while True:
+            attempt += 1
+            ticket = self._before_attempt()
+            try:
+                result = await func(*args, **kwargs)
+            except Exception as e:
+                delay = self._after_failure(e, attempt, budget)
+            else:
+                self.breaker.record_success()
+                return result
+            finally:
+                ## Also on errors that are not retried and on cancellation, which record no outcome
+                self.breaker.release(ticket)
+            await asyncio.sleep(delay)
+
+    def wrap(self, func, budget=None):
+        """
+        func with retries, for APIs that take a function to call.
+        """
+        def wrapper(*args, **kwargs):
+            return self.call(func, *args, budget=budget, **kwargs)
+        return wrapper
+
+
+## Shared by every LLM call in the process, so that the circuit breaker sees all failures
+llm_resilience = Resilience(RetryPolicy.from_env())
+
+## Retry budgets of the sessions served by this process
+session_budgets = RetryBudgets()
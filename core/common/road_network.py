@@ -0,0 +1,829 @@
+"""
+Offline road routing for travel duration questions.
+
+RoadNetwork loads a road graph from an OSM-derived edge list into compressed sparse row
+(CSR) arrays: the arcs leaving node i are targets[offsets[i]:offsets[i + 1]], with one
+travel time array per mode of travel. A reverse CSR over the same arcs lets a
+point-to-point query search from both ends.
+
+route() answers on the ContractionHierarchy of the mode, built once by contract() when the
+network is compiled (see compiled_tables.py): two small upward searches that settle a few
+hundred nodes on any network size. Networks loaded without one are searched with a
+bidirectional A* whose potential is the straight-line distance at the top speed of the
+mode, computed only for the nodes the search reaches. Places are matched to their nearest
+routable node through a NodeGrid of latitude and longitude cells.
+
+The edge list is a CSV with one row per OSM way segment:
+
+    source,target,source_lat,source_lon,target_lat,target_lon,length_m,highway,oneway
+
+highway is the OSM highway tag and selects the speed of the segment from the per-mode
+SPEED_PROFILES. A speed of 0 closes the segment to the mode, e.g. motorways to walking.
+oneway ("yes", "-1" or "no") applies to driving and bicycling.
+
+RoadRouter answers compute_travel_duration from the network when ROAD_NETWORK_PATH is set
+and both places have coordinates in the gazetteer. It returns None for everything else,
+so the tools can fall back to the Maps API.
+
+Usage (from the repository root):
+
+    python core/common/road_network.py edges.csv "Sunnyvale" "Mountain View" --mode driving
+
+"""
+
+import argparse
+import csv
+import heapq
+import math
+import os
+import sys
+
+import numpy as np
+
+## Shared modules live in core/common, which is not on the path when this file runs as a script
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from common.compiled_tables import is_compiled, read_tables, write_tables
+from common.gazetteer import Gazetteer
+from common.travel_cache import normalize_mode
+
+MODES = ("driving", "walking", "bicycling")
+
+## Speeds in km/h per OSM highway tag. Tags missing from a profile use its "default".
+SPEED_PROFILES = {
+    "driving": {
+        "motorway": 105, "motorway_link": 60, "trunk": 90, "trunk_link": 50,
+        "primary": 65, "primary_link": 45, "secondary": 55, "secondary_link": 40,
+        "tertiary": 45, "tertiary_link": 35, "unclassified": 40, "residential": 30,
+        "living_street": 10, "service": 20, "road": 30,
+        "footway": 0, "path": 0, "cycleway": 0, "pedestrian": 0, "steps": 0, "track": 15,
+        "default": 30,
+    },
+    "bicycling": {
+        "motorway": 0, "motorway_link": 0, "trunk": 0, "trunk_link": 0,
+        "primary": 18, "secondary": 18, "tertiary": 18, "unclassified": 16, "residential": 16,
+        "living_street": 12, "service": 14, "cycleway": 20, "path": 14, "track": 12,
+        "footway": 6, "pedestrian": 6, "steps": 2,
+        "default": 16,
+    },
+    "walking": {
+        "motorway": 0, "motorway_link": 0, "trunk": 0, "trunk_link": 0,
+        "steps": 2.5,
+        "default": 5,
+    },
+}
+
+## Modes that have to respect one-way streets
+ONEWAY_MODES = ("driving", "bicycling")
+
+EARTH_RADIUS_M = 6371000.0
+
+## Places farther than this from the nearest routable node are outside the network
+MAX_SNAP_DISTANCE_M = 2000.0
+
+## Side of the cells of the nearest node grid in degrees, about 1 km of latitude
+GRID_CELL_DEG = 0.01
+
+## Points farther than this from every node are matched by measuring all nodes
+MAX_GRID_SEARCH_DEG = 1.0
+
+## Nodes a witness search settles before it gives up and keeps the shortcut
+WITNESS_SETTLE_LIMIT = 500
+
+
+def unit_vectors(lat, lon):
+    """
+    Points on the unit sphere. The chord between two of them, times the earth radius, never
+    exceeds the distance along the ground, so it gives an admissible A* heuristic.
+    """
+    lat, lon = np.radians(lat), np.radians(lon)
+    return np.stack([np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)], axis=1)
+
+
+def format_duration(seconds):
+    """
+    Duration in the format of the Distance Matrix API, e.g. "1 hour 5 mins".
+    """
+    minutes = max(1, int(round(seconds / 60)))
+    hours, minutes = divmod(minutes, 60)
+    parts = []
+    if hours:
+        parts.append(f"{hours} hour{'s' if hours > 1 else ''}")
+    if minutes:
+        parts.append(f"{minutes} min{'s' if minutes > 1 else ''}")
+    return " ".join(parts)
+
+
+def _csr(sources, num_nodes):
+    order = np.argsort(sources, kind="stable")
+    offsets = np.zeros(num_nodes + 1, dtype=np.int64)
+    np.cumsum(np.bincount(sources, minlength=num_nodes), out=offsets[1:])
+    return order, offsets
+
+
+def latitudes_longitudes(xyz):
+    """
+    Degrees of latitude and longitude of unit vectors, the inverse of unit_vectors.
+    """
+    return np.degrees(np.arcsin(np.clip(xyz[:, 2], -1, 1))), np.degrees(np.arctan2(xyz[:, 1], xyz[:, 0]))
+
+
+class NodeGrid:
+    """
+    Nodes bucketed into the cells of a latitude and longitude grid, sorted by cell.
+
+    The cells of a grid row are numbered consecutively, so the nodes of a row of cells are
+    one slice of the sorted array. nearest() searches growing squares of cells around the
+    point, found with a binary search per row, instead of measuring every node.
+
+    Parameters:
+    keys (ndarray): Sorted cell number of every node.
+    nodes (ndarray): The nodes, in the order of keys.
+    cell (float): Side of a cell in degrees.
+    """
+
+    def __init__(self, keys, nodes, cell=GRID_CELL_DEG):
+        self.keys = keys
+        self.nodes = nodes
+        self.cell = cell
+        self.columns = int(math.ceil(360 / cell)) + 1
+
+    @classmethod
+    def build(cls, xyz, nodes, cell=GRID_CELL_DEG):
+        lat, lon = latitudes_longitudes(xyz[nodes])
+        columns = int(math.ceil(360 / cell)) + 1
+        keys = np.floor((lat + 90) / cell).astype(np.int64) * columns + np.floor((lon + 180) / cell).astype(np.int64)
+        order = np.argsort(keys, kind="stable")
+        return cls(keys[order], nodes[order].astype(np.int32), cell)
+
+    def nearest(self, xyz, lat, lon):
+        """
+        Returns:
+        tuple: (node, chord) of the node nearest to (lat, lon), the chord on the unit sphere,
+            or (None, inf) for an empty grid.
+        """
+        if len(self.nodes) == 0:
+            return None, math.inf
+        point = unit_vectors(np.array([lat]), np.array([lon]))[0]
+        row, column = int(math.floor((lat + 90) / self.cell)), int(math.floor((lon + 180) / self.cell))
+
+        radius = 1
+        while radius * self.cell <= MAX_GRID_SEARCH_DEG:
+            rows = np.arange(row - radius, row + radius + 1, dtype=np.int64) * self.columns
+            starts = np.searchsorted(self.keys, rows + column - radius, side="left")
+            ends = np.searchsorted(self.keys, rows + column + radius, side="right")
+            candidates = np.concatenate([self.nodes[start:end] for start, end in zip(starts.tolist(), ends.tolist())])
+            if len(candidates):
+                chords = np.linalg.norm(xyz[candidates] - point, axis=1)
+                best = int(np.argmin(chords))
+                ## Nodes outside the square are at least radius cells away, in latitude or in longitude
+                edge = math.radians(radius * self.cell)
+                widest = math.radians(min(abs(lat) + (radius + 1) * self.cell, 90.0))
+                bound = 2 * math.sin(edge / 2) * min(1.0, math.cos(widest))
+                if chords[best] <= bound:
+                    return int(candidates[best]), float(chords[best])
+            radius *= 2
+
+        ## Far from every node: measure them all
+        chords = np.linalg.norm(xyz[self.nodes] - point, axis=1)
+        best = int(np.argmin(chords))
+        return int(self.nodes[best]), float(chords[best])
+
+
+class ContractionHierarchy:
+    """
+    Contraction hierarchy of a RoadNetwork for one mode of travel.
+
+    Nodes are contracted one at a time, least important first. Contracting a node removes it
+    and adds a shortcut between two of its neighbors wherever the path through it is the
+    only shortest one, found with a bounded witness search. A query then runs two Dijkstra
+    searches that only climb to nodes contracted later: upward arcs from the source, and
+    downward arcs backward from the target. On road networks each settles a few hundred
+    nodes, however far apart the places are.
+
+    Arcs are stored at their lower end, in two CSRs: the upward arcs leaving a node and the
+    downward arcs entering it. A shortcut keeps the node it bypasses, which route() uses to
+    expand it back into the arcs of the network.
+
+    Parameters:
+    rank (ndarray): Contraction order of every node.
+    up_offsets, up_targets, up_weights, up_middles (ndarray): Upward arcs, by lower end.
+    down_offsets, down_sources, down_weights, down_middles (ndarray): Downward arcs, by lower end.
+        middles is -1 for the arcs of the network and the bypassed node for shortcuts.
+    """
+
+    ARRAYS = ("rank", "up_offsets", "up_targets", "up_weights", "up_middles", "down_offsets", "down_sources", "down_weights", "down_middles")
+
+    def __init__(self, rank, up_offsets, up_targets, up_weights, up_middles, down_offsets, down_sources, down_weights, down_middles):
+        self.rank = rank
+        self.up_offsets = up_offsets
+        self.up_targets = up_targets
+        self.up_weights = up_weights
+        self.up_middles = up_middles
+        self.down_offsets = down_offsets
+        self.down_sources = down_sources
+        self.down_weights = down_weights
+        self.down_middles = down_middles
+        ## Arcs of the nodes queries have settled, as lists. Every query climbs to the same few
+        ## top nodes, whose many arcs are then not read from the arrays again.
+        self._up_arcs = {}
+        self._down_arcs = {}
+        ## Bypassed node of the arcs route() has unpacked, by (from, to)
+        self._middles = {}
+
+    @classmethod
+    def build(cls, network, mode, witness_limit=WITNESS_SETTLE_LIMIT):
+        """
+        Contract every node of the network for the mode. Takes minutes on large networks,
+        so it runs when the network is compiled, not when it is opened.
+        """
+        num_nodes = network.num_nodes
+        weights = network.weights[mode]
+        open_arcs = np.isfinite(weights)
+        sources = network._arc_sources()[open_arcs].tolist()
+        targets = network.targets[open_arcs].tolist()
+
+        ## Remaining graph as dicts of neighbor -> (seconds, bypassed node), the cheapest of parallel arcs
+        out = [{} for _ in range(num_nodes)]
+        into = [{} for _ in range(num_nodes)]
+        for u, v, w in zip(sources, targets, weights[open_arcs].astype(np.float64).tolist()):
+            if u != v and w < out[u].get(v, (math.inf,))[0]:
+                out[u][v] = into[v][u] = (w, -1)
+
+        def witness_distances(u, skipped, limit):
+            ## Dijkstra from u without the node being contracted, up to limit seconds and witness_limit nodes
+            distances, heap, settled = {u: 0.0}, [(0.0, u)], 0
+            while heap and settled < witness_limit:
+                distance, node = heapq.heappop(heap)
+                if distance > limit:
+                    break
+                if distance > distances[node]:
+                    continue
+                settled += 1
+                for neighbor, (w, _) in out[node].items():
+                    candidate = distance + w
+                    if neighbor != skipped and candidate < distances.get(neighbor, math.inf):
+                        distances[neighbor] = candidate
+                        heapq.heappush(heap, (candidate, neighbor))
+            return distances
+
+        def shortcuts(node):
+            found = []
+            outgoing = out[node]
+            for u, (w_in, _) in into[node].items():
+                costs = [(v, w_in + w_out) for v, (w_out, _) in outgoing.items() if v != u]
+                if not costs:
+                    continue
+                distances = witness_distances(u, node, max(cost for _, cost in costs))
+                found.extend((u, v, cost) for v, cost in costs if distances.get(v, math.inf) > cost)
+            return found
+
+        ## Edge difference, plus the contracted neighbors and their depth, keep the hierarchy shallow and even
+        contracted_neighbors = [0] * num_nodes
+        depth = [0] * num_nodes
+
+        def priority(node, found):
+            return 2 * (len(found) - len(out[node]) - len(into[node])) + contracted_neighbors[node] + depth[node]
+
+        heap = [(priority(node, shortcuts(node)), node) for node in range(num_nodes)]
+        heapq.heapify(heap)
+
+        rank = np.zeros(num_nodes, dtype=np.int32)
+        up = [None] * num_nodes
+        down = [None] * num_nodes
+        for order in range(num_nodes):
+            while True:
+                _, node = heapq.heappop(heap)
+                found = shortcuts(node)
+                current = priority(node, found)
+                ## Lazy update: contract the node only if it is still the least important
+                if not heap or current <= heap[0][0]:
+                    break
+                heapq.heappush(heap, (current, node))
+
+            rank[node] = order
+            up[node] = [(v, w, middle) for v, (w, middle) in out[node].items()]
+            down[node] = [(u, w, middle) for u, (w, middle) in into[node].items()]
+            for v in out[node]:
+                del into[v][node]
+            for u in into[node]:
+                del out[u][node]
+            for u, v, cost in found:
+                if cost < out[u].get(v, (math.inf,))[0]:
+                    out[u][v] = into[v][u] = (cost, node)
+            for neighbor in set(out[node]) | set(into[node]):
+                contracted_neighbors[neighbor] += 1
+                depth[neighbor] = max(depth[neighbor], depth[node] + 1)
+            out[node] = into[node] = None
+
+        return cls(rank, *cls._pack(up), *cls._pack(down))
+
+    @staticmethod
+    def _pack(arcs):
+        counts = np.array([len(node_arcs) for node_arcs in arcs], dtype=np.int64)
+        offsets = np.zeros(len(arcs) + 1, dtype=np.int64)
+        np.cumsum(counts, out=offsets[1:])
+        flat = [arc for node_arcs in arcs for arc in node_arcs]
+        ends = np.array([arc[0] for arc in flat], dtype=np.int32)
+        weights = np.array([arc[1] for arc in flat], dtype=np.float64)
+        middles = np.array([arc[2] for arc in flat], dtype=np.int32)
+        return offsets, ends, weights, middles
+
+    def up_arcs(self, node):
+        """
+        (higher node, seconds, bypassed node) of the upward arcs leaving node.
+        """
+        arcs = self._up_arcs.get(node)
+        if arcs is None:
+            start, end = self.up_offsets[node], self.up_offsets[node + 1]
+            arcs = self._up_arcs[node] = list(zip(
+                self.up_targets[start:end].tolist(), self.up_weights[start:end].tolist(), self.up_middles[start:end].tolist()
+            ))
+        return arcs
+
+    def down_arcs(self, node):
+        """
+        (higher node, seconds, bypassed node) of the downward arcs entering node.
+        """
+        arcs = self._down_arcs.get(node)
+        if arcs is None:
+            start, end = self.down_offsets[node], self.down_offsets[node + 1]
+            arcs = self._down_arcs[node] = list(zip(
+                self.down_sources[start:end].tolist(), self.down_weights[start:end].tolist(), self.down_middles[start:end].tolist()
+            ))
+        return arcs
+
+    def route(self, source, target):
+        """
+        Fastest route between two nodes, see RoadNetwork.route.
+        """
+        searches = (
+            ## (arcs to relax, distances, parents, heap, arcs to stall on)
+            (self.up_arcs, {source: 0.0}, {source: None}, [(0.0, source)], self.down_arcs),
+            (self.down_arcs, {target: 0.0}, {target: None}, [(0.0, target)], self.up_arcs),
+        )
+        best, meeting = (0.0, source) if source == target else (math.inf, None)
+        inf = math.inf
+        heappop, heappush = heapq.heappop, heapq.heappush
+
+        side = 0
+        while True:
+            ## A search is done once its smallest key reaches the best route so far, the two alternate otherwise
+            forward, backward = searches[0][3], searches[1][3]
+            forward_open = bool(forward) and forward[0][0] < best
+            backward_open = bool(backward) and backward[0][0] < best
+            if not (forward_open or backward_open):
+                break
+            side = (1 - side) if forward_open and backward_open else (0 if forward_open else 1)
+            arcs, distances, parents, heap, stall_arcs = searches[side]
+            other_distances = searches[1 - side][1]
+
+            distance, node = heappop(heap)
+            if distance > distances[node]:
+                continue
+            other = other_distances.get(node)
+            if other is not None and distance + other < best:
+                best, meeting = distance + other, node
+
+            ## Stall on demand: a node reached cheaper through a higher node is not on a shortest up-down route
+            stalled = False
+            for higher, w, _ in stall_arcs(node):
+                if distances.get(higher, inf) + w < distance:
+                    stalled = True
+                    break
+            if stalled:
+                continue
+
+            for neighbor, w, _ in arcs(node):
+                candidate = distance + w
+                if candidate < distances.get(neighbor, inf):
+                    distances[neighbor] = candidate
+                    parents[neighbor] = node
+                    heappush(heap, (candidate, neighbor))
+
+        if meeting is None:
+            return None
+
+        ## Nodes of the hierarchy from the source up to the meeting node and down to the target
+        upward, node = [], meeting
+        while node is not None:
+            upward.append(node)
+            node = searches[0][2][node]
+        upward.reverse()
+        node = searches[1][2][meeting]
+        downward = []
+        while node is not None:
+            downward.append(node)
+            node = searches[1][2][node]
+        hops = upward + downward
+
+        path = [source]
+        for u, v in zip(hops, hops[1:]):
+            self._expand(u, v, path)
+        return best, path
+
+    def _middle(self, u, v):
+        middle = self._middles.get((u, v))
+        if middle is None:
+            ## The arc between u and v is stored at the lower of the two
+            arcs, higher = (self.up_arcs(u), v) if self.rank[u] < self.rank[v] else (self.down_arcs(v), u)
+            middle = self._middles[u, v] = next(middle for end, _, middle in arcs if end == higher)
+        return middle
+
+    def _expand(self, u, v, path):
+        ## Append the network nodes after u on the arc from u to v, unpacking shortcuts
+        stack = [(u, v)]
+        while stack:
+            a, b = stack.pop()
+            middle = self._middle(a, b)
+            if middle < 0:
+                path.append(b)
+            else:
+                stack.append((middle, b))
+                stack.append((a, middle))
+
+
+class RoadNetwork:
+    """
+    Road graph in CSR arrays with travel times per mode.
+
+    Parameters:
+    node_ids (ndarray): OSM id of every node.
+    xyz (ndarray): Unit vectors of the nodes, see unit_vectors.
+    offsets, targets (ndarray): Forward CSR.
+    reverse_offsets, reverse_targets (ndarray): CSR of the reversed arcs.
+    weights (dict): Seconds per forward arc, by mode. inf closes an arc to the mode.
+    reverse_weights (dict): The same, in the order of the reverse CSR.
+    lengths (ndarray): Meters per forward arc.
+    max_speeds (dict): m/s per mode for the heuristic. Derived from the arcs when not given.
+    routable (dict): Routable nodes per mode. Derived from the arcs when not given.
+    grids (dict): NodeGrid of the routable nodes per mode. Built on first use when not given.
+    hierarchies (dict): ContractionHierarchy per mode, see contract. Modes without one are
+        routed with bidirectional A*.
+    """
+
+    ## Arrays that are the same for every mode
+    ARRAYS = ("node_ids", "xyz", "offsets", "targets", "reverse_offsets", "reverse_targets", "lengths")
+
+    def __init__(self, node_ids, xyz, offsets, targets, reverse_offsets, reverse_targets, weights, reverse_weights, lengths, max_speeds=None, routable=None, grids=None, hierarchies=None):
+        self.node_ids = node_ids
+        self.xyz = xyz
+        self.offsets = offsets
+        self.targets = targets
+        self.reverse_offsets = reverse_offsets
+        self.reverse_targets = reverse_targets
+        self.weights = weights
+        self.reverse_weights = reverse_weights
+        self.lengths = lengths
+        ## Fastest speed in m/s, per mode, that keeps the straight-line heuristic admissible
+        self.max_speeds = max_speeds or {mode: self._max_speed(mode) for mode in weights}
+        ## Nodes with at least one open arc, per mode. Places are only snapped onto these.
+        self.routable = routable or {
+            mode: np.bincount(self._arc_sources()[np.isfinite(w)], minlength=len(node_ids)) > 0
+            for mode, w in weights.items()
+        }
+        self.grids = grids or {}
+        self.hierarchies = hierarchies or {}
+
+    @property
+    def num_nodes(self):
+        return len(self.node_ids)
+
+    @property
+    def num_arcs(self):
+        return len(self.targets)
+
+    def _arc_sources(self):
+        return np.repeat(np.arange(self.num_nodes), np.diff(self.offsets))
+
+    def _max_speed(self, mode):
+        weights = self.weights[mode]
+        open_arcs = np.isfinite(weights) & (weights > 0)
+        if not open_arcs.any():
+            return 1.0
+        ## Straight-line meters per second of travel time, at most the top speed of the profile
+        chords = np.linalg.norm(self.xyz[self._arc_sources()[open_arcs]] - self.xyz[self.targets[open_arcs]], axis=1) * EARTH_RADIUS_M
+        return max(float(np.max(chords / weights[open_arcs])), 1e-3)
+
+    @classmethod
+    def open(cls, path):
+        """
+        Network from a compiled file (see compiled_tables) or else from an edge list CSV.
+        """
+        return cls.load(path) if is_compiled(path) else cls.from_csv(path)
+
+    @classmethod
+    def load(cls, path):
+        """
+        Network memory-mapped from a file written by save.
+        """
+        arrays, _, meta = read_tables(path, "roads")
+        by_mode = {prefix: {mode: arrays[f"{prefix}.{mode}"] for mode in meta["modes"]} for prefix in ("weights", "reverse_weights", "routable")}
+        ## Files compiled before grids and hierarchies were stored build the grids on first use and route with A*
+        grids = {
+            mode: NodeGrid(arrays[f"grid_keys.{mode}"], arrays[f"grid_nodes.{mode}"], meta["grid_cell"])
+            for mode in meta["modes"] if f"grid_keys.{mode}" in arrays
+        }
+        hierarchies = {
+            mode: ContractionHierarchy(*(arrays[f"hierarchy.{mode}.{name}"] for name in ContractionHierarchy.ARRAYS))
+            for mode in meta.get("hierarchy_modes", [])
+        }
+        return cls(
+            **{name: arrays[name] for name in cls.ARRAYS},
+            weights=by_mode["weights"],
+            reverse_weights=by_mode["reverse_weights"],
+            routable=by_mode["routable"],
+            max_speeds=meta["max_speeds"],
+            grids=grids,
+            hierarchies=hierarchies,
+        )
+
+    def save(self, path):
+        """
+        Write the network into a compiled file that load maps into memory.
+        """
+        arrays = {name: getattr(self, name) for name in self.ARRAYS}
+        for mode in self.weights:
+            arrays[f"weights.{mode}"] = self.weights[mode]
+            arrays[f"reverse_weights.{mode}"] = self.reverse_weights[mode]
+            arrays[f"routable.{mode}"] = self.routable[mode]
+            grid = self.grid(mode)
+            arrays[f"grid_keys.{mode}"], arrays[f"grid_nodes.{mode}"] = grid.keys, grid.nodes
+        for mode, hierarchy in self.hierarchies.items():
+            for name in ContractionHierarchy.ARRAYS:
+                arrays[f"hierarchy.{mode}.{name}"] = getattr(hierarchy, name)
+        meta = {"modes": list(self.weights), "max_speeds": self.max_speeds, "grid_cell": GRID_CELL_DEG, "hierarchy_modes": list(self.hierarchies)}
+        write_tables(path, "roads", arrays, meta=meta)
+
+    def contract(self, modes=None):
+        """
+        Build the contraction hierarchies that route() uses, for the given modes or all of them.
+        """
+        for mode in modes or self.weights:
+            self.hierarchies[mode] = ContractionHierarchy.build(self, mode)
+
+    @classmethod
+    def from_csv(cls, path, profiles=SPEED_PROFILES):
+        """
+        Build the network from an edge list, see the module docstring for the columns.
+        """
+        columns = {name: [] for name in ("source", "target", "source_lat", "source_lon", "target_lat", "target_lon", "length_m", "highway", "oneway")}
+        with open(path, newline="", encoding="utf-8") as f:
+            for row in csv.DictReader(f):
+                for name, values in columns.items():
+                    values.append(row.get(name) or "")
+        return cls.from_edges(
+            sources=np.array(columns["source"], dtype=np.int64),
+            targets=np.array(columns["target"], dtype=np.int64),
+            source_coordinates=np.array([columns["source_lat"], columns["source_lon"]], dtype=np.float64).T,
+            target_coordinates=np.array([columns["target_lat"], columns["target_lon"]], dtype=np.float64).T,
+            lengths=np.array(columns["length_m"], dtype=np.float64),
+            highways=columns["highway"],
+            oneways=columns["oneway"],
+            profiles=profiles,
+        )
+
+    @classmethod
+    def from_edges(cls, sources, targets, source_coordinates, target_coordinates, lengths, highways, oneways, profiles=SPEED_PROFILES):
+        """
+        Build the network from edge arrays. Every edge becomes an arc in each direction.
+        """
+        ## Dense node numbers in place of the OSM ids
+        node_ids, inverse = np.unique(np.concatenate([sources, targets]), return_inverse=True)
+        num_edges = len(sources)
+        u, v = inverse[:num_edges], inverse[num_edges:]
+        coordinates = np.zeros((len(node_ids), 2))
+        coordinates[u] = source_coordinates
+        coordinates[v] = target_coordinates
+
+        oneway = np.array([str(value).strip().lower() for value in oneways])
+        forward_closed = oneway == "-1"
+        backward_closed = np.isin(oneway, ["yes", "true", "1"])
+
+        arc_sources = np.concatenate([u, v])
+        arc_targets = np.concatenate([v, u])
+        arc_lengths = np.concatenate([lengths, lengths]).astype(np.float32)
+
+        highway_names, highway_index = np.unique(np.array([str(h).strip().lower() for h in highways]), return_inverse=True)
+        weights = {}
+        for mode, profile in profiles.items():
+            ## m/s per highway tag, then per edge
+            speeds = np.array([profile.get(name, profile["default"]) for name in highway_names], dtype=np.float64) / 3.6
+            edge_speeds = speeds[highway_index]
+            with np.errstate(divide="ignore"):
+                edge_seconds = np.where(edge_speeds > 0, lengths / np.where(edge_speeds > 0, edge_speeds, 1), np.inf)
+            arc_seconds = np.concatenate([edge_seconds, edge_seconds])
+            if mode in ONEWAY_MODES:
+                arc_seconds[:num_edges][forward_closed] = np.inf
+                arc_seconds[num_edges:][backward_closed] = np.inf
+            weights[mode] = arc_seconds.astype(np.float32)
+
+        ## Arcs closed to every mode are dropped
+        keep = np.zeros(len(arc_sources), dtype=bool)
+        for arc_seconds in weights.values():
+            keep |= np.isfinite(arc_seconds)
+        arc_sources, arc_targets, arc_lengths = arc_sources[keep], arc_targets[keep], arc_lengths[keep]
+        weights = {mode: arc_seconds[keep] for mode, arc_seconds in weights.items()}
+
+        order, offsets = _csr(arc_sources, len(node_ids))
+        reverse_order, reverse_offsets = _csr(arc_targets, len(node_ids))
+        return cls(
+            node_ids=node_ids,
+            xyz=unit_vectors(coordinates[:, 0], coordinates[:, 1]),
+            offsets=offsets,
+            targets=arc_targets[order].astype(np.int32),
+            reverse_offsets=reverse_offsets,
+            reverse_targets=arc_sources[reverse_order].astype(np.int32),
+            weights={mode: w[order] for mode, w in weights.items()},
+            reverse_weights={mode: w[reverse_order] for mode, w in weights.items()},
+            lengths=arc_lengths[order],
+        )
+
+    def nearest_node(self, lat, lon, mode):
+        """
+        Returns:
+        tuple: (node, meters) for the nearest node with an arc open to the mode, or (None, inf).
+        """
+        node, chord = self.grid(mode).nearest(self.xyz, lat, lon)
+        return node, chord * EARTH_RADIUS_M
+
+    def grid(self, mode):
+        """
+        The NodeGrid of the nodes routable for the mode.
+        """
+        if mode not in self.grids:
+            self.grids[mode] = NodeGrid.build(self.xyz, np.flatnonzero(self.routable[mode]))
+        return self.grids[mode]
+
+    def route(self, source, target, mode):
+        """
+        Fastest route between two nodes.
+
+        Returns:
+        tuple: (seconds, nodes) with the nodes of the route from source to target, or None
+            when target cannot be reached.
+        """
+        if source == target:
+            return 0.0, [source]
+        if mode in self.hierarchies:
+            return self.hierarchies[mode].route(source, target)
+
+        ## Average of the forward and backward heuristics, which is consistent for both searches.
+        ## Computed when a search first pushes a node, and shared by both.
+        scale = EARTH_RADIUS_M / self.max_speeds[mode] / 2
+        xyz = self.xyz
+        source_xyz, target_xyz = xyz[source].tolist(), xyz[target].tolist()
+        potentials = {}
+
+        def potential(node):
+            value = potentials.get(node)
+            if value is None:
+                point = xyz[node].tolist()
+                value = potentials[node] = (math.dist(point, target_xyz) - math.dist(point, source_xyz)) * scale
+            return value
+
+        searches = (
+            ## (offsets, targets, weights, sign of the potential, distances, parents, heap, settled)
+            [self.offsets, self.targets, self.weights[mode], 1.0, {source: 0.0}, {source: None}, [], set()],
+            [self.reverse_offsets, self.reverse_targets, self.reverse_weights[mode], -1.0, {target: 0.0}, {target: None}, [], set()],
+        )
+        searches[0][6].append((potential(source), source))
+        searches[1][6].append((-potential(target), target))
+
+        best, meeting = math.inf, None
+        while searches[0][6] and searches[1][6]:
+            ## Every path through an unsettled node costs at least the sum of the two smallest keys
+            if searches[0][6][0][0] + searches[1][6][0][0] >= best:
+                break
+            search = searches[0] if len(searches[0][6]) <= len(searches[1][6]) else searches[1]
+            other = searches[1] if search is searches[0] else searches[0]
+            offsets, targets, weights, sign, distances, parents, heap, settled = search
+
+            _, node = heapq.heappop(heap)
+            if node in settled:
+                continue
+            settled.add(node)
+
+            start, end = offsets[node], offsets[node + 1]
+            base = distances[node]
+            for neighbor, cost in zip(targets[start:end].tolist(), weights[start:end].tolist()):
+                ## Closed arcs cost inf and never improve a distance
+                distance = base + cost
+                if distance < distances.get(neighbor, math.inf):
+                    distances[neighbor] = distance
+                    parents[neighbor] = node
+                    heapq.heappush(heap, (distance + sign * potential(neighbor), neighbor))
+                    if neighbor in other[4] and distance + other[4][neighbor] < best:
+                        best, meeting = distance + other[4][neighbor], neighbor
+
+        if meeting is None:
+            return None
+
+        path = []
+        node = meeting
+        while node is not None:
+            path.append(node)
+            node = searches[0][5][node]
+        path.reverse()
+        node = searches[1][5][meeting]
+        while node is not None:
+            path.append(node)
+            node = searches[1][5][node]
+        return best, path
+
+    def path_length(self, path):
+        """
+        Meters along a route returned by route().
+        """
+        meters = 0.0
+        for u, v in zip(path, path[1:]):
+            start, end = self.offsets[u], self.offsets[u + 1]
+            arcs = start + np.flatnonzero(self.targets[start:end] == v)
+            meters += float(self.lengths[arcs].min())
+        return meters
+
+
+class RoadRouter:
+    """
+    Travel durations between gazetteer places on a RoadNetwork.
+
+    Parameters:
+    network (RoadNetwork): None makes every lookup return None.
+    gazetteer (Gazetteer): Resolves place names to coordinates.
+    """
+
+    def __init__(self, network, gazetteer):
+        self.network = network
+        self.gazetteer = gazetteer
+        self.answered = 0
+        self.declined = 0
+
+    @classmethod
+    def from_env(cls, gazetteer):
+        """
+        Router over the network at ROAD_NETWORK_PATH, compiled or an edge list. Without it the
+        router declines every lookup.
+        """
+        path = os.getenv("ROAD_NETWORK_PATH")
+        return cls(RoadNetwork.open(path) if path else None, gazetteer)
+
+    def travel_time(self, origin, destination, mode_of_travel):
+        """
+        Returns:
+        float: Seconds from origin to destination, or None when the network cannot tell.
+        """
+        result = self.route(origin, destination, mode_of_travel)
+        return result[0] if result is not None else None
+
+    def route(self, origin, destination, mode_of_travel):
+        """
+        Returns:
+        tuple: (seconds, nodes) of the fastest route from origin to destination, or None when
+            the network cannot tell.
+        """
+        mode = normalize_mode(mode_of_travel)
+        if self.network is None or mode not in self.network.weights:
+            return self._decline()
+
+        nodes = []
+        for place in (origin, destination):
+            location = self.gazetteer.location(place)
+            if location is None:
+                return self._decline()
+            node, distance = self.network.nearest_node(*location, mode)
+            if node is None or distance > MAX_SNAP_DISTANCE_M:
+                return self._decline()
+            nodes.append(node)
+
+        result = self.network.route(nodes[0], nodes[1], mode)
+        if result is None:
+            return self._decline()
+        self.answered += 1
+        return result
+
+    def duration_text(self, origin, destination, mode_of_travel):
+        """
+        Travel duration formatted like the Distance Matrix API, or None.
+        """
+        seconds = self.travel_time(origin, destination, mode_of_travel)
+        return format_duration(seconds) if seconds is not None else None
+
+    def _decline(self):
+        self.declined += 1
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Travel duration between two places on an offline road network.")
+    parser.add_argument("edges", help="OSM-derived edge list CSV, or the network compiled from it")
+    parser.add_argument("origin")
+    parser.add_argument("destination")
+    parser.add_argument("--mode", default="driving", choices=MODES)
+    args = parser.parse_args()
+
+    router = RoadRouter(RoadNetwork.open(args.edges), Gazetteer.from_env())
+    print(router.duration_text(args.origin, args.destination, args.mode) or "No route found")
+
+
+if __name__ == "__main__":
+    main()
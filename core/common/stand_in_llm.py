@@ -0,0 +1,317 @@
+"""
+Deterministic local stand-in for the OpenAI chat completions endpoint.
+
+The evaluation harness runs large datasets through the variants. Against the live API that
+costs money and the answers vary from run to run. StandInLLM patches the same client
+methods as the cassettes and answers every chat completion locally, in a few microseconds
+and always the same way:
+
+- after a user query it picks the tool for the query with the keyword rules of the intent
+  router, and fills the arguments it finds in the query or in earlier tool calls of the
+  conversation. Missing required arguments are asked for.
+- when the agent does not have that tool but can transfer to an agent that has it, or back
+  to the triage, it calls the transfer tool, and picks again once the transfer is done.
+- after a tool result it answers with the result.
+
+Usage is estimated at four characters per token. The stand-in is not a model of the quality
+of the real LLM. It exercises the routing, tool execution and history code of the variants
+and makes changes to them measurable offline, see evaluation.py. Prompt changes need the
+live API.
+"""
+
+import asyncio
+import json
+import re
+import time
+import uuid
+
+from openai.resources.chat.completions import AsyncCompletions, Completions
+from openai.types.chat import ChatCompletion, ChatCompletionChunk
+
+from common.intent_router import IntentRouter, TRAFFIC_UPDATES, TRANSIT_DETAILS, TRAVEL_DURATION
+
+CHARS_PER_TOKEN = 4
+
+## Tools that serve an intent, preferred first. Transfer tools hand the query to the agent that has the tool.
+TOOLS_BY_INTENT = {
+    TRAVEL_DURATION: ["compute_travel_duration", "transfer_to_travel_duration_agent"],
+    TRAFFIC_UPDATES: ["traffic_condition", "transfer_to_traffic_updates_agent"],
+    TRANSIT_DETAILS: ["find_route", "transfer_to_transit_details_agent", "transfer_to_transit_schedule_agent"],
+}
+SCHEDULE_TOOLS = ["find_transit_schedule", "transfer_to_transit_details_agent", "transfer_to_transit_schedule_agent"]
+OTHER_TOOLS = ["transfer_to_other_queries_agent"]
+TRANSFER_BACK = "transfer_back_to_triage_agent"
+SCHEDULE_WORDS = re.compile(r"\b(schedule|schedules|timetable|departures?|leaves?|leaving|next)\b", re.IGNORECASE)
+
+## Mode of travel named in a query, first match wins
+MODES = [
+    (r"\b(drive|driving|car)\b", "driving"),
+    (r"\b(walk|walking|on foot)\b", "walking"),
+    (r"\b(cycle|cycling|bike|biking|bicycle)\b", "bicycling"),
+    (r"\b(bus|buses)\b", "bus"),
+    (r"\b(train|trains|caltrain|rail)\b", "train"),
+    (r"\b(tram|trams|light rail)\b", "tram"),
+    (r"\b(subway|metro|bart)\b", "subway"),
+    (r"\bferry\b", "ferry"),
+]
+
+## Where a place name ends
+_END = r"(?=\s+(?:by|via|on|using|in|at|with|today|tomorrow|tonight|now|right now)\b|[?!;]|\.(?:\s|$)|$)"
+FROM_TO = re.compile(rf"\bfrom\s+(?P<origin>.+?)\s+to\s+(?P<destination>.+?){_END}")
+BETWEEN = re.compile(rf"\bbetween\s+(?P<origin>.+?)\s+and\s+(?P<destination>.+?){_END}")
+## Without "from", only capitalized names count as places, so "to go" and "to cycle" do not
+TO = re.compile(rf"\b(?:to|for)\s+(?P<destination>[A-Z0-9].*?){_END}")
+ROUTE_NUMBER = re.compile(r"\b(?:route|line|bus|train|number)\s+#?(?P<number>[A-Za-z]?\d+[A-Za-z]?)\b")
+## Words that refer back to the last destination
+ANAPHORA = {"there", "here", "that place"}
+
+OTHER_ANSWER = "I can tell you travel times, traffic conditions, and transit routes and schedules."
+
+
+def _message(message):
+    if hasattr(message, "model_dump"):
+        message = message.model_dump(exclude_none=True)
+    return message
+
+
+def _text(content):
+    if isinstance(content, list):
+        return " ".join(part.get("text", "") for part in content if isinstance(part, dict))
+    return content or ""
+
+
+def _tool_names(tools):
+    return [tool["function"]["name"] for tool in tools or [] if tool.get("type") == "function"]
+
+
+def _is_transfer(name):
+    return name.startswith("transfer_")
+
+
+def _earlier_calls(messages):
+    """
+    Name and arguments of every tool call of the conversation, in order.
+    """
+    calls = []
+    for message in messages:
+        for call in message.get("tool_calls") or []:
+            try:
+                arguments = json.loads(call["function"].get("arguments") or "{}")
+            except json.JSONDecodeError:
+                arguments = {}
+            calls.append((call["function"]["name"], arguments if isinstance(arguments, dict) else {}))
+    return calls
+
+
+def extract_arguments(query, messages):
+    """
+    Values for the usual tool parameters, from the query or else from the conversation.
+
+    Returns:
+    dict: Parameter name -> value, for the parameters a value was found for.
+    """
+    context = {}
+    for _, arguments in _earlier_calls(messages):
+        context.update({name: value for name, value in arguments.items() if isinstance(value, str) and value})
+    for message in messages:
+        if message.get("role") == "tool":
+            match = ROUTE_NUMBER.search(_text(message.get("content")))
+            if match:
+                context["route_number"] = match.group("number")
+
+    values = {}
+    match = FROM_TO.search(query) or BETWEEN.search(query) or TO.search(query)
+    if match:
+        values.update({name: value.strip(" ,") for name, value in match.groupdict().items()})
+    if values.get("origin", "").lower() in ANAPHORA:
+        values["origin"] = context.get("destination", values["origin"])
+    values.setdefault("origin", context.get("origin"))
+    values.setdefault("destination", context.get("destination"))
+
+    for pattern, mode in MODES:
+        if re.search(pattern, query, re.IGNORECASE):
+            values["mode_of_travel"] = mode
+            break
+    else:
+        values["mode_of_travel"] = context.get("mode_of_travel")
+
+    number = ROUTE_NUMBER.search(query)
+    values["route_number"] = number.group("number") if number else context.get("route_number")
+    if values["origin"] and values["destination"]:
+        values["route"] = f"{values['origin']} to {values['destination']}"
+    else:
+        values["route"] = context.get("route")
+    return {name: value for name, value in values.items() if value}
+
+
+class StandInLLM:
+    """
+    Answers chat completions locally while installed. See the module docstring.
+
+    Parameters:
+    latency (float): Seconds every completion takes, to keep the timing of a run realistic.
+    """
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.intent_router = IntentRouter()
+        self.calls = 0
+        self._originals = {}
+
+    def __enter__(self):
+        self.install()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.uninstall()
+
+    def install(self):
+        stand_in = self
+
+        def create(completions, *args, **kwargs):
+            time.sleep(stand_in.latency)
+            return stand_in.create(**kwargs)
+
+        async def acreate(completions, *args, **kwargs):
+            await asyncio.sleep(stand_in.latency)
+            response = stand_in.create(**kwargs)
+            return _AsyncStream(response) if isinstance(response, _Stream) else response
+
+        self._originals = {"create": Completions.create, "acreate": AsyncCompletions.create}
+        Completions.create = create
+        AsyncCompletions.create = acreate
+
+    def uninstall(self):
+        if not self._originals:
+            return
+        Completions.create = self._originals["create"]
+        AsyncCompletions.create = self._originals["acreate"]
+        self._originals = {}
+
+    def create(self, messages, tools=None, stream=False, model="stand-in", **kwargs):
+        self.calls += 1
+        messages = [_message(message) for message in messages]
+        content, tool_calls = self.respond(messages, tools)
+
+        prompt_tokens = len(json.dumps([messages, tools], default=str)) // CHARS_PER_TOKEN
+        completion_tokens = 1 + len(json.dumps([content, tool_calls])) // CHARS_PER_TOKEN
+        message = {"role": "assistant", "content": content}
+        if tool_calls:
+            message["tool_calls"] = tool_calls
+        response = {
+            "id": f"chatcmpl-{uuid.uuid4().hex[:12]}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{"index": 0, "message": message, "finish_reason": "tool_calls" if tool_calls else "stop"}],
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens, "total_tokens": prompt_tokens + completion_tokens},
+        }
+        return _Stream(response) if stream else ChatCompletion.model_validate(response)
+
+    def respond(self, messages, tools):
+        """
+        Returns:
+        tuple: (content, tool_calls). One of them is None.
+        """
+        queries = [_text(message.get("content")) for message in messages if message.get("role") == "user"]
+        query = queries[-1] if queries else ""
+        names = _tool_names(tools)
+
+        if messages and messages[-1].get("role") == "tool":
+            ## A transfer just happened, so this agent picks the tool for the query. Otherwise answer with the results.
+            issued = next((message for message in reversed(messages) if message.get("tool_calls")), {})
+            transferred = all(_is_transfer(call["function"]["name"]) for call in issued.get("tool_calls", []))
+            if not transferred:
+                results = []
+                for message in reversed(messages):
+                    if message.get("role") != "tool":
+                        break
+                    results.append(_text(message.get("content")))
+                return " ".join(reversed(results)), None
+            ## Never hand the query back to an agent it already passed through
+            since_query = messages[max(i for i, message in enumerate(messages) if message.get("role") == "user"):]
+            transferred_by = {name for name, _ in _earlier_calls(since_query)}
+            names = [name for name in names if name not in transferred_by and name != TRANSFER_BACK]
+
+        tool = self.pick_tool(query, names)
+        if tool is None:
+            return OTHER_ANSWER, None
+
+        schema = next(t["function"] for t in tools if t["function"]["name"] == tool)
+        parameters = schema.get("parameters") or {}
+        values = extract_arguments(query, messages)
+        arguments = {name: values[name] for name in parameters.get("properties", {}) if name in values}
+        missing = [name for name in parameters.get("required", []) if name not in arguments]
+        if missing:
+            return f"Could you tell me the {' and the '.join(name.replace('_', ' ') for name in missing)}?", None
+
+        call = {"id": f"call_{uuid.uuid4().hex[:12]}", "type": "function", "function": {"name": tool, "arguments": json.dumps(arguments)}}
+        return None, [call]
+
+    def pick_tool(self, query, names):
+        """
+        The offered tool for the intent of the query, or None.
+        """
+        intents = self.intent_router.rule_matches(query)
+        if len(intents) == 1:
+            candidates = TOOLS_BY_INTENT[intents[0]]
+            if intents[0] == TRANSIT_DETAILS and SCHEDULE_WORDS.search(query):
+                candidates = SCHEDULE_TOOLS
+        else:
+            return next((name for name in OTHER_TOOLS if name in names), None)
+        ## An agent without the tool hands a query it cannot answer back to the triage
+        return next((name for name in candidates + [TRANSFER_BACK] if name in names), None)
+
+
+class _Stream:
+    """
+    A completion served as stream chunks: content word by word, then the tool calls and the usage.
+    """
+
+    def __init__(self, response):
+        self.response = response
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+    def close(self):
+        pass
+
+    def chunks(self):
+        response = self.response
+        base = {"id": response["id"], "object": "chat.completion.chunk", "created": response["created"], "model": response["model"]}
+        choice = response["choices"][0]
+        message = choice["message"]
+        deltas = [{"content": word} for word in re.findall(r"\S+\s*", message["content"] or "")]
+        for index, call in enumerate(message.get("tool_calls") or []):
+            deltas.append({"tool_calls": [{"index": index, "id": call["id"], "type": "function", "function": {"name": call["function"]["name"], "arguments": call["function"]["arguments"]}}]})
+        deltas = [{"role": "assistant", **delta} if i == 0 else delta for i, delta in enumerate(deltas)]
+        for delta in deltas:
+            yield ChatCompletionChunk.model_validate({**base, "choices": [{"index": 0, "delta": delta}]})
+        yield ChatCompletionChunk.model_validate({**base, "choices": [{"index": 0, "delta": {}, "finish_reason": choice["finish_reason"]}]})
+        yield ChatCompletionChunk.model_validate({**base, "choices": [], "usage": response["usage"]})
+
+    def __iter__(self):
+        return self.chunks()
+
+
+class _AsyncStream(_Stream):
+
+    def __init__(self, stream):
+        super().__init__(stream.response)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        pass
+
+    async def close(self):
+        pass
+
+    async def __aiter__(self):
+        for chunk in self.chunks():
+            yield chunk
@@ -0,0 +1,151 @@
+"""
+Streaming output for the assistants.
+
+stream_message prints content tokens as they arrive and assembles the streamed tool-call
+deltas into complete tool calls. Each tool call is handed to the executor as soon as its
+arguments have finished streaming, which is when the next tool call starts or the stream
+ends, so tools run while the model is still generating the rest of the message.
+
+stream_graph does the same for the LangGraph assistants. It renders only what is new in a
+turn: tokens from the "messages" stream and the messages each node adds from the "updates"
+stream. The node that is running comes from the stream metadata, so no checkpoint is read.
+
+"""
+
+import contextvars
+
+from openai.types.chat import ChatCompletionMessage
+
+
+def stream_message(client, executor, execute, print_prefix="Assistant:", create=None, **kwargs):
+    """
+    Run a streaming chat completion.
+
+    Parameters:
+    client (OpenAI): Client used for the request.
+    executor (Executor): Runs the tool calls.
+    execute (function): Called as execute(tool_call) in the executor for every tool call.
+    print_prefix (str): Printed before the first content token.
+    create (function): Opens the stream, client.chat.completions.create by default.
+        Only opening the stream is retried, a partly printed message is never repeated.
+    kwargs: Arguments for chat.completions.create.
+
+    Returns:
+    tuple: (message, futures, usage). message is the assembled ChatCompletionMessage,
+        futures holds one Future per tool call in the order of message.tool_calls and usage
+        is the token usage reported at the end of the stream.
+    """
+    create = create or client.chat.completions.create
+    stream = create(
+        stream=True,
+        stream_options={"include_usage": True},
+        **kwargs,
+    )
+
+    content = []
+    tool_calls = {}
+    futures = {}
+    usage = None
+
+    def submit(index):
+        call = tool_calls[index]
+        tool_call = _to_message(None, [call]).tool_calls[0]
+        ## Run in a copy of the current context so that tool spans keep their parent
+        futures[index] = executor.submit(contextvars.copy_context().run, execute, tool_call)
+
+    for chunk in stream:
+        if chunk.usage is not None:
+            usage = chunk.usage
+        if not chunk.choices:
+            continue
+        delta = chunk.choices[0].delta
+
+        if delta.content:
+            if not content:
+                print(print_prefix, end=" ", flush=True)
+            content.append(delta.content)
+            print(delta.content, end="", flush=True)
+
+        for call_delta in delta.tool_calls or []:
+            index = call_delta.index
+            if index not in tool_calls:
+                ## A new tool call starts, so the arguments of the previous ones are complete
+                for previous in tool_calls:
+                    if previous not in futures:
+                        submit(previous)
+                tool_calls[index] = {"id": "", "type": "function", "function": {"name": "", "arguments": ""}}
+
+            call = tool_calls[index]
+            if call_delta.id:
+                call["id"] = call_delta.id
+            if call_delta.function is not None:
+                call["function"]["name"] += call_delta.function.name or ""
+                call["function"]["arguments"] += call_delta.function.arguments or ""
+
+    if content:
+        print(flush=True)
+
+    for index in tool_calls:
+        if index not in futures:
+            submit(index)
+
+    ordered = sorted(tool_calls)
+    message = _to_message("".join(content) or None, [tool_calls[i] for i in ordered])
+    return message, [futures[i] for i in ordered], usage
+
+
+def _to_message(content, tool_calls):
+    return ChatCompletionMessage.model_validate({
+        "role": "assistant",
+        "content": content,
+        "tool_calls": tool_calls or None,
+    })
+
+
+def stream_graph(graph, inputs, config, print_prefix="Assistant:"):
+    """
+    Run a LangGraph graph for one turn and print its output incrementally.
+
+    Parameters:
+    graph (CompiledGraph): Graph to run.
+    inputs (dict): Graph input, e.g. the new user message.
+    config (dict): Config with the thread_id of the conversation.
+    print_prefix (str): Printed before the content of every assistant message.
+
+    Returns:
+    str: The last node that ran.
+    """
+    node = None
+    streaming_id = None
+    streamed = set()
+
+    for mode, chunk in graph.stream(inputs, config, stream_mode=["messages", "updates"]):
+        if mode == "messages":
+            message, metadata = chunk
+            node = metadata.get("langgraph_node", node)
+            if message.type == "AIMessageChunk" and isinstance(message.content, str) and message.content:
+                if message.id != streaming_id:
+                    if streaming_id is not None:
+                        print(flush=True)
+                    print(print_prefix, end=" ", flush=True)
+                    streaming_id = message.id
+                    streamed.add(message.id)
+                print(message.content, end="", flush=True)
+            continue
+
+        for node, values in chunk.items():
+            messages = (values or {}).get("messages", [])
+            for message in messages if isinstance(messages, list) else [messages]:
+                if message.id in streamed:
+                    if message.id == streaming_id:
+                        print(flush=True)
+                        streaming_id = None
+                elif message.type == "ai" and message.content:
+                    ## Not streamed, e.g. served from the completion cache
+                    print(print_prefix, message.content)
+                for call in getattr(message, "tool_calls", None) or []:
+                    print(f"{node}: {call['name']}({call['args']})")
+
+    if streaming_id is not None:
+        print(flush=True)
+    return node
@@ -0,0 +1,78 @@
+import csv
+import math
+import os
+import random
+import sys
+
+import pytest
+
+## Shared modules live in core/common
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from common.road_network import MODES, RoadNetwork
+
+SIZE = 12
+HIGHWAYS = ("motorway", "primary", "residential", "footway", "cycleway")
+
+
+def write_grid(path):
+    ## A grid of mixed roads, some one-way and some closed to a mode, about 100 m apart
+    rng = random.Random(7)
+    with open(path, "w", newline="") as file:
+        writer = csv.writer(file)
+        writer.writerow(["source", "target", "source_lat", "source_lon", "target_lat", "target_lon", "length_m", "highway", "oneway"])
+        for i in range(SIZE):
+            for j in range(SIZE):
+                for k, l in ((i + 1, j), (i, j + 1)):
+                    if k < SIZE and l < SIZE:
+                        writer.writerow([
+                            i * SIZE + j, k * SIZE + l, 37.4 + i * 0.001, -122.1 + j * 0.001, 37.4 + k * 0.001, -122.1 + l * 0.001,
+                            rng.uniform(80, 160), rng.choice(HIGHWAYS), rng.choice(("no", "no", "yes", "-1")),
+                        ])
+
+
+def path_seconds(network, path, mode):
+    seconds = 0.0
+    for u, v in zip(path, path[1:]):
+        start, end = network.offsets[u], network.offsets[u + 1]
+        arcs = [float(w) for target, w in zip(network.targets[start:end], network.weights[mode][start:end]) if target == v]
+        seconds += min(arcs)
+    return seconds
+
+
+@pytest.fixture(scope="module")
+def networks(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp("roads") / "edges.csv")
+    write_grid(path)
+    contracted = RoadNetwork.from_csv(path)
+    contracted.contract()
+    return RoadNetwork.from_csv(path), contracted
+
+
+@pytest.mark.parametrize("mode", MODES)
+def test_hierarchy_routes_match_a_star(networks, mode):
+    plain, contracted = networks
+    pairs = [(source, target) for source in range(0, plain.num_nodes, 7) for target in range(3, plain.num_nodes, 11)]
+    for source, target in pairs:
+        expected, found = plain.route(source, target, mode), contracted.route(source, target, mode)
+        if expected is None:
+            assert found is None
+            continue
+        seconds, path = found
+        assert seconds == pytest.approx(expected[0], rel=1e-6)
+        assert path[0] == source and path[-1] == target
+        assert path_seconds(contracted, path, mode) == pytest.approx(seconds, rel=1e-6)
+
+
+def test_compiled_network_keeps_hierarchies(networks, tmp_path):
+    _, contracted = networks
+    contracted.save(str(tmp_path / "roads.bin"))
+    opened = RoadNetwork.open(str(tmp_path / "roads.bin"))
+
+    assert set(opened.hierarchies) == set(contracted.hierarchies)
+    for mode in opened.hierarchies:
+        expected = contracted.route(0, SIZE * SIZE - 1, mode)
+        found = opened.route(0, SIZE * SIZE - 1, mode)
+        assert (found is None) == (expected is None)
+        if found is not None:
+            assert found[0] == pytest.approx(expected[0]) and not math.isinf(found[0])
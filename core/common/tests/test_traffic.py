@@ -0,0 +1,38 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+## Shared modules live in core/common
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from common.traffic import TrafficStore, traffic_level
+
+NOW = 1_700_000_000.0
+
+
+def make_store(free_flow):
+    return TrafficStore(["a", "b"], [1000.0, 1000.0], free_flow)
+
+
+def test_unknown_segment_is_left_out():
+    ## Segment b has no free-flow speed and no fresh sample
+    store = make_store([np.nan, np.nan])
+    store.apply(np.array([0, 0]), np.array([20.0, 100.0], dtype=np.float32), np.array([NOW, NOW]))
+
+    result = store.delay([0, 1], now=NOW)
+    assert result["observed"] == 1
+    ## 1 km at the mean of 60 km/h against the fastest sample of 100 km/h
+    assert result["free_flow"] == pytest.approx(36.0)
+    assert result["delay"] == pytest.approx(60.0 - 36.0)
+    assert traffic_level(result["delay"], result["free_flow"]) != "light"
+
+
+def test_known_free_flow_without_samples_counts():
+    store = make_store([100.0, 50.0])
+    store.apply(np.array([0]), np.array([50.0], dtype=np.float32), np.array([NOW]))
+
+    result = store.delay([0, 1], now=NOW)
+    assert result["free_flow"] == pytest.approx(36.0 + 72.0)
+    assert result["delay"] == pytest.approx(72.0 - 36.0)
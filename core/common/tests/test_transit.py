@@ -0,0 +1,53 @@
+import datetime
+import os
+import sys
+
+## Shared modules live in core/common
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from common.gazetteer import Gazetteer
+from common.transit import TransitFeed, TransitRouter, transit_route_types
+
+## A train and a slower bus between the same two stops
+FEED = {
+    "agency.txt": "agency_id,agency_name,agency_url,agency_timezone\n1,Test,http://example.com,America/Los_Angeles\n",
+    "stops.txt": "stop_id,stop_name,stop_lat,stop_lon,parent_station\nA,Alpha,37.40,-122.10,\nB,Beta,37.50,-122.20,\n",
+    "routes.txt": "route_id,route_short_name,route_long_name,route_type\nrail,X,Express,2\nbus,22,,3\n",
+    "trips.txt": "route_id,service_id,trip_id\nrail,daily,rail_1\nbus,daily,bus_1\n",
+    "stop_times.txt": (
+        "trip_id,arrival_time,departure_time,stop_id,stop_sequence\n"
+        "rail_1,08:00:00,08:00:00,A,1\nrail_1,08:10:00,08:10:00,B,2\n"
+        "bus_1,08:05:00,08:05:00,A,1\nbus_1,08:40:00,08:40:00,B,2\n"
+    ),
+}
+
+
+def make_router(tmp_path):
+    for name, content in FEED.items():
+        (tmp_path / name).write_text(content)
+    return TransitRouter(TransitFeed.from_gtfs(str(tmp_path)), Gazetteer())
+
+
+def test_route_types_of_transit_modes():
+    assert transit_route_types("bus") == (3, 11)
+    assert transit_route_types("Train") == (2,)
+    assert transit_route_types("transit") is None
+    assert transit_route_types("car") is False
+
+
+def test_bus_itinerary_excludes_rail(tmp_path):
+    router = make_router(tmp_path)
+    when = datetime.datetime(2024, 5, 6, 7, 55)
+
+    ## The train arrives first, but a bus was asked for
+    assert "route 22 " in router.route_text("Alpha", "Beta", "bus", when)
+    assert "route X " in router.route_text("Alpha", "Beta", "train", when)
+    assert "route X " in router.route_text("Alpha", "Beta", "transit", when)
+
+
+def test_bus_schedule_excludes_rail(tmp_path):
+    router = make_router(tmp_path)
+    when = datetime.datetime(2024, 5, 6, 7, 55)
+
+    assert router.schedule_text("X", "bus", when=when) is None
+    assert "leaves at" in router.schedule_text("X", "train", when=when)
@@ -0,0 +1,142 @@
+"""
+Tool node for the LangGraph assistants.
+
+ConcurrentToolNode runs the tool calls of one AIMessage at the same time on a bounded,
+process-wide thread pool, each with its own timeout. Every call gets its own ToolMessage:
+the result, or an error for just that call when it raises, times out or names an unknown
+tool. The calls that succeeded are kept, so the LLM only retries the failed one instead of
+the whole batch, as with ToolNode(...).with_fallbacks(...).
+
+"""
+
+import asyncio
+import contextvars
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+
+from langchain_core.messages import AIMessage, ToolMessage
+from langchain_core.tools import BaseTool
+from langchain_core.tools import tool as as_tool
+from langgraph.utils.runnable import RunnableCallable
+
+from common.tracing import tracer
+
+DEFAULT_TOOL_WORKERS = 8
+
+_shared_executor = None
+_shared_executor_lock = threading.Lock()
+
+
+def get_tool_executor():
+    """
+    The thread pool shared by the tool nodes of every graph in the process. TOOL_WORKERS
+    bounds the tool calls running at the same time, 8 by default.
+    """
+    global _shared_executor
+    with _shared_executor_lock:
+        if _shared_executor is None:
+            workers = int(os.getenv("TOOL_WORKERS", DEFAULT_TOOL_WORKERS))
+            _shared_executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="tool")
+    return _shared_executor
+
+
+def error_message(call, content):
+    return ToolMessage(content=content, name=call["name"], tool_call_id=call["id"], status="error")
+
+
+class ConcurrentToolNode(RunnableCallable):
+    """
+    Runs the tool calls of the last AIMessage in the state concurrently, isolating their errors.
+
+    A call that takes longer than its timeout is reported back to the LLM as an error. The
+    worker thread itself cannot be cancelled and finishes in the background.
+
+    Parameters:
+    tools (list): LangChain tools or plain functions.
+    timeouts (dict): Seconds per tool name.
+    default_timeout (float): Seconds for the other tools. None waits indefinitely.
+    executor (Executor): Runs the calls, the shared pool of get_tool_executor by default.
+    name (str): Name of the node.
+    """
+
+    def __init__(self, tools, timeouts=None, default_timeout=None, executor=None, name="tools"):
+        super().__init__(self._func, self._afunc, name=name, trace=False)
+        self.tools_by_name = {}
+        for tool in tools:
+            if not isinstance(tool, BaseTool):
+                tool = as_tool(tool)
+            self.tools_by_name[tool.name] = tool
+        self.timeouts = timeouts or {}
+        self.default_timeout = default_timeout
+        self.executor = executor
+
+    def _tool_calls(self, state):
+        messages = state.get("messages", []) if isinstance(state, dict) else state
+        if not messages or not isinstance(messages[-1], AIMessage):
+            raise ValueError("No AIMessage found in input")
+        return messages[-1].tool_calls
+
+    def _timeout(self, call):
+        return self.timeouts.get(call["name"], self.default_timeout)
+
+    def _invalid(self, call):
+        if call["name"] in self.tools_by_name:
+            return None
+        names = ", ".join(self.tools_by_name)
+        return error_message(call, f"Error: {call['name']} is not a valid tool, try one of [{names}].")
+
+    def _run_one(self, call, config):
+        try:
+            with tracer.span(call["name"], "tool_call"):
+                message = self.tools_by_name[call["name"]].invoke({**call, "type": "tool_call"}, config)
+        except Exception as e:
+            return error_message(call, f"Error: {repr(e)}\n please fix your mistakes.")
+        if not isinstance(message.content, (str, list)):
+            message.content = str(message.content)
+        return message
+
+    def _submit(self, executor, call, config):
+        ## Run in a copy of the current context so that tool spans keep their parent
+        return executor.submit(contextvars.copy_context().run, self._run_one, call, config)
+
+    def _func(self, state, config):
+        calls = self._tool_calls(state)
+        executor = self.executor or get_tool_executor()
+        start = time.monotonic()
+        invalid = [self._invalid(call) for call in calls]
+        futures = [None if error else self._submit(executor, call, config) for call, error in zip(calls, invalid)]
+
+        outputs = []
+        for call, error, future in zip(calls, invalid, futures):
+            if error is not None:
+                outputs.append(error)
+                continue
+            ## Timeouts run from submission, so calls that ran side by side are not waited for in turn
+            timeout = self._timeout(call)
+            remaining = None if timeout is None else max(0.0, start + timeout - time.monotonic())
+            try:
+                outputs.append(future.result(remaining))
+            except FutureTimeoutError:
+                outputs.append(error_message(call, f"Error: {call['name']} did not finish within {timeout} seconds."))
+        return {"messages": outputs}
+
+    async def _arun_one(self, call, config, executor):
+        invalid = self._invalid(call)
+        if invalid is not None:
+            return invalid
+        timeout = self._timeout(call)
+        loop = asyncio.get_running_loop()
+        try:
+            return await asyncio.wait_for(
+                loop.run_in_executor(executor, contextvars.copy_context().run, self._run_one, call, config), timeout
+            )
+        except asyncio.TimeoutError:
+            return error_message(call, f"Error: {call['name']} did not finish within {timeout} seconds.")
+
+    async def _afunc(self, state, config):
+        calls = self._tool_calls(state)
+        executor = self.executor or get_tool_executor()
+        outputs = await asyncio.gather(*(self._arun_one(call, config, executor) for call in calls))
+        return {"messages": list(outputs)}
@@ -0,0 +1,197 @@
+"""
+Tool registry and tool-call helpers shared by the OpenAI-native assistants.
+
+ToolRegistry compiles the schemas, dispatch table and argument validators of a list of tools
+once. The helpers run the tool calls of one assistant message concurrently, each with a
+timeout whose expiry is reported back to the LLM as an error.
+
+function_to_schema is adapted from https://cookbook.openai.com/examples/orchestrating_agents?utm_source=www.therundown.ai&utm_medium=newsletter&utm_campaign=anthropic-ceo-predicts-ai-utopia&_bhlid=db30852b7747db2f62cd8fde276efcf151c6c21a
+
+MIT License
+
+Copyright (c) 2023 OpenAI
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+"""
+
+import json
+import inspect
+import asyncio
+import concurrent.futures
+
+async def execute_tool_call_async(execute, tool_call, timeout=None):
+    """
+    Execute a tool call in a worker thread so that several calls can run at the same time.
+    A call that takes longer than timeout seconds is reported back to the LLM as an error.
+    The worker thread itself cannot be cancelled and finishes in the background.
+
+    Parameters:
+    execute (function): Called as execute(tool_call) in the worker thread.
+    """
+    try:
+        return await asyncio.wait_for(asyncio.to_thread(execute, tool_call), timeout)
+    except asyncio.TimeoutError:
+        return f"Error: {tool_call.function.name} did not finish within {timeout} seconds."
+
+def collect_tool_result(future, tool_call, timeout=None):
+    """
+    Wait for a tool call submitted to an executor.
+    A call that takes longer than timeout seconds is reported back to the LLM as an error.
+    """
+    try:
+        return future.result(timeout)
+    except concurrent.futures.TimeoutError:
+        return f"Error: {tool_call.function.name} did not finish within {timeout} seconds."
+
+async def execute_tool_calls_async(execute, tool_calls, timeouts=None, default_timeout=None):
+    """
+    Execute all tool calls of one assistant message concurrently.
+    timeouts maps tool names to seconds, other tools use default_timeout.
+    Results are returned in the order of tool_calls.
+    """
+    timeouts = timeouts or {}
+    return await asyncio.gather(
+        *(
+            execute_tool_call_async(execute, tool_call, timeouts.get(tool_call.function.name, default_timeout))
+            for tool_call in tool_calls
+        )
+    )
+
+def function_to_schema(func) -> dict:
+    type_map = {
+        str: "string",
+        int: "integer",
+        float: "number",
+        bool: "boolean",
+        list: "array",
+        dict: "object",
+        type(None): "null",
+    }
+
+    try:
+        signature = inspect.signature(func)
+    except ValueError as e:
+        raise ValueError(
+            f"Failed to get signature for function {func.__name__}: {str(e)}"
+        )
+
+    parameters = {}
+    for param in signature.parameters.values():
+        try:
+            param_type = type_map.get(param.annotation, "string")
+        except KeyError as e:
+            raise KeyError(
+                f"Unknown type annotation {param.annotation} for parameter {param.name}: {str(e)}"
+            )
+        parameters[param.name] = {"type": param_type}
+
+    required = [
+        param.name
+        for param in signature.parameters.values()
+        if param.default == inspect._empty
+    ]
+
+    return {
+        "type": "function",
+        "function": {
+            "name": func.__name__,
+            "description": (func.__doc__ or "").strip(),
+            "parameters": {
+                "type": "object",
+                "properties": parameters,
+                "required": required,
+            },
+        },
+    }
+
+## JSON schema types and the Python values that satisfy them
+JSON_TYPE_CHECKS = {
+    "string": lambda v: isinstance(v, str),
+    "integer": lambda v: isinstance(v, int) and not isinstance(v, bool),
+    "number": lambda v: isinstance(v, (int, float)) and not isinstance(v, bool),
+    "boolean": lambda v: isinstance(v, bool),
+    "array": lambda v: isinstance(v, list),
+    "object": lambda v: isinstance(v, dict),
+    "null": lambda v: v is None,
+}
+
+class ToolRegistry:
+    """
+    Tool schemas, dispatch table and argument validators, compiled once for a list of tools.
+    """
+
+    def __init__(self, tools):
+        self.tools = list(tools)
+        self.schemas = [function_to_schema(tool) for tool in self.tools]
+        self.tool_map = {tool.__name__: tool for tool in self.tools}
+        self.validators = {
+            tool.__name__: self._compile_validator(tool, schema["function"]["parameters"])
+            for tool, schema in zip(self.tools, self.schemas)
+        }
+
+    @staticmethod
+    def _compile_validator(func, schema):
+        signature = inspect.signature(func)
+
+        ## Unannotated parameters are advertised as strings but accept any value
+        types = {
+            param.name: schema["properties"][param.name]["type"]
+            if param.annotation is not inspect._empty else None
+            for param in signature.parameters.values()
+            if param.kind not in (param.VAR_POSITIONAL, param.VAR_KEYWORD)
+        }
+        accepts_any = any(param.kind == param.VAR_KEYWORD for param in signature.parameters.values())
+
+        return {"types": types, "required": schema["required"], "accepts_any": accepts_any}
+
+    def parse_arguments(self, name, arguments):
+        """
+        Decode and validate the JSON arguments of a tool call.
+
+        Returns:
+        tuple: (args, error). error is None when the arguments are valid, otherwise a
+            message for the LLM describing what is wrong.
+        """
+        validator = self.validators.get(name)
+        if validator is None:
+            return None, f"Error: unknown tool {name}. Available tools: {', '.join(self.tool_map)}."
+
+        try:
+            args = json.loads(arguments or "{}")
+        except json.JSONDecodeError as e:
+            return None, f"Error: arguments for {name} are not valid JSON ({e.msg}). Please fix your mistakes."
+
+        if not isinstance(args, dict):
+            return None, f"Error: arguments for {name} must be a JSON object. Please fix your mistakes."
+
+        problems = [f"missing argument '{param}'" for param in validator["required"] if param not in args]
+        for param, value in args.items():
+            if param not in validator["types"]:
+                if not validator["accepts_any"]:
+                    problems.append(f"unexpected argument '{param}'")
+                continue
+            expected = validator["types"][param]
+            if expected is not None and not JSON_TYPE_CHECKS[expected](value):
+                problems.append(f"argument '{param}' must be of type {expected}")
+
+        if problems:
+            return None, f"Error: invalid arguments for {name}: {'; '.join(problems)}. Please fix your mistakes."
+
+        return args, None
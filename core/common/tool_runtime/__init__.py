@@ -0,0 +1,23 @@
+"""
+Shared runtime behind the tools of all four assistants.
+
+compute_travel_duration, traffic_condition, find_route and find_transit_schedule are
+answered here once, for every variant: the OpenAI-native functions and the LangChain @tool
+wrappers in the variants are thin adapters over the process-wide runtime. Place names are
+canonicalized by the gazetteer, then the backends are asked in order (TOOL_BACKENDS):
+
+    local   road network, GTFS feed and live traffic, when configured
+    maps    Google Maps Distance Matrix API, when GOOGLE_MAPS_API_KEY is set
+    stub    hard-coded answers, so every tool always answers
+
+Travel durations of the local and Maps backends go through the shared SQLite travel
+duration cache. When several variants run in one process, for example behind
+graph_server.py, they share the gazetteer, the engines, the cache, the Maps connection pool
+and the metrics.
+
+"""
+
+from common.tool_runtime.backends import LocalBackend, MapsBackend, StubBackend, ToolBackend
+from common.tool_runtime.runtime import ToolRuntime, get_tool_runtime
+
+__all__ = ["ToolBackend", "LocalBackend", "MapsBackend", "StubBackend", "ToolRuntime", "get_tool_runtime"]
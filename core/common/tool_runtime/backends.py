@@ -0,0 +1,157 @@
+"""
+Backends of the tool runtime.
+
+A backend answers some of the tools and declines the others by returning None. The
+runtime asks its backends in order and the first answer wins. A backend that raises is
+skipped like one that declines. Fallback backends are only asked for the tools that no
+other backend is configured to answer.
+
+"""
+
+from common.maps_batch import DistanceMatrixBatcher
+
+
+class ToolBackend:
+    """
+    Declines every tool. Backends override the tools they answer.
+
+    Attributes:
+    name (str): Name in metrics and spans.
+    external (bool): Calls a paid external API. Skipped when a tool call asks for local answers only.
+    cacheable (bool): Travel durations it answers may be stored in the travel duration cache.
+    fallback (bool): Answers made up without data. Only asked when no other backend answers the tool.
+    """
+
+    name = "none"
+    external = False
+    cacheable = True
+    fallback = False
+
+    def answers(self, tool):
+        """
+        Whether the backend is configured to answer the tool at all.
+        """
+        return getattr(type(self), tool) is not getattr(ToolBackend, tool)
+
+    def compute_travel_duration(self, origin, destination, mode_of_travel):
+        return None
+
+    def traffic_condition(self, route):
+        return None
+
+    def find_route(self, origin, destination, mode_of_travel):
+        return None
+
+    def find_transit_schedule(self, route_number, mode_of_travel, stop=None):
+        return None
+
+    def stats(self):
+        return {}
+
+
+class LocalBackend(ToolBackend):
+    """
+    The offline engines: road network, GTFS feed and live traffic. Each one declines when
+    it is not configured.
+    """
+
+    name = "local"
+
+    def __init__(self, road_router, transit_router, traffic_monitor):
+        self.road_router = road_router
+        self.transit_router = transit_router
+        self.traffic_monitor = traffic_monitor
+
+    def answers(self, tool):
+        if tool == "compute_travel_duration":
+            return self.road_router.network is not None
+        if tool == "traffic_condition":
+            return self.traffic_monitor.store is not None
+        return self.transit_router.feed is not None
+
+    def compute_travel_duration(self, origin, destination, mode_of_travel):
+        duration = self.road_router.duration_text(origin, destination, mode_of_travel)
+        if duration is None:
+            return None
+        return f'Time to travel from  {origin} to {destination} by {mode_of_travel} is {duration}.'
+
+    def traffic_condition(self, route):
+        return self.traffic_monitor.condition_text(route)
+
+    def find_route(self, origin, destination, mode_of_travel):
+        return self.transit_router.route_text(origin, destination, mode_of_travel)
+
+    def find_transit_schedule(self, route_number, mode_of_travel, stop=None):
+        return self.transit_router.schedule_text(route_number, mode_of_travel, stop)
+
+
+class MapsBackend(ToolBackend):
+    """
+    Travel durations from the Google Maps Distance Matrix API. Concurrent lookups share
+    batched requests over one HTTP connection pool.
+
+    Parameters:
+    api_key (str): Google Maps API key.
+    gazetteer (Gazetteer): Learns the addresses the API resolves names to.
+    """
+
+    name = "maps"
+    external = True
+
+    def __init__(self, api_key, gazetteer):
+        self.distance_matrix = DistanceMatrixBatcher(api_key)
+        self.gazetteer = gazetteer
+
+    def compute_travel_duration(self, origin, destination, mode_of_travel):
+        response = self.distance_matrix.lookup(origin, destination, mode_of_travel)
+        if response['status'] != 'OK':
+            ## Quota, key or server errors say nothing about the trip. The next backend is asked.
+            raise RuntimeError(f"Distance Matrix request failed with status {response['status']}")
+        origin_address = response['origin_address']
+        destination_address = response['destination_address']
+
+        ## The next lookup of the same names is resolved locally
+        self.gazetteer.learn(origin, origin_address)
+        self.gazetteer.learn(destination, destination_address)
+
+        status = response['element']['status']
+        if status == 'OK':
+            duration = response['element']['duration']['text']
+            return f'Time to travel from  {origin_address} to {destination_address} by {mode_of_travel} is {duration}.'
+
+        ## The API answered for this trip, e.g. ZERO_RESULTS or NOT_FOUND. Say so rather than let a later backend guess.
+        if not origin_address:
+            reason = 'not enough information to determine the origin address'
+        elif not destination_address:
+            reason = 'not enough information to determine the destination address'
+        else:
+            reason = f'Google Maps found no {mode_of_travel} route ({status})'
+        return f'Could not compute the travel time from {origin} to {destination} by {mode_of_travel}: {reason}.'
+
+    def stats(self):
+        return self.distance_matrix.stats()
+
+
+class StubBackend(ToolBackend):
+    """
+    Hard-coded answers, so that every tool answers without data or API keys. Never cached,
+    and only asked for the tools that no other backend is configured to answer.
+    """
+
+    name = "stub"
+    cacheable = False
+    fallback = True
+
+    def compute_travel_duration(self, origin, destination, mode_of_travel):
+        ## Time is hard-coded. In reality, this would be an API call.
+        return f'Time to travel from  {origin} to {destination} by {mode_of_travel} is 1 hour.'
+
+    def traffic_condition(self, route):
+        return f'There is heavey traffic between cityA and cityB on {route}, which could add 20 minutes to the journey'
+
+    def find_route(self, origin, destination, mode_of_travel):
+        ## Route number is hard-coded
+        return "425"
+
+    def find_transit_schedule(self, route_number, mode_of_travel, stop=None):
+        return f'The next {route_number} {mode_of_travel} leaves at 10.30AM. Next one is scheduled at 11.30 AM.'
@@ -0,0 +1,219 @@
+"""
+The tool runtime: canonical place names, backends in order of preference, the travel
+duration cache and metrics, behind the four tools of the assistants.
+
+"""
+
+import os
+import threading
+from collections import Counter
+
+from common.gazetteer import Gazetteer
+from common.road_network import RoadRouter
+from common.traffic import TrafficMonitor
+from common.tracing import tracer
+from common.transit import TransitRouter
+from common.travel_cache import DEFAULT_CACHE_PATH, TravelDurationCache
+from common.tool_runtime.backends import LocalBackend, MapsBackend, StubBackend
+
+DEFAULT_BACKENDS = "local,maps,stub"
+
+
+class ToolRuntime:
+    """
+    Answers the tools from the first backend that does not decline. A backend that raises is
+    counted as an error and the next one is asked. When every backend configured for a tool
+    raises or declines, the tool says that it could not answer. Fallback backends such as the
+    stub only answer the tools that no other backend is configured for.
+
+    Parameters:
+    gazetteer (Gazetteer): Canonicalizes the places in tool arguments.
+    backends (list): ToolBackends, most preferred first.
+    travel_cache (TravelDurationCache): Stores the travel durations of cacheable backends.
+        None disables caching.
+    """
+
+    def __init__(self, gazetteer, backends, travel_cache=None):
+        self.gazetteer = gazetteer
+        self.backends = backends
+        self.travel_cache = travel_cache
+        ## (tool, backend name) -> number of answers
+        self.answers = Counter()
+        ## (tool, backend name) -> number of exceptions
+        self.errors = Counter()
+        ## tool -> number of answers made up by a fallback backend
+        self.fallbacks = Counter()
+        ## tool -> number of calls that no configured backend answered
+        self.unanswered = Counter()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        """
+        Runtime configured by the environment.
+
+        TOOL_BACKENDS orders the backends, "local,maps,stub" by default. The Maps backend
+        needs GOOGLE_MAPS_API_KEY, the offline engines are configured by ROAD_NETWORK_PATH,
+        GTFS_PATH and TRAFFIC_FEED. TRAVEL_CACHE_PATH relocates the travel duration cache.
+        """
+        ## Canonical place names, so that one place spelled differently shares cache entries and Maps lookups
+        gazetteer = Gazetteer.from_env()
+        road_router = RoadRouter.from_env(gazetteer)
+        available = {
+            "local": lambda: LocalBackend(road_router, TransitRouter.from_env(gazetteer), TrafficMonitor.from_env(road_router)),
+            "maps": lambda: MapsBackend(os.getenv("GOOGLE_MAPS_API_KEY"), gazetteer) if os.getenv("GOOGLE_MAPS_API_KEY") else None,
+            "stub": StubBackend,
+        }
+
+        backends = []
+        for name in os.getenv("TOOL_BACKENDS", DEFAULT_BACKENDS).split(","):
+            name = name.strip()
+            if name not in available:
+                raise ValueError(f"Unknown tool backend {name!r} in TOOL_BACKENDS, expected some of {', '.join(available)}")
+            backend = available[name]()
+            if backend is not None:
+                backends.append(backend)
+
+        ## Shared by every assistant process on this machine
+        travel_cache = TravelDurationCache(os.getenv("TRAVEL_CACHE_PATH", DEFAULT_CACHE_PATH))
+        return cls(gazetteer, backends, travel_cache)
+
+    def _configured(self, tool, backends):
+        return [backend for backend in backends if not backend.fallback and backend.answers(tool)]
+
+    def _answer(self, tool, args, backends, failed):
+        """
+        Ask the backends in order.
+
+        Parameters:
+        failed (list): Collects the names of the backends that raised.
+
+        Returns:
+        str: The first answer, or None when every backend raised or declined.
+        """
+        for backend in backends:
+            try:
+                with tracer.span(backend.name, "tool_backend", tool=tool):
+                    answer = getattr(backend, tool)(*args)
+            except Exception:
+                ## The span records the exception. A failing backend must not fail the tool call.
+                with self._lock:
+                    self.errors[(tool, backend.name)] += 1
+                failed.append(backend.name)
+                continue
+            if answer is not None:
+                with self._lock:
+                    self.answers[(tool, backend.name)] += 1
+                return answer
+        return None
+
+    def _fallback(self, tool, args, backends):
+        ## A separate stage, so that made-up answers show up in /metrics next to the real ones
+        for backend in backends:
+            if backend.fallback and backend.answers(tool):
+                with tracer.span(backend.name, "tool_fallback", tool=tool):
+                    answer = getattr(backend, tool)(*args)
+                with self._lock:
+                    self.fallbacks[tool] += 1
+                    self.answers[(tool, backend.name)] += 1
+                return answer
+        return None
+
+    def _unanswered(self, tool, message, failed):
+        with self._lock:
+            self.unanswered[tool] += 1
+        if failed:
+            message += f" The {' and '.join(dict.fromkeys(failed))} lookup failed, please try again later."
+        return message
+
+    def _run(self, tool, args, unanswered_message):
+        configured = self._configured(tool, self.backends)
+        if not configured:
+            return self._fallback(tool, args, self.backends)
+        failed = []
+        answer = self._answer(tool, args, configured, failed)
+        if answer is None:
+            ## Every backend that knows the tool failed or declined. Say so rather than let the stub make up an answer.
+            return self._unanswered(tool, unanswered_message, failed)
+        return answer
+
+    def compute_travel_duration(self, origin, destination, mode_of_travel, external=True):
+        """
+        Parameters:
+        external (bool): False answers from local backends and the cache only, without paid API calls.
+        """
+        origin, destination = self.gazetteer.canonicalize(origin), self.gazetteer.canonicalize(destination)
+        tool, args = "compute_travel_duration", (origin, destination, mode_of_travel)
+        backends = [backend for backend in self.backends if external or not backend.external]
+        configured = self._configured(tool, backends)
+        cacheable = [backend for backend in configured if backend.cacheable]
+        failed = []
+
+        def compute(origin, destination, mode_of_travel):
+            return self._answer(tool, (origin, destination, mode_of_travel), cacheable, failed)
+
+        ## The cache also answers when no backend is configured, e.g. Maps answers for a call without external lookups
+        if self.travel_cache is not None:
+            output = self.travel_cache.get_or_compute(origin, destination, mode_of_travel, compute)
+            ## Names seen for the first time were learned from the Maps response. Cache under their canonical names too.
+            canonical_origin, canonical_destination = self.gazetteer.canonicalize(origin), self.gazetteer.canonicalize(destination)
+            if output and (canonical_origin, canonical_destination) != (origin, destination):
+                self.travel_cache.put(canonical_origin, canonical_destination, mode_of_travel, output)
+        else:
+            output = compute(origin, destination, mode_of_travel)
+
+        if output is None:
+            output = self._answer(tool, args, [backend for backend in configured if not backend.cacheable], failed)
+        if output is None and not configured:
+            return self._fallback(tool, args, backends)
+        if output is None:
+            return self._unanswered(tool, f"Could not compute the travel time from {origin} to {destination} by {mode_of_travel}.", failed)
+        return output
+
+    def traffic_condition(self, route):
+        route = self.gazetteer.canonicalize_route(route)
+        return self._run("traffic_condition", (route,), f"Could not find the traffic conditions on {route}.")
+
+    def find_route(self, origin, destination, mode_of_travel):
+        origin, destination = self.gazetteer.canonicalize(origin), self.gazetteer.canonicalize(destination)
+        return self._run(
+            "find_route", (origin, destination, mode_of_travel),
+            f"Could not find a {mode_of_travel} route from {origin} to {destination}.",
+        )
+
+    def find_transit_schedule(self, route_number, mode_of_travel, stop=None):
+        return self._run(
+            "find_transit_schedule", (route_number, mode_of_travel, stop),
+            f"Could not find the schedule of {mode_of_travel} route {route_number}.",
+        )
+
+    def stats(self):
+        with self._lock:
+            answers = {f"{tool}/{backend}": count for (tool, backend), count in self.answers.items()}
+            errors = {f"{tool}/{backend}": count for (tool, backend), count in self.errors.items()}
+            fallbacks, unanswered = dict(self.fallbacks), dict(self.unanswered)
+        return {
+            "answers": answers,
+            "errors": errors,
+            "fallbacks": fallbacks,
+            "unanswered": unanswered,
+            "backends": {backend.name: backend.stats() for backend in self.backends},
+            "travel_cache": self.travel_cache.stats() if self.travel_cache is not None else None,
+            "gazetteer": self.gazetteer.stats(),
+        }
+
+
+_shared_runtime = None
+_shared_runtime_lock = threading.Lock()
+
+
+def get_tool_runtime():
+    """
+    The process-wide tool runtime, created from the environment on first use. Every variant
+    loaded in the process shares its caches, connection pool and metrics.
+    """
+    global _shared_runtime
+    with _shared_runtime_lock:
+        if _shared_runtime is None:
+            _shared_runtime = ToolRuntime.from_env()
+    return _shared_runtime
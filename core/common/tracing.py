@@ -0,0 +1,312 @@
+"""
+Span-based tracing and per-stage latency metrics shared by all assistant variants.
+
+A span covers one unit of work: an LLM call, a tool call, an agent handoff, a LangGraph
+node or a checkpoint read or write. Each span belongs to a stage, and the tracer keeps
+count, total time and a window of recent durations per stage, from which p50, p95 and
+p99 are computed when metrics are read. Token usage from LLM responses is counted per
+stage as well.
+
+Finished spans are buffered and appended in batches to a JSONL file when TRACE_PATH is
+set. render_prometheus() formats the metrics in the Prometheus text format. They are
+served on /metrics by graph_server.py, and by a small HTTP server on METRICS_PORT when
+that variable is set. Recording a span takes a few microseconds, so tracing stays on.
+The LangGraph variants record their nodes through the callback handler in
+langchain_tracing.py.
+
+"""
+
+import atexit
+import contextvars
+import functools
+import inspect
+import json
+import os
+import random
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+QUANTILES = (0.5, 0.95, 0.99)
+
+_current_span = contextvars.ContextVar("current_span", default=None)
+
+
+def _new_id():
+    return f"{random.getrandbits(64):016x}"
+
+
+class Span:
+
+    __slots__ = ("name", "stage", "trace_id", "span_id", "parent_id", "start", "duration", "attributes", "error", "_t0")
+
+    def __init__(self, name, stage, parent=None, attributes=None):
+        self.name = name
+        self.stage = stage
+        self.trace_id = parent.trace_id if parent is not None else _new_id()
+        self.span_id = _new_id()
+        self.parent_id = parent.span_id if parent is not None else None
+        self.start = time.time()
+        self.duration = None
+        self.attributes = attributes or {}
+        self.error = None
+        self._t0 = time.perf_counter()
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def record_usage(self, usage):
+        """
+        Attach token usage from an OpenAI response (or a dict with the same fields).
+        """
+        if usage is None:
+            return
+        if not isinstance(usage, dict):
+            usage = usage.model_dump() if hasattr(usage, "model_dump") else vars(usage)
+        for field in ("prompt_tokens", "completion_tokens"):
+            if usage.get(field) is not None:
+                self.attributes[field] = usage[field]
+        cached = (usage.get("prompt_tokens_details") or {}).get("cached_tokens")
+        if cached is not None:
+            self.attributes["cached_tokens"] = cached
+
+    def to_dict(self):
+        entry = {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "stage": self.stage,
+            "start": self.start,
+            "duration": self.duration,
+        }
+        if self.attributes:
+            entry["attributes"] = self.attributes
+        if self.error is not None:
+            entry["error"] = self.error
+        return entry
+
+
+class Tracer:
+    """
+    Records spans, aggregates per-stage metrics and exports spans to JSONL.
+
+    Parameters:
+    path (str): JSONL file that finished spans are appended to. None keeps metrics only.
+    window (int): Recent durations kept per stage for the percentiles.
+    flush_interval (float): Seconds between writes of buffered spans.
+    flush_size (int): Buffered spans that trigger a write regardless of the interval.
+    """
+
+    def __init__(self, path=None, window=2048, flush_interval=1.0, flush_size=256):
+        self.path = path
+        self.window = window
+        self.flush_interval = flush_interval
+        self.flush_size = flush_size
+        self._lock = threading.Lock()
+        self._buffer = []
+        self._last_flush = time.monotonic()
+        self._durations = defaultdict(lambda: deque(maxlen=window))
+        self._counts = defaultdict(int)
+        self._sums = defaultdict(float)
+        self._errors = defaultdict(int)
+        self._tokens = defaultdict(int)
+        if path:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            atexit.register(self.flush)
+
+    def start_span(self, name, stage, parent=None, **attributes):
+        """
+        Start a span. parent defaults to the span active in the current context.
+        """
+        if parent is None:
+            parent = _current_span.get()
+        return Span(name, stage, parent, attributes)
+
+    def end_span(self, span, error=None):
+        span.duration = time.perf_counter() - span._t0
+        if error is not None:
+            span.error = repr(error)
+
+        flush = False
+        with self._lock:
+            stage = span.stage
+            self._durations[stage].append(span.duration)
+            self._counts[stage] += 1
+            self._sums[stage] += span.duration
+            if error is not None:
+                self._errors[stage] += 1
+            for field in ("prompt_tokens", "completion_tokens", "cached_tokens"):
+                if field in span.attributes:
+                    self._tokens[(stage, field)] += span.attributes[field]
+            if self.path:
+                self._buffer.append(span)
+                flush = len(self._buffer) >= self.flush_size or time.monotonic() - self._last_flush > self.flush_interval
+        if flush:
+            self.flush()
+
+    @contextmanager
+    def span(self, name, stage, **attributes):
+        """
+        Context manager that times its body as a span and makes it the parent of nested spans.
+        """
+        span = self.start_span(name, stage, **attributes)
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            _reset_current_span(token)
+            self.end_span(span, e)
+            raise
+        _reset_current_span(token)
+        self.end_span(span)
+
+    def traced(self, stage, name=None):
+        """
+        Decorator that records every call of a function, sync or async, as a span.
+        """
+        def decorator(func):
+            span_name = name or func.__name__
+
+            if inspect.iscoroutinefunction(func):
+                @functools.wraps(func)
+                async def async_wrapper(*args, **kwargs):
+                    with self.span(span_name, stage):
+                        return await func(*args, **kwargs)
+                return async_wrapper
+
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.span(span_name, stage):
+                    return func(*args, **kwargs)
+            return wrapper
+
+        return decorator
+
+    def flush(self):
+        with self._lock:
+            spans, self._buffer = self._buffer, []
+            self._last_flush = time.monotonic()
+        if not spans or not self.path:
+            return
+        lines = "".join(json.dumps(span.to_dict(), default=str) + "\n" for span in spans)
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(lines)
+
+    def summary(self):
+        """
+        Per-stage count, total seconds, errors, p50/p95/p99 seconds and token counts.
+        """
+        with self._lock:
+            durations = {stage: sorted(values) for stage, values in self._durations.items()}
+            counts = dict(self._counts)
+            sums = dict(self._sums)
+            errors = dict(self._errors)
+            tokens = dict(self._tokens)
+
+        summary = {}
+        for stage, values in durations.items():
+            entry = {
+                "count": counts[stage],
+                "total_seconds": sums[stage],
+                "errors": errors.get(stage, 0),
+            }
+            for q in QUANTILES:
+                entry[f"p{int(q * 100)}"] = _percentile(values, q)
+            for (token_stage, field), count in tokens.items():
+                if token_stage == stage:
+                    entry[field] = count
+            summary[stage] = entry
+        return summary
+
+    def render_prometheus(self):
+        """
+        Metrics in the Prometheus text exposition format.
+        """
+        summary = self.summary()
+        lines = [
+            "# HELP assistant_stage_latency_seconds Latency of assistant stages.",
+            "# TYPE assistant_stage_latency_seconds summary",
+        ]
+        for stage, entry in sorted(summary.items()):
+            for q in QUANTILES:
+                lines.append(f'assistant_stage_latency_seconds{{stage="{stage}",quantile="{q}"}} {entry[f"p{int(q * 100)}"]:.6f}')
+            lines.append(f'assistant_stage_latency_seconds_sum{{stage="{stage}"}} {entry["total_seconds"]:.6f}')
+            lines.append(f'assistant_stage_latency_seconds_count{{stage="{stage}"}} {entry["count"]}')
+
+        lines += [
+            "# HELP assistant_stage_errors_total Spans that ended with an exception.",
+            "# TYPE assistant_stage_errors_total counter",
+        ]
+        for stage, entry in sorted(summary.items()):
+            lines.append(f'assistant_stage_errors_total{{stage="{stage}"}} {entry["errors"]}')
+
+        lines += [
+            "# HELP assistant_tokens_total Tokens reported by LLM responses.",
+            "# TYPE assistant_tokens_total counter",
+        ]
+        for stage, entry in sorted(summary.items()):
+            for field in ("prompt_tokens", "completion_tokens", "cached_tokens"):
+                if field in entry:
+                    kind = field[: -len("_tokens")]
+                    lines.append(f'assistant_tokens_total{{stage="{stage}",kind="{kind}"}} {entry[field]}')
+        return "\n".join(lines) + "\n"
+
+
+def _reset_current_span(token):
+    try:
+        _current_span.reset(token)
+    except ValueError:
+        ## An async generator holding the span was closed from another context
+        pass
+
+
+def _percentile(sorted_values, q):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(q * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def current_span():
+    return _current_span.get()
+
+
+def start_metrics_server(tracer, port, host="127.0.0.1"):
+    """
+    Serve tracer.render_prometheus() on http://host:port/metrics from a daemon thread.
+    """
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+
+        def do_GET(self):
+            if self.path.rstrip("/") != "/metrics":
+                self.send_error(404)
+                return
+            body = tracer.render_prometheus().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def _create_tracer():
+    tracer = Tracer(os.getenv("TRACE_PATH"))
+    if os.getenv("METRICS_PORT"):
+        start_metrics_server(tracer, int(os.getenv("METRICS_PORT")))
+    return tracer
+
+
+## Process-wide tracer. TRACE_PATH enables the JSONL export, METRICS_PORT the /metrics endpoint.
+tracer = _create_tracer()
+
@@ -0,0 +1,415 @@
+"""
+Live traffic for traffic_condition, from a stream of speed samples per road segment.
+
+A provider streams one line per sample:
+
+    timestamp,segment_id,speed_kmh
+
+where timestamp is in Unix seconds (empty for now). TRAFFIC_FEED names the stream: a file
+that the provider appends to, followed like tail -f, or tcp://host:port for a socket.
+TRAFFIC_SEGMENTS_PATH is a CSV describing the segments:
+
+    segment_id,source,target,length_m,free_flow_kmh,names
+
+source and target are the OSM nodes at the ends of the segment, which tie it to the road
+network. free_flow_kmh may be empty, the fastest recent sample is used then. A segment
+with neither is left out of the delay of its routes. names lists the road names and
+numbers of the segment separated by semicolons, e.g. "US 101;101".
+
+TrafficStore keeps the last WINDOW samples of every segment in ring buffers: a segments
+by WINDOW array of speeds and one of sample times. An ingestion thread parses the stream
+in batches and writes each batch with a few vectorized assignments. Readers never take a
+lock: the writer bumps a sequence number before and after each batch (a seqlock), and a
+reader that sees it change while copying its rows copies them again. So a query always
+sees whole batches, and ingestion never waits for queries.
+
+A route is either "A to B", whose segments come from the fastest driving route on the road
+network, or a road name or number. Its delay is summed over its segments in NumPy: length
+at the mean of the fresh samples against length at the free-flow speed.
+
+Usage (from the repository root):
+
+    python core/common/traffic.py segments.csv samples.log "US 101"
+
+"""
+
+import argparse
+import csv
+import os
+import re
+import socket
+import sys
+import threading
+import time
+
+import numpy as np
+
+## Shared modules live in core/common, which is not on the path when this file runs as a script
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from common.gazetteer import normalize_name
+
+## Samples kept per segment
+WINDOW = 16
+
+## Samples older than this do not describe the current traffic
+MAX_SAMPLE_AGE_S = 900
+
+## Bytes of the stream parsed and written as one batch
+BATCH_BYTES = 1 << 20
+
+## Seconds between checks of a followed file for new lines
+POLL_INTERVAL_S = 0.1
+
+## Share of the free-flow time a route is delayed by, from which traffic is reported at a level
+TRAFFIC_LEVELS = ((0.3, "heavy"), (0.1, "moderate"), (0.0, "light"))
+
+
+class TrafficStore:
+    """
+    Ring buffers of the latest speed samples of every segment.
+
+    Written by a single thread with apply, read by any number of threads with snapshot.
+
+    Parameters:
+    segment_ids (list): Id of every segment, as it appears in the stream.
+    lengths (ndarray): Meters per segment.
+    free_flow (ndarray): km/h per segment, nan when unknown.
+    pairs (dict): (source, target) OSM nodes -> segment.
+    names (dict): Normalized road name or number -> list of segments.
+    window (int): Samples kept per segment.
+    """
+
+    def __init__(self, segment_ids, lengths, free_flow, pairs=None, names=None, window=WINDOW):
+        self.segment_ids = list(segment_ids)
+        self.index = {segment_id: segment for segment, segment_id in enumerate(self.segment_ids)}
+        self.lengths = np.asarray(lengths, dtype=np.float64)
+        self.free_flow = np.asarray(free_flow, dtype=np.float64)
+        self.pairs = pairs or {}
+        self.names = {name: np.array(segments, dtype=np.int64) for name, segments in (names or {}).items()}
+        self.window = window
+
+        self.speeds = np.full((len(self.segment_ids), window), np.nan, dtype=np.float32)
+        self.times = np.zeros((len(self.segment_ids), window), dtype=np.float64)
+        ## Position of the next sample of every segment in its ring buffer
+        self.cursors = np.zeros(len(self.segment_ids), dtype=np.int64)
+        ## Odd while a batch is being written
+        self._sequence = 0
+        self.samples = 0
+        self.unknown = 0
+
+    @classmethod
+    def from_csv(cls, path, window=WINDOW):
+        """
+        Segments from a CSV with the columns of the module docstring.
+        """
+        segment_ids, lengths, free_flow, pairs, names = [], [], [], {}, {}
+        with open(path, newline="", encoding="utf-8") as f:
+            for row in csv.DictReader(f):
+                segment = len(segment_ids)
+                segment_ids.append(row["segment_id"])
+                lengths.append(float(row["length_m"]))
+                free_flow.append(float(row["free_flow_kmh"]) if row.get("free_flow_kmh") else np.nan)
+                if row.get("source") and row.get("target"):
+                    pairs[(int(row["source"]), int(row["target"]))] = segment
+                for name in (row.get("names") or "").split(";"):
+                    if name.strip():
+                        names.setdefault(normalize_name(name), []).append(segment)
+        return cls(segment_ids, lengths, free_flow, pairs, names, window)
+
+    def apply(self, segments, speeds, times):
+        """
+        Append a batch of samples, given as arrays in stream order. Only one thread may call this.
+        """
+        if len(segments) == 0:
+            return
+        order = np.argsort(segments, kind="stable")
+        segments, speeds, times = segments[order], speeds[order], times[order]
+        ## Rank of every sample among the samples of its segment in this batch
+        firsts = np.flatnonzero(np.concatenate([[True], segments[1:] != segments[:-1]]))
+        counts = np.diff(np.append(firsts, len(segments)))
+        ranks = np.arange(len(segments)) - np.repeat(firsts, counts)
+        positions = (self.cursors[segments] + ranks) % self.window
+        ## Of more than window samples of a segment, only the last ones would survive. Dropping
+        ## the others leaves no two writes to the same slot.
+        if counts.max() > self.window:
+            kept = ranks >= np.repeat(counts, counts) - self.window
+            segments, speeds, times, positions = segments[kept], speeds[kept], times[kept], positions[kept]
+
+        self._sequence += 1
+        self.speeds[segments, positions] = speeds
+        self.times[segments, positions] = times
+        self.cursors[np.unique(segments)] += counts
+        self._sequence += 1
+        self.samples += int(counts.sum())
+
+    def snapshot(self, segments):
+        """
+        Copies of the speeds and sample times of segments, all from between two batches.
+        """
+        while True:
+            sequence = self._sequence
+            if sequence % 2 == 0:
+                speeds, times = self.speeds[segments], self.times[segments]
+                if self._sequence == sequence:
+                    return speeds, times
+            ## Give the writer the interpreter to finish its batch
+            time.sleep(0)
+
+    def delay(self, segments, now=None):
+        """
+        Delay over a sequence of segments.
+
+        Returns:
+        dict: "delay" and "free_flow" seconds over the segments, and "observed", the number of
+            segments with fresh samples. None when none has any.
+        """
+        segments = np.asarray(segments, dtype=np.int64)
+        speeds, times = self.snapshot(segments)
+        now = time.time() if now is None else now
+
+        fresh = (times >= now - MAX_SAMPLE_AGE_S) & (speeds > 0)
+        counts = fresh.sum(axis=1)
+        observed = counts > 0
+        if not observed.any():
+            return None
+        current = np.where(fresh, speeds, 0).sum(axis=1) / np.maximum(counts, 1)
+        free_flow = self.free_flow[segments]
+        ## Without a free-flow speed or a fresh sample, a segment would count at 1 km/h. Leave it out of both sums.
+        known = observed | ~np.isnan(free_flow)
+        free_flow = np.where(np.isnan(free_flow), np.where(fresh, speeds, 0).max(axis=1), free_flow)
+
+        lengths = self.lengths[segments]
+        free_flow_seconds = np.where(known, lengths / np.maximum(free_flow, 1) * 3.6, 0)
+        ## Segments without fresh samples are taken to flow freely
+        seconds = np.where(observed, lengths / np.maximum(current, 1) * 3.6, free_flow_seconds)
+        return {
+            "delay": float(np.maximum(seconds - free_flow_seconds, 0).sum()),
+            "free_flow": float(free_flow_seconds.sum()),
+            "observed": int(observed.sum()),
+        }
+
+
+def parse_samples(lines, index, now=None):
+    """
+    Segment, speed and time arrays of the lines of the stream, and the number of lines that
+    name an unknown segment. Malformed lines are skipped.
+    """
+    now = time.time() if now is None else now
+    segments, speeds, times = [], [], []
+    unknown = 0
+    for line in lines:
+        parts = line.split(",")
+        if len(parts) < 3:
+            continue
+        segment = index.get(parts[1].strip())
+        if segment is None:
+            unknown += 1
+            continue
+        try:
+            speed = float(parts[2])
+            timestamp = float(parts[0]) if parts[0].strip() else now
+        except ValueError:
+            continue
+        segments.append(segment)
+        speeds.append(speed)
+        times.append(timestamp)
+    return np.array(segments, dtype=np.int64), np.array(speeds, dtype=np.float32), np.array(times, dtype=np.float64), unknown
+
+
+def follow_file(path, stop, from_start=False):
+    """
+    Batches of the complete lines appended to a file, like tail -f. The file is reopened
+    when it is replaced or truncated.
+
+    Parameters:
+    stop (threading.Event): Ends the generator.
+    from_start (bool): Also read the lines that are already in the file.
+    """
+    f, partial = None, ""
+    while not stop.is_set():
+        if f is None:
+            try:
+                f = open(path, encoding="utf-8")
+            except FileNotFoundError:
+                stop.wait(POLL_INTERVAL_S)
+                continue
+            if not from_start:
+                f.seek(0, os.SEEK_END)
+            from_start, partial = True, ""
+
+        chunk = f.read(BATCH_BYTES)
+        if chunk:
+            lines = (partial + chunk).split("\n")
+            partial = lines.pop()
+            yield lines
+            continue
+
+        ## At the end of the file: wait for more, unless it was rotated or truncated
+        try:
+            replaced = os.stat(path).st_ino != os.fstat(f.fileno()).st_ino or os.stat(path).st_size < f.tell()
+        except FileNotFoundError:
+            replaced = False
+        if replaced:
+            f.close()
+            f = None
+        else:
+            stop.wait(POLL_INTERVAL_S)
+    if f is not None:
+        f.close()
+
+
+def follow_socket(host, port, stop):
+    """
+    Batches of the lines received from a TCP stream. Reconnects after the stream ends.
+    """
+    backoff = POLL_INTERVAL_S
+    while not stop.is_set():
+        try:
+            with socket.create_connection((host, port), timeout=1.0) as connection:
+                backoff, partial = POLL_INTERVAL_S, ""
+                while not stop.is_set():
+                    try:
+                        data = connection.recv(BATCH_BYTES)
+                    except socket.timeout:
+                        continue
+                    if not data:
+                        break
+                    lines = (partial + data.decode("utf-8", errors="replace")).split("\n")
+                    partial = lines.pop()
+                    yield lines
+        except OSError:
+            pass
+        stop.wait(backoff)
+        backoff = min(backoff * 2, 5.0)
+
+
+def open_feed(feed, stop):
+    """
+    Batches of lines of TRAFFIC_FEED: tcp://host:port or a file path.
+    """
+    match = re.fullmatch(r"tcp://([^:]+):(\d+)", feed)
+    return follow_socket(match.group(1), int(match.group(2)), stop) if match else follow_file(feed, stop)
+
+
+class TrafficIngestor(threading.Thread):
+    """
+    Background thread that writes the samples of a stream into a TrafficStore.
+
+    Parameters:
+    store (TrafficStore): Written by this thread only.
+    batches (iterable): Lists of lines, e.g. from follow_file.
+    stop (threading.Event): Set to end the thread.
+    """
+
+    def __init__(self, store, batches, stop):
+        super().__init__(name="traffic-ingestor", daemon=True)
+        self.store = store
+        self.batches = batches
+        self.stop_event = stop
+
+    def run(self):
+        for lines in self.batches:
+            segments, speeds, times, unknown = parse_samples(lines, self.store.index)
+            self.store.apply(segments, speeds, times)
+            self.store.unknown += unknown
+
+    def stop(self):
+        self.stop_event.set()
+
+
+def traffic_level(delay, free_flow):
+    share = delay / free_flow if free_flow else 0.0
+    return next(level for threshold, level in TRAFFIC_LEVELS if share >= threshold)
+
+
+class TrafficMonitor:
+    """
+    Traffic conditions on routes, from a TrafficStore.
+
+    Parameters:
+    store (TrafficStore): None makes every lookup return None.
+    road_router (RoadRouter): Finds the segments of routes given as "A to B".
+    """
+
+    def __init__(self, store, road_router=None):
+        self.store = store
+        self.road_router = road_router
+        self.ingestor = None
+        self.answered = 0
+        self.declined = 0
+
+    @classmethod
+    def from_env(cls, road_router=None):
+        """
+        Monitor of the segments at TRAFFIC_SEGMENTS_PATH, fed by TRAFFIC_FEED in a background
+        thread. Without them the monitor declines every lookup.
+        """
+        segments_path, feed = os.getenv("TRAFFIC_SEGMENTS_PATH"), os.getenv("TRAFFIC_FEED")
+        if not segments_path or not feed:
+            return cls(None, road_router)
+        monitor = cls(TrafficStore.from_csv(segments_path), road_router)
+        monitor.follow(feed)
+        return monitor
+
+    def follow(self, feed):
+        """
+        Start ingesting TRAFFIC_FEED-style feed into the store.
+        """
+        stop = threading.Event()
+        self.ingestor = TrafficIngestor(self.store, open_feed(feed, stop), stop)
+        self.ingestor.start()
+
+    def route_segments(self, route):
+        """
+        Segments of a route given as "A to B" or as a road name or number.
+        """
+        places = re.split(r"\s+to\s+", str(route).strip(), flags=re.IGNORECASE)
+        if len(places) == 2 and self.road_router is not None:
+            result = self.road_router.route(places[0], places[1], "driving")
+            if result is None:
+                return []
+            nodes = self.road_router.network.node_ids[result[1]].tolist()
+            segments = (self.store.pairs.get((u, v), self.store.pairs.get((v, u))) for u, v in zip(nodes, nodes[1:]))
+            return [segment for segment in segments if segment is not None]
+        return self.store.names.get(normalize_name(route), [])
+
+    def condition_text(self, route):
+        """
+        Traffic on the route and the delay it causes, or None without fresh samples.
+        """
+        if self.store is None:
+            return self._decline()
+        segments = self.route_segments(route)
+        result = self.store.delay(segments) if len(segments) else None
+        if result is None:
+            return self._decline()
+
+        self.answered += 1
+        level = traffic_level(result["delay"], result["free_flow"])
+        minutes = int(round(result["delay"] / 60))
+        if minutes == 0:
+            return f'There is {level} traffic on {route}, with no delay to the journey'
+        return f'There is {level} traffic on {route}, which could add {minutes} minute{"s" if minutes > 1 else ""} to the journey'
+
+    def _decline(self):
+        self.declined += 1
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Traffic on a route from a file of speed samples.")
+    parser.add_argument("segments", help="segments CSV")
+    parser.add_argument("samples", help="file of timestamp,segment_id,speed_kmh lines")
+    parser.add_argument("route", help="road name or number")
+    args = parser.parse_args()
+
+    store = TrafficStore.from_csv(args.segments)
+    with open(args.samples, encoding="utf-8") as f:
+        segments, speeds, times, store.unknown = parse_samples(f, store.index)
+    store.apply(segments, speeds, times)
+    print(TrafficMonitor(store).condition_text(args.route) or "No recent traffic samples")
+
+
+if __name__ == "__main__":
+    main()
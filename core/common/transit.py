@@ -0,0 +1,805 @@
+"""
+GTFS transit schedules and itineraries for find_route and find_transit_schedule.
+
+TransitFeed loads a GTFS feed (a directory or a zip file) into columnar NumPy arrays. The
+text files are read one row at a time into typed arrays, so a feed with millions of stop
+times takes a few bytes per stop time instead of a dict per row.
+
+Two indexes are built over the stop times:
+
+- the departures of every stop, sorted by route and then by time, so the next departures
+  of a route from a stop are found by binary search, and
+- patterns: the trips of a route that call at the same stops in the same order without
+  overtaking each other. The stop times of a pattern form a trips by stops matrix, sorted
+  by time in every column.
+
+itinerary() runs RAPTOR (round-based public transit routing): round k finds the earliest
+arrival at every stop with k trips, scanning each pattern that serves a stop improved in
+round k - 1 once. Transfers between stops come from transfers.txt and parent stations.
+
+TransitRouter answers the tools from the feed at GTFS_PATH. Places are matched against the
+stop names, or with the gazetteer against the stops within walking distance of the place.
+It returns None for everything else, so the tools keep their current answers.
+
+Usage (from the repository root):
+
+    python core/common/transit.py feed.zip "Mountain View" "San Francisco"
+    python core/common/transit.py feed.zip --schedule 22 --stop "Palo Alto Transit Center"
+
+"""
+
+import argparse
+import array
+import contextlib
+import csv
+import datetime
+import io
+import math
+import operator
+import os
+import sys
+import zipfile
+from zoneinfo import ZoneInfo
+
+import numpy as np
+
+## Shared modules live in core/common, which is not on the path when this file runs as a script
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from common.compiled_tables import is_compiled, read_tables, write_tables
+from common.gazetteer import Gazetteer, normalize_name
+from common.road_network import EARTH_RADIUS_M, unit_vectors
+from common.travel_cache import normalize_mode, normalize_place
+
+## GTFS route types per mode of travel. Other transit modes may use every route.
+ROUTE_TYPES_BY_MODE = {
+    "tram": (0,), "light rail": (0,), "streetcar": (0,),
+    "subway": (1,), "metro": (1,),
+    "train": (2,), "rail": (2,), "caltrain": (2,),
+    "bus": (3, 11), "ferry": (4,), "cable car": (5,),
+}
+
+## Modes that are not transit. find_route and find_transit_schedule decline them.
+ROAD_MODES = ("driving", "walking", "bicycling")
+
+## Farthest walk between a place and a stop, and the walking speed
+MAX_WALK_M = 1500.0
+WALK_SPEED_MPS = 1.3
+
+## Shortest transfer between two platforms of a station
+MIN_TRANSFER_S = 60
+
+## RAPTOR rounds, i.e. the most trips in one itinerary
+MAX_ROUNDS = 4
+
+## Departures listed by find_transit_schedule
+NEXT_DEPARTURES = 3
+
+
+def parse_time(text):
+    """
+    Seconds after midnight of "HH:MM:SS", or -1 when empty. Times after midnight of the
+    service day go past 24:00:00.
+    """
+    text = text.strip()
+    if not text:
+        return -1
+    hours, minutes, seconds = text.split(":")
+    return int(hours) * 3600 + int(minutes) * 60 + int(seconds)
+
+
+def format_time(seconds):
+    """
+    Clock time of seconds after midnight, e.g. "10:30 AM".
+    """
+    hours, minutes = divmod(int(seconds) // 60, 60)
+    hours %= 24
+    return f"{(hours - 1) % 12 + 1}:{minutes:02d} {'AM' if hours < 12 else 'PM'}"
+
+
+def _date_number(date):
+    return date.year * 10000 + date.month * 100 + date.day
+
+
+@contextlib.contextmanager
+def _open_file(feed_path, name):
+    if zipfile.is_zipfile(feed_path):
+        with zipfile.ZipFile(feed_path) as archive:
+            ## Some feeds put their files in a folder inside the archive
+            member = next((member for member in archive.namelist() if member.rsplit("/", 1)[-1] == name), None)
+            if member is None:
+                yield None
+                return
+            with archive.open(member) as raw:
+                yield io.TextIOWrapper(raw, encoding="utf-8-sig", newline="")
+    else:
+        path = os.path.join(feed_path, name)
+        if not os.path.exists(path):
+            yield None
+            return
+        with open(path, newline="", encoding="utf-8-sig") as f:
+            yield f
+
+
+def _read_rows(feed_path, name, columns):
+    """
+    Values of columns in every row of a file of the feed. Missing columns read as "".
+    Yields nothing when the feed does not have the file.
+    """
+    with _open_file(feed_path, name) as f:
+        if f is None:
+            return
+        reader = csv.reader(f)
+        header = [column.strip() for column in next(reader, [])]
+        indexes = [header.index(column) if column in header else None for column in columns]
+        ## Rows that have every column are picked in C, the others padded with ""
+        pick = operator.itemgetter(*indexes, 0) if None not in indexes else None
+        last = max((i for i in indexes if i is not None), default=0)
+        for row in reader:
+            if not row:
+                continue
+            if pick is not None and len(row) > last:
+                yield pick(row)[:-1]
+            else:
+                yield tuple(row[i] if i is not None and i < len(row) else "" for i in indexes)
+
+
+def _csr(keys, num_keys):
+    """
+    Stable order of the rows by key, and offsets such that the rows of key i are
+    order[offsets[i]:offsets[i + 1]].
+    """
+    order = np.argsort(keys, kind="stable")
+    offsets = np.zeros(num_keys + 1, dtype=np.int64)
+    np.cumsum(np.bincount(keys, minlength=num_keys), out=offsets[1:])
+    return order, offsets
+
+
+def _interpolate_missing(times, trip_offsets):
+    """
+    Fill the times of stops without one (-1) linearly between the stops of the trip that have one.
+    """
+    missing = np.flatnonzero(times < 0)
+    if len(missing) == 0:
+        return
+    for trip in np.unique(np.searchsorted(trip_offsets, missing, side="right") - 1):
+        start, end = trip_offsets[trip], trip_offsets[trip + 1]
+        trip_times = times[start:end]
+        known = np.flatnonzero(trip_times >= 0)
+        if len(known):
+            trip_times[:] = np.interp(np.arange(end - start), known, trip_times[known]).astype(np.int32)
+
+
+class TransitFeed:
+    """
+    Stops, routes, trips, calendars and stop times of a GTFS feed, in arrays.
+
+    Parameters:
+    strings (dict): STRING_TABLES, lists of str.
+    arrays (dict): ARRAYS, NumPy arrays. See from_gtfs for what they hold.
+    """
+
+    STRING_TABLES = ("stop_ids", "stop_names", "route_ids", "route_names", "route_long_names", "trip_ids", "service_ids", "timezones")
+    ARRAYS = (
+        "stop_lat", "stop_lon", "route_types", "trip_routes", "trip_services",
+        "service_weekdays", "service_start", "service_end", "exception_services", "exception_dates", "exception_types",
+        "pattern_routes", "pattern_stop_offsets", "pattern_stops", "pattern_trip_offsets", "pattern_trips", "pattern_time_offsets",
+        "arrivals", "departures", "stop_pattern_offsets", "stop_patterns", "stop_positions",
+        "stop_route_offsets", "stop_routes", "stop_route_departure_offsets", "stop_departures", "stop_departure_trips",
+        "transfer_offsets", "transfer_targets", "transfer_seconds",
+    )
+
+    def __init__(self, strings, arrays):
+        for name in self.STRING_TABLES:
+            setattr(self, name, strings[name])
+        for name in self.ARRAYS:
+            setattr(self, name, arrays[name])
+        self.xyz = unit_vectors(self.stop_lat, self.stop_lon)
+        ## Normalized names -> stops and routes, to find what the LLM refers to
+        self._stops_by_name = {}
+        for stop, name in enumerate(self.stop_names):
+            self._stops_by_name.setdefault(normalize_name(name), []).append(stop)
+        self._routes_by_name = {}
+        for route, names in enumerate(zip(self.route_names, self.route_long_names, self.route_ids)):
+            for name in set(map(normalize_name, names)):
+                if name:
+                    self._routes_by_name.setdefault(name, []).append(route)
+
+    @property
+    def num_stops(self):
+        return len(self.stop_ids)
+
+    @property
+    def num_stop_times(self):
+        return len(self.arrivals)
+
+    @classmethod
+    def open(cls, path):
+        """
+        Feed from a compiled file (see compiled_tables) or else from GTFS.
+        """
+        return cls.load(path) if is_compiled(path) else cls.from_gtfs(path)
+
+    @classmethod
+    def load(cls, path):
+        """
+        Feed memory-mapped from a file written by save.
+        """
+        arrays, strings, _ = read_tables(path, "transit")
+        return cls(strings, arrays)
+
+    def save(self, path):
+        """
+        Write the feed into a compiled file that load maps into memory.
+        """
+        write_tables(
+            path, "transit",
+            {name: getattr(self, name) for name in self.ARRAYS},
+            {name: getattr(self, name) for name in self.STRING_TABLES},
+        )
+
+    @classmethod
+    def from_gtfs(cls, feed_path):
+        """
+        Load a GTFS feed from a directory or a zip file.
+        """
+        strings = {name: [] for name in cls.STRING_TABLES}
+        arrays = {}
+
+        for (timezone,) in _read_rows(feed_path, "agency.txt", ["agency_timezone"]):
+            if timezone:
+                strings["timezones"].append(timezone)
+
+        stop_index, parents, coordinates = {}, [], []
+        for stop_id, name, lat, lon, parent in _read_rows(feed_path, "stops.txt", ["stop_id", "stop_name", "stop_lat", "stop_lon", "parent_station"]):
+            stop_index[stop_id] = len(strings["stop_ids"])
+            strings["stop_ids"].append(stop_id)
+            strings["stop_names"].append(name)
+            coordinates.append((float(lat or 0), float(lon or 0)))
+            parents.append(parent)
+        coordinates = np.array(coordinates, dtype=np.float64).reshape(-1, 2)
+        arrays["stop_lat"], arrays["stop_lon"] = coordinates[:, 0].copy(), coordinates[:, 1].copy()
+
+        route_index, route_types = {}, []
+        for route_id, short_name, long_name, route_type in _read_rows(feed_path, "routes.txt", ["route_id", "route_short_name", "route_long_name", "route_type"]):
+            route_index[route_id] = len(strings["route_ids"])
+            strings["route_ids"].append(route_id)
+            strings["route_names"].append(short_name or long_name or route_id)
+            strings["route_long_names"].append(long_name)
+            route_types.append(int(route_type or 3))
+        arrays["route_types"] = np.array(route_types, dtype=np.int32)
+
+        service_index = {}
+
+        def service(service_id):
+            if service_id not in service_index:
+                service_index[service_id] = len(strings["service_ids"])
+                strings["service_ids"].append(service_id)
+            return service_index[service_id]
+
+        trip_index, trip_routes, trip_services = {}, array.array("i"), array.array("i")
+        for trip_id, route_id, service_id in _read_rows(feed_path, "trips.txt", ["trip_id", "route_id", "service_id"]):
+            if route_id not in route_index:
+                continue
+            trip_index[trip_id] = len(strings["trip_ids"])
+            strings["trip_ids"].append(trip_id)
+            trip_routes.append(route_index[route_id])
+            trip_services.append(service(service_id))
+        arrays["trip_routes"] = np.frombuffer(trip_routes, dtype=np.int32).copy()
+        arrays["trip_services"] = np.frombuffer(trip_services, dtype=np.int32).copy()
+
+        calendar = {}
+        weekdays = ["monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday"]
+        for service_id, start, end, *days in _read_rows(feed_path, "calendar.txt", ["service_id", "start_date", "end_date", *weekdays]):
+            calendar[service(service_id)] = (sum(1 << day for day, runs in enumerate(days) if runs == "1"), int(start), int(end))
+        exceptions = [
+            (service(service_id), int(date), int(exception_type))
+            for service_id, date, exception_type in _read_rows(feed_path, "calendar_dates.txt", ["service_id", "date", "exception_type"])
+        ]
+        num_services = len(strings["service_ids"])
+        ## A feed without calendars runs every trip every day
+        always = (0b1111111, 0, 99991231) if not calendar and not exceptions else (0, 0, 0)
+        service_days = [calendar.get(i, always) for i in range(num_services)]
+        arrays["service_weekdays"] = np.array([days for days, _, _ in service_days], dtype=np.int8)
+        arrays["service_start"] = np.array([start for _, start, _ in service_days], dtype=np.int32)
+        arrays["service_end"] = np.array([end for _, _, end in service_days], dtype=np.int32)
+        exceptions = np.array(exceptions, dtype=np.int32).reshape(-1, 3)
+        arrays["exception_services"], arrays["exception_dates"] = exceptions[:, 0].copy(), exceptions[:, 1].copy()
+        arrays["exception_types"] = exceptions[:, 2].astype(np.int8)
+
+        stop_times = cls._read_stop_times(feed_path, trip_index, stop_index)
+
+        transfers = [
+            (stop_index[from_stop], stop_index[to_stop], int(seconds or 0))
+            for from_stop, to_stop, transfer_type, seconds in _read_rows(feed_path, "transfers.txt", ["from_stop_id", "to_stop_id", "transfer_type", "min_transfer_time"])
+            if from_stop in stop_index and to_stop in stop_index and from_stop != to_stop and transfer_type != "3"
+        ]
+        arrays.update(cls._index_transfers(transfers, parents, stop_index, unit_vectors(arrays["stop_lat"], arrays["stop_lon"])))
+        arrays.update(cls._index_stop_times(stop_times, len(strings["trip_ids"]), len(strings["stop_ids"]), arrays["trip_routes"]))
+        return cls(strings, arrays)
+
+    @staticmethod
+    def _read_stop_times(feed_path, trip_index, stop_index):
+        """
+        Trip, stop, arrival and departure of every stop time, ordered by trip and stop sequence.
+        """
+        ## Stop times are the bulk of a feed. They go straight into typed arrays.
+        trips, stops, sequences, arrivals, departures = (array.array("i") for _ in range(5))
+        ## Feeds repeat the same few thousand times of day millions of times
+        seconds = {}
+        for trip_id, stop_id, sequence, arrival, departure in _read_rows(feed_path, "stop_times.txt", ["trip_id", "stop_id", "stop_sequence", "arrival_time", "departure_time"]):
+            trip, stop = trip_index.get(trip_id), stop_index.get(stop_id)
+            if trip is None or stop is None:
+                continue
+            trips.append(trip)
+            stops.append(stop)
+            sequences.append(int(sequence))
+            if arrival not in seconds:
+                seconds[arrival] = parse_time(arrival)
+            if departure not in seconds:
+                seconds[departure] = parse_time(departure)
+            arrival, departure = seconds[arrival], seconds[departure]
+            arrivals.append(arrival if arrival >= 0 else departure)
+            departures.append(departure if departure >= 0 else arrival)
+
+        order = np.lexsort((np.frombuffer(sequences, dtype=np.int32), np.frombuffer(trips, dtype=np.int32)))
+        del sequences
+        ## Each column is released as soon as its sorted copy exists
+        columns = [trips, stops, arrivals, departures]
+        del trips, stops, arrivals, departures
+        return [np.frombuffer(columns.pop(0), dtype=np.int32)[order] for _ in range(4)]
+
+    @staticmethod
+    def _index_stop_times(stop_times, num_trips, num_stops, trip_routes):
+        """
+        Patterns and the departure index, see the module docstring. stop_times is consumed.
+        """
+        trips, stops, arrivals, departures = stop_times
+        stop_times.clear()
+        _, trip_offsets = _csr(trips, num_trips)
+        _interpolate_missing(arrivals, trip_offsets)
+        _interpolate_missing(departures, trip_offsets)
+
+        ## Departures of every stop by route and time. The last stop of a trip has none.
+        departing = np.ones(len(stops), dtype=bool)
+        departing[trip_offsets[1:][np.diff(trip_offsets) > 0] - 1] = False
+        departure_stops, departure_trips, departure_times = stops[departing], trips[departing], departures[departing]
+        del departing
+        departure_routes = trip_routes[departure_trips]
+        order = np.lexsort((departure_times, departure_routes, departure_stops))
+        departure_stops, departure_routes = departure_stops[order], departure_routes[order]
+        departure_trips, departure_times = departure_trips[order], departure_times[order]
+        del order, trips
+        new_pair = np.ones(len(departure_stops), dtype=bool)
+        new_pair[1:] = (departure_stops[1:] != departure_stops[:-1]) | (departure_routes[1:] != departure_routes[:-1])
+        starts = np.flatnonzero(new_pair)
+        index = {
+            "stop_route_offsets": np.searchsorted(departure_stops[starts], np.arange(num_stops + 1)).astype(np.int64),
+            "stop_routes": departure_routes[starts],
+            "stop_route_departure_offsets": np.append(starts, len(departure_stops)).astype(np.int64),
+            "stop_departures": departure_times,
+            "stop_departure_trips": departure_trips,
+        }
+        del departure_stops, departure_routes, new_pair
+
+        ## Trips by route and the stops they call at, each group in the order of their first departure.
+        ## A pattern has one route, so that its route names the rides and the route type filter applies to all its trips.
+        groups = {}
+        for trip in np.flatnonzero(np.diff(trip_offsets) > 1).tolist():
+            start, end = trip_offsets[trip], trip_offsets[trip + 1]
+            groups.setdefault((int(trip_routes[trip]), stops[start:end].tobytes()), []).append(trip)
+
+        ## A trip that would overtake the last trip of every pattern of its group starts a new one
+        patterns = []
+        for group in groups.values():
+            group.sort(key=lambda trip: departures[trip_offsets[trip]])
+            group_patterns = []
+            for trip in group:
+                times = departures[trip_offsets[trip]:trip_offsets[trip + 1]]
+                for pattern in group_patterns:
+                    if (times >= pattern[1]).all():
+                        pattern[0].append(trip)
+                        pattern[1] = times
+                        break
+                else:
+                    group_patterns.append([[trip], times])
+            patterns.extend(pattern for pattern, _ in group_patterns)
+        del groups
+
+        first_trips = [pattern[0] for pattern in patterns]
+        pattern_trips = np.array([trip for pattern in patterns for trip in pattern], dtype=np.int32)
+        trip_counts = np.array([len(pattern) for pattern in patterns], dtype=np.int64)
+        stop_counts = np.diff(trip_offsets)[first_trips].astype(np.int64)
+        pattern_stops = np.concatenate([stops[trip_offsets[trip]:trip_offsets[trip + 1]] for trip in first_trips] or [np.zeros(0, dtype=np.int32)])
+        pattern_ids = np.repeat(np.arange(len(patterns), dtype=np.int32), stop_counts)
+        pattern_stop_offsets = np.append(0, np.cumsum(stop_counts)).astype(np.int64)
+        positions = (np.arange(len(pattern_stops)) - pattern_stop_offsets[pattern_ids]).astype(np.int32)
+        stop_order, stop_pattern_offsets = _csr(pattern_stops, num_stops)
+
+        ## Stop times in pattern order: pattern by pattern, trip by trip, stop by stop
+        trip_slices = [slice(trip_offsets[trip], trip_offsets[trip + 1]) for trip in pattern_trips.tolist()]
+        empty = [np.zeros(0, dtype=np.int32)]
+        index.update({
+            "pattern_routes": trip_routes[first_trips].astype(np.int32),
+            "pattern_stop_offsets": pattern_stop_offsets,
+            "pattern_stops": pattern_stops.astype(np.int32),
+            "pattern_trip_offsets": np.append(0, np.cumsum(trip_counts)).astype(np.int64),
+            "pattern_trips": pattern_trips,
+            "pattern_time_offsets": np.append(0, np.cumsum(trip_counts * stop_counts)).astype(np.int64),
+            "arrivals": np.concatenate([arrivals[rows] for rows in trip_slices] or empty),
+            "departures": np.concatenate([departures[rows] for rows in trip_slices] or empty),
+            "stop_pattern_offsets": stop_pattern_offsets,
+            "stop_patterns": pattern_ids[stop_order],
+            "stop_positions": positions[stop_order],
+        })
+        return index
+
+    @staticmethod
+    def _index_transfers(transfers, parents, stop_index, xyz):
+        """
+        Transfers in CSR arrays: the ones of transfers.txt, and walks between the stops of a station.
+        """
+        ## A station and its platforms
+        stations = {}
+        for stop, parent in enumerate(parents):
+            if parent in stop_index:
+                stations.setdefault(parent, [stop_index[parent]]).append(stop)
+        pairs = {(a, b): seconds for a, b, seconds in transfers}
+        for members in stations.values():
+            for a in members:
+                for b in members:
+                    if a != b and (a, b) not in pairs:
+                        meters = float(np.linalg.norm(xyz[a] - xyz[b])) * EARTH_RADIUS_M
+                        pairs[(a, b)] = max(MIN_TRANSFER_S, int(meters / WALK_SPEED_MPS))
+        sources = np.array([a for a, _ in pairs], dtype=np.int64)
+        order, offsets = _csr(sources, len(parents))
+        return {
+            "transfer_offsets": offsets,
+            "transfer_targets": np.array([b for _, b in pairs], dtype=np.int32)[order],
+            "transfer_seconds": np.array(list(pairs.values()), dtype=np.int32)[order],
+        }
+
+    def active_services(self, date):
+        """
+        Returns:
+        ndarray: Whether each service runs on date (datetime.date).
+        """
+        day = _date_number(date)
+        active = ((self.service_weekdays >> date.weekday()) & 1).astype(bool)
+        active &= (self.service_start <= day) & (day <= self.service_end)
+        today = self.exception_dates == day
+        active[self.exception_services[today & (self.exception_types == 1)]] = True
+        active[self.exception_services[today & (self.exception_types == 2)]] = False
+        return active
+
+    def find_stops(self, name):
+        """
+        Stops whose normalized name is the normalized name.
+        """
+        return self._stops_by_name.get(normalize_name(name), [])
+
+    def find_routes(self, name, route_types=None):
+        """
+        Routes whose short name, long name or id is the normalized name.
+        """
+        routes = self._routes_by_name.get(normalize_name(name), [])
+        return [route for route in routes if route_types is None or self.route_types[route] in route_types]
+
+    def stops_near(self, lat, lon, max_meters=MAX_WALK_M):
+        """
+        Returns:
+        dict: Stop -> meters, for the stops within max_meters of (lat, lon).
+        """
+        meters = np.linalg.norm(self.xyz - unit_vectors(np.array([lat]), np.array([lon]))[0], axis=1) * EARTH_RADIUS_M
+        near = np.flatnonzero(meters <= max_meters)
+        return dict(zip(near.tolist(), meters[near].tolist()))
+
+    def route_stops(self, route):
+        """
+        Stops of the pattern of route with the most trips, in order.
+        """
+        patterns = np.flatnonzero(self.pattern_routes == route)
+        if len(patterns) == 0:
+            return []
+        pattern = int(patterns[np.argmax(np.diff(self.pattern_trip_offsets)[patterns])])
+        return self.pattern_stops[self.pattern_stop_offsets[pattern]:self.pattern_stop_offsets[pattern + 1]].tolist()
+
+    def next_departures(self, route, stop, date, after, count=NEXT_DEPARTURES):
+        """
+        Departures of route from stop on date, at or after `after` seconds after midnight.
+
+        Returns:
+        list: Up to count departure times, in seconds after midnight.
+        """
+        first, last = self.stop_route_offsets[stop], self.stop_route_offsets[stop + 1]
+        pair = first + int(np.searchsorted(self.stop_routes[first:last], route))
+        if pair == last or self.stop_routes[pair] != route:
+            return []
+        start, end = self.stop_route_departure_offsets[pair], self.stop_route_departure_offsets[pair + 1]
+        index = start + int(np.searchsorted(self.stop_departures[start:end], after))
+
+        active = self.active_services(date)
+        found = []
+        while index < end and len(found) < count:
+            if active[self.trip_services[self.stop_departure_trips[index]]]:
+                found.append(int(self.stop_departures[index]))
+            index += 1
+        return found
+
+    def itinerary(self, sources, targets, date, departure, route_types=None):
+        """
+        Earliest arrival from the sources to the targets, with RAPTOR.
+
+        Parameters:
+        sources (dict): Stop -> seconds of walking from the origin to the stop.
+        targets (dict): Stop -> seconds of walking from the stop to the destination.
+        date (datetime.date): Service day.
+        departure (int): Seconds after midnight of the service day when the trip starts.
+        route_types (tuple): GTFS route types that may be used, None for all.
+
+        Returns:
+        dict: "arrival" in seconds after midnight and "legs", each a dict with "route" (None
+            for walks), "from", "to", "departure" and "arrival". None when no trip arrives.
+        """
+        trip_active = self.active_services(date)[self.trip_services]
+        allowed = None if route_types is None else np.isin(self.route_types[self.pattern_routes], route_types)
+
+        ## Earliest arrival per stop in any round, and per round with the leg that reached it
+        best = {}
+        labels, parents = [{}], [{}]
+        for stop, walk in sources.items():
+            labels[0][stop] = best[stop] = departure + walk
+            parents[0][stop] = ("origin", 0, departure)
+        marked = self._relax_transfers(set(labels[0]), 0, labels[0], parents[0], best, math.inf)
+        marked |= set(labels[0])
+
+        def bound():
+            ## Arrival at the destination so far. Nothing later is worth keeping.
+            return min((best[stop] + walk for stop, walk in targets.items() if stop in best), default=math.inf)
+
+        for round_number in range(1, MAX_ROUNDS + 1):
+            previous = labels[-1]
+            label, parent = dict(previous), dict(parents[-1])
+
+            ## Patterns through the stops improved in the last round, from the first such stop
+            queue = {}
+            for stop in marked:
+                first, last = self.stop_pattern_offsets[stop], self.stop_pattern_offsets[stop + 1]
+                for pattern, position in zip(self.stop_patterns[first:last].tolist(), self.stop_positions[first:last].tolist()):
+                    if (allowed is None or allowed[pattern]) and position < queue.get(pattern, math.inf):
+                        queue[pattern] = position
+
+            marked = set()
+            limit = bound()
+            for pattern, start in queue.items():
+                stops = self.pattern_stops[self.pattern_stop_offsets[pattern]:self.pattern_stop_offsets[pattern + 1]].tolist()
+                num_stops = len(stops)
+                first_trip, num_trips = self.pattern_trip_offsets[pattern], self.pattern_trip_offsets[pattern + 1] - self.pattern_trip_offsets[pattern]
+                base = self.pattern_time_offsets[pattern]
+                trip = None
+
+                for position in range(start, num_stops):
+                    stop = stops[position]
+                    if trip is not None and trip_arrivals[position] < min(best.get(stop, math.inf), limit):
+                        label[stop] = best[stop] = trip_arrivals[position]
+                        parent[stop] = ("ride", round_number, pattern, trip, boarded, position)
+                        marked.add(stop)
+                        if stop in targets:
+                            limit = bound()
+
+                    ## Catch an earlier trip of the pattern where the last round got earlier
+                    ready = previous.get(stop)
+                    if ready is None or (trip is not None and ready > trip_departures[position]):
+                        continue
+                    column = self.departures[base + position:base + num_trips * num_stops:num_stops]
+                    candidate = int(np.searchsorted(column, ready))
+                    while candidate < num_trips and not trip_active[self.pattern_trips[first_trip + candidate]]:
+                        candidate += 1
+                    if candidate < num_trips and (trip is None or candidate < trip):
+                        trip, boarded = candidate, position
+                        row = base + candidate * num_stops
+                        trip_arrivals = self.arrivals[row:row + num_stops].tolist()
+                        trip_departures = self.departures[row:row + num_stops].tolist()
+
+            marked |= self._relax_transfers(marked, round_number, label, parent, best, limit)
+            labels.append(label)
+            parents.append(parent)
+            if not marked:
+                break
+
+        ## Earliest arrival at the destination, with as few trips as possible
+        arrival, end = math.inf, None
+        for round_number, label in enumerate(labels):
+            for stop, walk in targets.items():
+                if stop in label and label[stop] + walk < arrival:
+                    arrival, end = label[stop] + walk, (round_number, stop)
+        if end is None or end[0] == 0:
+            return None
+
+        legs = []
+        round_number, stop = end
+        if targets[stop]:
+            legs.append({"route": None, "from": stop, "to": None, "departure": labels[round_number][stop], "arrival": arrival})
+        while True:
+            leg = parents[round_number][stop]
+            if leg[0] == "origin":
+                if sources[stop]:
+                    legs.append({"route": None, "from": None, "to": stop, "departure": leg[2], "arrival": leg[2] + sources[stop]})
+                break
+            if leg[0] == "walk":
+                _, round_number, from_stop, seconds = leg
+                legs.append({"route": None, "from": from_stop, "to": stop, "departure": labels[round_number][stop] - seconds, "arrival": labels[round_number][stop]})
+                stop = from_stop
+                continue
+            _, leg_round, pattern, trip, boarded, alighted = leg
+            first = self.pattern_stop_offsets[pattern]
+            row = self.pattern_time_offsets[pattern] + trip * (self.pattern_stop_offsets[pattern + 1] - first)
+            legs.append({
+                "route": int(self.pattern_routes[pattern]),
+                "from": int(self.pattern_stops[first + boarded]),
+                "to": stop,
+                "departure": int(self.departures[row + boarded]),
+                "arrival": int(self.arrivals[row + alighted]),
+            })
+            stop, round_number = legs[-1]["from"], leg_round - 1
+        legs.reverse()
+        return {"arrival": arrival, "legs": legs}
+
+    def _relax_transfers(self, stops, round_number, label, parent, best, limit):
+        """
+        Walk from the stops to their transfer stops. Returns the stops that got earlier.
+        """
+        improved = set()
+        for stop in stops:
+            first, last = self.transfer_offsets[stop], self.transfer_offsets[stop + 1]
+            for target, seconds in zip(self.transfer_targets[first:last].tolist(), self.transfer_seconds[first:last].tolist()):
+                arrival = label[stop] + seconds
+                if arrival < min(best.get(target, math.inf), limit):
+                    label[target] = best[target] = arrival
+                    parent[target] = ("walk", round_number, stop, seconds)
+                    improved.add(target)
+        return improved
+
+
+def transit_route_types(mode_of_travel):
+    """
+    GTFS route types for a mode of travel, None for any transit, or False when the mode is not transit.
+    """
+    ## Before normalize_mode, which folds "bus", "train" and "tram" into "transit"
+    mode = normalize_place(mode_of_travel)
+    if mode in ROUTE_TYPES_BY_MODE:
+        return ROUTE_TYPES_BY_MODE[mode]
+    if normalize_mode(mode) in ROAD_MODES:
+        return False
+    return None
+
+
+class TransitRouter:
+    """
+    Transit routes and schedules between gazetteer places on a TransitFeed.
+
+    Parameters:
+    feed (TransitFeed): None makes every lookup return None.
+    gazetteer (Gazetteer): Resolves place names to coordinates.
+    """
+
+    def __init__(self, feed, gazetteer):
+        self.feed = feed
+        self.gazetteer = gazetteer
+        self.timezone = ZoneInfo(feed.timezones[0]) if feed is not None and feed.timezones else None
+        self.answered = 0
+        self.declined = 0
+
+    @classmethod
+    def from_env(cls, gazetteer):
+        """
+        Router over the feed at GTFS_PATH, compiled or GTFS. Without it the router declines
+        every lookup.
+        """
+        path = os.getenv("GTFS_PATH")
+        return cls(TransitFeed.open(path) if path else None, gazetteer)
+
+    def now(self):
+        """
+        Current time in the time zone of the feed.
+        """
+        return datetime.datetime.now(self.timezone)
+
+    def stops_for(self, place):
+        """
+        Returns:
+        dict: Stop -> seconds of walking, for the stops named like the place or else near it.
+        """
+        stops = self.feed.find_stops(place) or self.feed.find_stops(self.gazetteer.canonicalize(place).split(",")[0])
+        if stops:
+            ## A station named like the place is left through its platforms and transfers
+            found = dict.fromkeys(stops, 0)
+            for stop in stops:
+                first, last = self.feed.transfer_offsets[stop], self.feed.transfer_offsets[stop + 1]
+                for target, seconds in zip(self.feed.transfer_targets[first:last].tolist(), self.feed.transfer_seconds[first:last].tolist()):
+                    found[target] = min(found.get(target, seconds), seconds)
+            return found
+        location = self.gazetteer.location(place)
+        if location is None:
+            return {}
+        return {stop: int(meters / WALK_SPEED_MPS) for stop, meters in self.feed.stops_near(*location).items()}
+
+    def route_text(self, origin, destination, mode_of_travel, when=None):
+        """
+        Next itinerary from origin to destination, with its route numbers and times, or None.
+        """
+        route_types = transit_route_types(mode_of_travel)
+        if self.feed is None or route_types is False:
+            return self._decline()
+        sources, targets = self.stops_for(origin), self.stops_for(destination)
+        if not sources or not targets:
+            return self._decline()
+
+        when = when or self.now()
+        seconds = when.hour * 3600 + when.minute * 60 + when.second
+        result = self.feed.itinerary(sources, targets, when.date(), seconds, route_types)
+        if result is None:
+            return self._decline()
+
+        feed = self.feed
+        rides = [
+            f"route {feed.route_names[leg['route']]} from {feed.stop_names[leg['from']]} at {format_time(leg['departure'])} "
+            f"to {feed.stop_names[leg['to']]} at {format_time(leg['arrival'])}"
+            for leg in result["legs"] if leg["route"] is not None
+        ]
+        self.answered += 1
+        return f"Take {', then '.join(rides)}. Arrival at {destination} at {format_time(result['arrival'])}."
+
+    def schedule_text(self, route_number, mode_of_travel, stop=None, when=None):
+        """
+        Next departures of a route from a stop, or from its first stop, or None.
+        """
+        route_types = transit_route_types(mode_of_travel)
+        if self.feed is None or route_types is False:
+            return self._decline()
+        routes = self.feed.find_routes(route_number, route_types)
+        if not routes:
+            return self._decline()
+
+        when = when or self.now()
+        seconds = when.hour * 3600 + when.minute * 60 + when.second
+        departures = []
+        for route in routes:
+            stops = list(self.stops_for(stop)) if stop else self.feed.route_stops(route)[:1]
+            for candidate in stops:
+                departures.extend((time, candidate) for time in self.feed.next_departures(route, candidate, when.date(), seconds))
+        if not departures:
+            return self._decline()
+
+        departures.sort()
+        first_time, first_stop = departures[0]
+        later = [format_time(time) for time, _ in departures[1:NEXT_DEPARTURES]]
+        output = f"The next {route_number} {mode_of_travel} from {self.feed.stop_names[first_stop]} leaves at {format_time(first_time)}."
+        if later:
+            output += f" Next ones are scheduled at {' and '.join(later)}."
+        self.answered += 1
+        return output
+
+    def _decline(self):
+        self.declined += 1
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Transit itineraries and departures from a GTFS feed.")
+    parser.add_argument("feed", help="GTFS directory or zip file, or the feed compiled from it")
+    parser.add_argument("places", nargs="*", help="origin and destination")
+    parser.add_argument("--mode", default="transit")
+    parser.add_argument("--schedule", help="route number to list the next departures of")
+    parser.add_argument("--stop", help="stop to list the departures from")
+    args = parser.parse_args()
+
+    router = TransitRouter(TransitFeed.open(args.feed), Gazetteer.from_env())
+    if args.schedule:
+        print(router.schedule_text(args.schedule, args.mode, args.stop) or "No departures found")
+    else:
+        print(router.route_text(*args.places[:2], args.mode) or "No route found")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,210 @@
+"""
+Persistent cache for travel duration lookups.
+
+Entries are stored in SQLite so that several assistant processes share them. Each entry is
+keyed on the normalized (origin, destination, mode) triple and expires after a TTL that
+depends on the mode of travel: driving times change with traffic, walking and cycling
+times hardly change at all. Expired entries can still be served for a grace period while a
+background thread refreshes them. The table is bounded and evicts least recently used
+entries first.
+
+"""
+
+import os
+import re
+import sqlite3
+import threading
+import time
+
+DEFAULT_CACHE_PATH = os.path.join(os.path.expanduser("~"), ".cache", "ai_travel_assistant", "travel_durations.sqlite3")
+
+## Seconds before an entry goes stale, per mode of travel
+DEFAULT_TTLS = {
+    "driving": 10 * 60,
+    "transit": 60 * 60,
+    "walking": 30 * 24 * 60 * 60,
+    "bicycling": 30 * 24 * 60 * 60,
+}
+DEFAULT_TTL = 60 * 60
+
+## The Distance Matrix API only knows these four modes. Map common LLM phrasing onto them.
+MODE_ALIASES = {
+    "car": "driving", "drive": "driving", "driving": "driving",
+    "walk": "walking", "walking": "walking", "foot": "walking",
+    "bike": "bicycling", "bicycle": "bicycling", "cycle": "bicycling", "cycling": "bicycling", "bicycling": "bicycling",
+    "transit": "transit", "bus": "transit", "train": "transit", "tram": "transit",
+}
+
+## How long a refresh may run before another process is allowed to retry it
+REFRESH_LEASE = 30
+
+
+def normalize_place(place):
+    return re.sub(r"\s+", " ", str(place)).strip().lower()
+
+
+def normalize_mode(mode_of_travel):
+    mode = normalize_place(mode_of_travel)
+    return MODE_ALIASES.get(mode, mode)
+
+
+def cache_key(origin, destination, mode_of_travel):
+    return "|".join([normalize_place(origin), normalize_place(destination), normalize_mode(mode_of_travel)])
+
+
+class TravelDurationCache:
+    """
+    SQLite-backed TTL cache with LRU eviction and stale-while-revalidate.
+
+    Parameters:
+    path (str): SQLite database file. Shared by every process using the same path.
+    ttls (dict): Seconds until an entry goes stale, per normalized mode of travel.
+    max_entries (int): Upper bound on the number of cached entries.
+    stale_factor (float): Stale entries are served for stale_factor * ttl seconds after
+        they expire while they are refreshed in the background. 0 disables this.
+    """
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, ttls=None, max_entries=10000, stale_factor=1.0):
+        self.path = path
+        self.ttls = {**DEFAULT_TTLS, **(ttls or {})}
+        self.max_entries = max_entries
+        self.stale_factor = stale_factor
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+        self._local = threading.local()
+        self._stats_lock = threading.Lock()
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        with self._connection() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS travel_durations ("
+                " key TEXT PRIMARY KEY,"
+                " value TEXT NOT NULL,"
+                " mode TEXT NOT NULL,"
+                " created_at REAL NOT NULL,"
+                " last_access REAL NOT NULL,"
+                " refreshing_until REAL NOT NULL DEFAULT 0)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS travel_durations_lru ON travel_durations (last_access)")
+
+    def _connection(self):
+        ## sqlite3 connections cannot be shared across threads, and refreshes run in their own thread
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _count(self, counter):
+        with self._stats_lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def ttl(self, mode_of_travel):
+        return self.ttls.get(normalize_mode(mode_of_travel), DEFAULT_TTL)
+
+    def get(self, origin, destination, mode_of_travel):
+        """
+        Look up an entry without computing it.
+
+        Returns:
+        tuple: (value, state) where state is "fresh", "stale" or None when there is no
+            usable entry.
+        """
+        key = cache_key(origin, destination, mode_of_travel)
+        now = time.time()
+        conn = self._connection()
+        row = conn.execute("SELECT value, created_at FROM travel_durations WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None, None
+
+        value, created_at = row
+        ttl = self.ttl(mode_of_travel)
+        age = now - created_at
+        if age > ttl * (1 + self.stale_factor):
+            return None, None
+
+        conn.execute("UPDATE travel_durations SET last_access = ? WHERE key = ?", (now, key))
+        return value, "fresh" if age <= ttl else "stale"
+
+    def put(self, origin, destination, mode_of_travel, value):
+        key = cache_key(origin, destination, mode_of_travel)
+        now = time.time()
+        conn = self._connection()
+        conn.execute(
+            "INSERT OR REPLACE INTO travel_durations (key, value, mode, created_at, last_access, refreshing_until)"
+            " VALUES (?, ?, ?, ?, ?, 0)",
+            (key, value, normalize_mode(mode_of_travel), now, now),
+        )
+        self._evict(conn)
+
+    def _evict(self, conn):
+        (count,) = conn.execute("SELECT COUNT(*) FROM travel_durations").fetchone()
+        if count > self.max_entries:
+            conn.execute(
+                "DELETE FROM travel_durations WHERE key IN"
+                " (SELECT key FROM travel_durations ORDER BY last_access LIMIT ?)",
+                (count - self.max_entries,),
+            )
+
+    def _claim_refresh(self, key):
+        ## Only one process or thread refreshes a stale entry at a time
+        now = time.time()
+        cursor = self._connection().execute(
+            "UPDATE travel_durations SET refreshing_until = ? WHERE key = ? AND refreshing_until < ?",
+            (now + REFRESH_LEASE, key, now),
+        )
+        return cursor.rowcount == 1
+
+    def _refresh(self, origin, destination, mode_of_travel, compute):
+        try:
+            value = compute(origin, destination, mode_of_travel)
+        except Exception:
+            ## Keep serving the stale entry, the next lookup after the lease will retry
+            return
+        if value:
+            self.put(origin, destination, mode_of_travel, value)
+
+    def get_or_compute(self, origin, destination, mode_of_travel, compute):
+        """
+        Return a cached value, computing and storing it on a miss.
+
+        Parameters:
+        compute (function): Called as compute(origin, destination, mode_of_travel). Falsy
+            results, such as error strings that are empty, are returned but not cached.
+        """
+        value, state = self.get(origin, destination, mode_of_travel)
+
+        if state == "fresh":
+            self._count("hits")
+            return value
+
+        if state == "stale":
+            self._count("stale")
+            if self._claim_refresh(cache_key(origin, destination, mode_of_travel)):
+                threading.Thread(
+                    target=self._refresh,
+                    args=(origin, destination, mode_of_travel, compute),
+                    daemon=True,
+                ).start()
+            return value
+
+        self._count("misses")
+        value = compute(origin, destination, mode_of_travel)
+        if value:
+            self.put(origin, destination, mode_of_travel, value)
+        return value
+
+    def stats(self):
+        lookups = self.hits + self.misses + self.stale
+        (size,) = self._connection().execute("SELECT COUNT(*) FROM travel_durations").fetchone()
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "stale": self.stale,
+            "hit_rate": (self.hits + self.stale) / lookups if lookups else 0.0,
+            "size": size,
+        }
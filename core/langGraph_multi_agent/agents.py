@@ -28,19 +28,20 @@ Date: 12/27/2024
 Implementations of agents and related functions.
 
 """
-from typing import Annotated, Literal, Callable
+from typing import Annotated, Callable, Optional
 from typing_extensions import TypedDict
 
 from langgraph.graph.message import AnyMessage, add_messages
 from langchain_openai import ChatOpenAI
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.runnables import Runnable, RunnableConfig
-from langchain_core.tools import tool
-from langchain_core.messages import HumanMessage, ToolMessage
+from langchain_core.messages import AIMessage, ToolMessage
 
 from pydantic import BaseModel
 
 from tools import *
+from common.langchain_cache import langchain_cache_for
+from common.resilience import llm_resilience, session_budgets
 
 class State(TypedDict):
     messages: Annotated[list[AnyMessage], add_messages]
@@ -58,29 +59,49 @@ class Agent(BaseModel):
     model: str = "gpt-4o-mini"
     instructions: str = "Your are a helpful Agent"
     tools: list = []
+    ## None caches completions unless they are sampled with a temperature above 0.
+    ## True also caches sampled completions, False never serves this agent from the completion cache.
+    cache_completions: Optional[bool] = None
+    temperature: float = 0.7
+
+## A branch of the multi-agent graph. build_graph creates its nodes, edges and routing from this spec.
+class Specialist(BaseModel):
+    ## Names the nodes of the branch and is the label of the intent router
+    task_name: str
+    agent: Agent
+    ## Tool the triage agent calls to hand the conversation over to the branch
+    transfer_tool: type
 
 class Supervisor:
 
     def __init__(self, runnable: Runnable):
         self.runnable = runnable
 
-    def __call__(self, state:State):
+    def __call__(self, state: State, config: RunnableConfig):
 
-        result = self.runnable.invoke(state)
+        budget = session_budgets.get(config.get("configurable", {}).get("thread_id"))
+        result = llm_resilience.call(self.runnable.invoke, state, budget=budget)
         next_ = result["next"]
 
         return {"next": next_}
 
+## Re-prompts after an empty response before the turn ends with EMPTY_RESPONSE_FALLBACK
+MAX_EMPTY_RESPONSES = 2
+EMPTY_RESPONSE_FALLBACK = "Sorry, I could not come up with an answer. Could you rephrase your question?"
+
 ## Executing the runnable assistant agent
 class Assistant:
 
     def __init__(self, runnable: Runnable):
         self.runnable = runnable
     
-    def __call__(self, state: State):
+    def __call__(self, state: State, config: RunnableConfig):
+
+        ## Retries of failed LLM calls count against the budget of the conversation
+        budget = session_budgets.get(config.get("configurable", {}).get("thread_id"))
 
-        while True:
-            result = self.runnable.invoke(state)
+        for _ in range(MAX_EMPTY_RESPONSES + 1):
+            result = llm_resilience.call(self.runnable.invoke, state, budget=budget)
             # If the LLM happens to return an empty response, we will re-prompt it
             # for an actual response.
             if not result.tool_calls and (
@@ -91,14 +112,23 @@ class Assistant:
                 messages = state["messages"] + [("user", "Respond with a real output.")]
                 state = {**state, "messages": messages}
             else:
-                break
+                return {"messages": result}
 
-        return {"messages": result}
+        return {"messages": AIMessage(content=EMPTY_RESPONSE_FALLBACK)}
 
 
 def create_agent_runnable(agent:Agent, structured:bool = False):
 
-    llm = ChatOpenAI(temperature = 0.7, model=agent.model)
+    ## Retries are made by llm_resilience, with a budget per conversation
+    llm = ChatOpenAI(
+        temperature = agent.temperature,
+        model=agent.model,
+        cache=langchain_cache_for(agent),
+        timeout=llm_resilience.policy.timeout,
+        max_retries=0,
+        ## Streamed responses report their usage too, including the cached prompt tokens
+        stream_usage=True,
+    )
     if structured:
         llm = llm.with_structured_output(Router)
 
@@ -134,21 +164,6 @@ def create_entry_node(assistant_name: str, new_dialog_state: str) -> Callable:
 
     return entry_node
 
-## Supervising agent that calls the tools as it sees fit.
-triage_agent = Agent(
-    name = "triage agent",
-    instructions = "You are a helpful assistant that helps users plan trips and travels by providing useful information. "
-                    "If a customer requests information on travel duration, traffic conditions, transit route or transit schedule, "
-                    "delegate the task to the appropriate specialized assistant by invoking the corresponding tool. "
-                    "The user is not aware of the different specialized assistants, so do not mention them; just quietly delegate through function calls. "
-                    "For any other travel related questions, make up an informative answer. Answer in at most two sentences. "
-                    "Allow questions that are tangential, as long as they fulfill the goal of providing information related to travelling."
-                    "If the query is not relevant, politely ask the user to ask relevant questions. ",
-    tools = [transfer_to_travel_duration_agent,
-             transfer_to_traffic_updates_agent,
-             transfer_to_transit_details_agent,],
-)
-    
 travel_duration_agent = Agent(
     name = "travel duration agent",
     instructions= "Your are an agent that computes travel duration using origin, destination and travel mode. "
@@ -184,3 +199,22 @@ transit_details_agent = Agent(
     tools = [find_route, find_transit_schedule,],
 )
 
+## Adding a specialist here adds its branch to the graph and its transfer tool to the triage agent
+specialists = [
+    Specialist(task_name="travel_duration", agent=travel_duration_agent, transfer_tool=transfer_to_travel_duration_agent),
+    Specialist(task_name="traffic_updates", agent=traffic_updates_agent, transfer_tool=transfer_to_traffic_updates_agent),
+    Specialist(task_name="transit_details", agent=transit_details_agent, transfer_tool=transfer_to_transit_details_agent),
+]
+
+## Supervising agent that calls the tools as it sees fit.
+triage_agent = Agent(
+    name = "triage agent",
+    instructions = "You are a helpful assistant that helps users plan trips and travels by providing useful information. "
+                    "If a customer requests information on travel duration, traffic conditions, transit route or transit schedule, "
+                    "delegate the task to the appropriate specialized assistant by invoking the corresponding tool. "
+                    "The user is not aware of the different specialized assistants, so do not mention them; just quietly delegate through function calls. "
+                    "For any other travel related questions, make up an informative answer. Answer in at most two sentences. "
+                    "Allow questions that are tangential, as long as they fulfill the goal of providing information related to travelling."
+                    "If the query is not relevant, politely ask the user to ask relevant questions. ",
+    tools = [specialist.transfer_tool for specialist in specialists],
+)
@@ -30,50 +30,70 @@ This is a supervisor-based graph model implemented using LangGraph
 All the experts are implemented as agents. Compare this with the single agent model.
 """
 
+import functools
 import uuid
+import os
+import sys
+
+## Shared modules live in core/common
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from langgraph.checkpoint.memory import MemorySaver
 from langgraph.graph import END, StateGraph, START
-from langgraph.prebuilt import tools_condition
-from langchain_openai import ChatOpenAI
-from langchain_core.prompts import ChatPromptTemplate
 
 from agents import *
 from utils import *
 from tools import *
+from common.intent_router import IntentRouter
+from common.checkpointer import SQLiteCheckpointSaver, DEFAULT_CHECKPOINT_PATH
+from common.streaming import stream_graph
+from common.tracing import tracer
+from common.langchain_tracing import LangGraphTracer
+from common.resilience import LLMUnavailableError, UNAVAILABLE_MESSAGE
 
-def create_branch(builder, agent:Agent, task_name:str):
+def create_branch(builder, specialist:Specialist, branch_index:BranchIndex):
 
+    agent, task_name = specialist.agent, specialist.task_name
     agent_runnable = create_agent_runnable(agent)
 
-    entry_node_name = "enter_" + task_name
-    tools_node_name = task_name + "_tools"
+    entry_node = entry_node_name(task_name)
+    tools_node = tools_node_name(task_name)
 
-    builder.add_node(entry_node_name, create_entry_node(task_name + "_assistant", task_name))
+    builder.add_node(entry_node, create_entry_node(task_name + "_assistant", task_name))
     builder.add_node(task_name, Assistant(agent_runnable))
-    builder.add_node(tools_node_name, create_tool_node_with_fallback(agent.tools + [transfer_back_to_triage_agent]))
+    builder.add_node(tools_node, create_tool_node(agent.tools + [transfer_back_to_triage_agent], TOOL_TIMEOUTS, DEFAULT_TOOL_TIMEOUT))
 
-    builder.add_edge(entry_node_name, task_name)
+    builder.add_edge(entry_node, task_name)
     builder.add_conditional_edges(
         task_name,
-        route_tools,
-        path_map = [tools_node_name, "leave_skill", END],
+        branch_index.route_tools,
+        path_map = [tools_node, "leave_skill", END],
     )
-    builder.add_edge(tools_node_name, task_name)
+    builder.add_edge(tools_node, task_name)
 
-def build_graph():
+def build_graph(intent_router=None, specialists=specialists, triage_agent=triage_agent):
 
     builder = StateGraph(State)
 
+    ## Tool name -> branch tables, built once for every routing decision of the graph
+    branch_index = BranchIndex(specialists)
+
     ## Creating worker branches 
-    create_branch(builder, travel_duration_agent, "travel_duration")  
-    create_branch(builder, traffic_updates_agent, "traffic_updates")  
-    create_branch(builder, transit_details_agent, "transit_details")  
+    for specialist in specialists:
+        create_branch(builder, specialist, branch_index)
 
-    ## Designing the triage assistant
+    ## Designing the triage assistant. It transfers with the tools of the specialists.
     triage_runnable = create_agent_runnable(triage_agent)
     builder.add_node("triage", Assistant(triage_runnable))
-    builder.add_edge(START, "triage")
+
+    ## Confident queries skip the triage LLM call and go straight to a worker
+    if intent_router is not None:
+        builder.add_conditional_edges(
+            START,
+            create_start_router(intent_router, branch_index.task_names),
+            path_map = branch_index.task_names + ["triage"],
+        )
+    else:
+        builder.add_edge(START, "triage")
 
     builder.add_node("leave_skill", return_control)
     builder.add_edge("leave_skill", "triage")
@@ -81,15 +101,17 @@ def build_graph():
     ## Edges from triage to workers
     builder.add_conditional_edges(
         "triage",
-        route_triage_assistant,
-        path_map = ["enter_travel_duration", "enter_traffic_updates", "enter_transit_details", END], ## Since we have multiple conditional edges, we need a path map for each starting node
+        create_triage_router(intent_router, branch_index.route_triage) if intent_router is not None else branch_index.route_triage,
+        path_map = branch_index.triage_path_map,
     )
 
-    memory = MemorySaver()
+    ## Checkpoints persist in SQLite, bounded per thread. Idle threads are evicted.
+    memory = SQLiteCheckpointSaver(os.getenv("CHECKPOINT_PATH", DEFAULT_CHECKPOINT_PATH))
     graph = builder.compile(checkpointer=memory)
 
     return graph
 
+@tracer.traced("turn")
 def run_assistant(config, graph, question):
 
     """
@@ -103,22 +125,53 @@ def run_assistant(config, graph, question):
     str: Output displayed on stdout.
     """
 
-    events = graph.stream(
-        {"messages": ("user", question)}, config, stream_mode="values"
-    )
-    for event in events:
-        if "messages" in event:
-            event["messages"][-1].pretty_print()
-            snapshot = graph.get_state(config)
-            print(snapshot.next)
+    if DEBUG_STATE:
+        events = graph.stream(
+            {"messages": ("user", question)}, config, stream_mode="values"
+        )
+        for event in events:
+            if "messages" in event:
+                event["messages"][-1].pretty_print()
+                snapshot = graph.get_state(config)
+                print(snapshot.next)
+        return
+
+    ## Only new tokens and messages are rendered, without reading the state after every step
+    stream_graph(graph, {"messages": ("user", question)}, config)
 
 messages = []
 
+## Print the full message list and the next nodes after every step.
+## Reads a checkpoint per step, so the cost of a turn grows with the conversation.
+DEBUG_STATE = False
+
+## Seconds a tool may run before its result is replaced by an error message
+DEFAULT_TOOL_TIMEOUT = 30
+TOOL_TIMEOUTS = {
+    "compute_travel_duration": 10,
+}
+
 ## Creating a unique ID and configuration
 thread_id = str(uuid.uuid4())
-config = {"configurable": {"thread_id": thread_id},}
+## LangGraphTracer records every node and LLM call of the graph as a span
+config = {"configurable": {"thread_id": thread_id}, "callbacks": [LangGraphTracer()]}
+
+## Route confident queries to the workers without the triage LLM call.
+## INTENT_MODEL_PATH, INTENT_LOG_PATH and INTENT_ROUTER_THRESHOLD configure the router.
+USE_INTENT_ROUTER = True
+
+@functools.cache
+def get_graph():
+    """
+    The graph of the assistant, compiled on first use so that the first prompt does not wait for it.
+    """
+    return build_graph(IntentRouter.from_env() if USE_INTENT_ROUTER else None)
 
-graph = build_graph()
+def __getattr__(name):
+    ## Importers such as graph_server.py read main.graph
+    if name == "graph":
+        return get_graph()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 #graph.get_graph().draw_mermaid_png(output_file_path="my_graph_8.png")
 
 questions = [
@@ -134,9 +187,13 @@ questions = [
 ]
 
 
-## We don't have to append messages to a list because we use MemorySaver() to maintain memory
-while True:
-    user_query = input("User: ")
-    run_assistant(config, graph, user_query)
+## We don't have to append messages to a list because the checkpointer maintains memory
+if __name__ == "__main__":
+    while True:
+        user_query = input("User: ")
+        try:
+            run_assistant(config, get_graph(), user_query)
+        except LLMUnavailableError:
+            print("Assistant:", UNAVAILABLE_MESSAGE)
 
 
@@ -27,72 +27,139 @@ SOFTWARE.
 from langgraph.graph import END
 from langgraph.prebuilt import tools_condition
 
-from langchain_core.messages import ToolMessage
-from langchain_core.runnables import RunnableLambda
+from langchain_core.messages import ToolMessage, HumanMessage
+from langchain_core.tools import BaseTool
 
-from langgraph.prebuilt import ToolNode
+from common.tool_node import ConcurrentToolNode
+from common.intent_router import OTHER
 
 from agents import *
 from tools import *
 
-def handle_tool_error(state) -> dict:
-    error = state.get("error")
-    tool_calls = state["messages"][-1].tool_calls
-    return {
-        "messages": [
-            ToolMessage(
-                content=f"Error: {repr(error)}\n please fix your mistakes.",
-                tool_call_id=tc["id"],
-            )
-            for tc in tool_calls
-        ]
-    }
+def create_tool_node(tools: list, timeouts=None, default_timeout=None):
+    """
+    Tool node that runs the tool calls of a message concurrently. A call that fails or times out
+    gets its own error message, and the results of the other calls are kept.
+    """
+    return ConcurrentToolNode(tools, timeouts=timeouts, default_timeout=default_timeout)
+
+def tool_name(tool) -> str:
+    return tool.name if isinstance(tool, BaseTool) else tool.__name__
+
+def entry_node_name(task_name: str) -> str:
+    return "enter_" + task_name
+
+def tools_node_name(task_name: str) -> str:
+    return task_name + "_tools"
+
+class BranchIndex:
+    """
+    Routing tables of the specialist branches, built once when the graph is compiled, so that
+    every routing decision is a dictionary lookup per tool call however many branches there are.
+
+    Parameters:
+    specialists (list): Specialist specs of the branches.
+    """
+
+    def __init__(self, specialists: list):
+        self.task_names = [specialist.task_name for specialist in specialists]
+        ## Transfer tool of the triage agent -> entry node of its branch
+        self.entry_nodes = {}
+        ## Tool of a specialist -> tools node of its branch
+        self.tools_nodes = {}
+        for specialist in specialists:
+            self.entry_nodes[tool_name(specialist.transfer_tool)] = entry_node_name(specialist.task_name)
+            for tool in specialist.agent.tools:
+                name = tool_name(tool)
+                if name in self.tools_nodes:
+                    raise ValueError(f"Tool {name} belongs to two branches, {self.tools_nodes[name]} and {tools_node_name(specialist.task_name)}")
+                self.tools_nodes[name] = tools_node_name(specialist.task_name)
+        ## Since we have multiple conditional edges, we need a path map for each starting node
+        self.triage_path_map = list(self.entry_nodes.values()) + [END]
+
+    def route_tools(self, state:State):
+        route = tools_condition(state)
+
+        if route == END:
+            return END
+
+        tool_calls = state["messages"][-1].tool_calls
+
+        if tool_calls:
+
+            leave = any(tc["name"] == transfer_back_to_triage_agent.__name__ for tc in tool_calls)
+            if leave:
+                return "leave_skill"
+            ## All the calls of a message must go to the tools node of one branch
+            nodes = {self.tools_nodes.get(tc["name"]) for tc in tool_calls}
+            if len(nodes) == 1 and None not in nodes:
+                return nodes.pop()
+
+        raise ValueError("Invalid route")
+
+    def route_triage(self, state:State):
+        ## tools_condition adds an edge between assistant and END
+        route = tools_condition(state)
+        if route == END:
+            return END
+        tool_calls = state["messages"][-1].tool_calls
+        if tool_calls and tool_calls[0]["name"] in self.entry_nodes:
+            return self.entry_nodes[tool_calls[0]["name"]]
+
+        raise ValueError("Invalid route")
+
+## Routing of the default specialists. build_graph builds the index of the specialists it is given.
+branch_index = BranchIndex(specialists)
+route_tools = branch_index.route_tools
+route_triage_assistant = branch_index.route_triage
+
+def last_user_query(state:State):
+    for message in reversed(state["messages"]):
+        if isinstance(message, HumanMessage):
+            return message.content if isinstance(message.content, str) else str(message.content)
+    return ""
+
+def called_tools_this_turn(state:State):
+    """
+    Whether any tool was called since the last user query, before the last message.
+    """
+    for message in reversed(state["messages"][:-1]):
+        if isinstance(message, HumanMessage):
+            return False
+        if getattr(message, "tool_calls", None):
+            return True
+    return False
+
+def create_start_router(intent_router, task_names=None):
+    """
+    Route a new user query straight to a specialist when the local intent router is confident,
+    skipping the triage LLM call. Everything else goes to the triage assistant.
+    The router labels are the task names of the branches. Labels that are not in task_names,
+    when given, also go to the triage assistant.
+    """
+    def route_start(state:State):
+        task_name = intent_router.route(last_user_query(state))
+        if task_name is None or task_names is not None and task_name not in task_names:
+            return "triage"
+        return task_name
 
+    return route_start
 
-def create_tool_node_with_fallback(tools: list) -> dict:
-    return ToolNode(tools).with_fallbacks(
-        [RunnableLambda(handle_tool_error)], exception_key="error"
-    )
-
-def route_tools(state:State):
-    route = tools_condition(state)
-
-    if route == END:
-        return END
-    
-    tool_calls = state["messages"][-1].tool_calls
-
-    if tool_calls:
-
-        leave = any(tc["name"] == transfer_back_to_triage_agent.__name__ for tc in tool_calls)
-        if leave:
-            return "leave_skill"
-        if all(tc["name"] in [t.name for t in travel_duration_agent.tools] for tc in tool_calls):
-            return "travel_duration_tools"
-        if all(tc["name"] in [t.name for t in traffic_updates_agent.tools] for tc in tool_calls):
-            return "traffic_updates_tools"
-        if all(tc["name"] in [t.name for t in transit_details_agent.tools] for tc in tool_calls):
-            return "transit_details_tools"
-    
-    raise ValueError("Invalid route")
-
-def route_triage_assistant(
-    state: State,
-):
-    ## tools_condition adds an edge between assistant and END
-    route = tools_condition(state)
-    if route == END:
-        return END
-    tool_calls = state["messages"][-1].tool_calls
-    if tool_calls:
-        if tool_calls[0]["name"] == transfer_to_travel_duration_agent.__name__:
-            return "enter_travel_duration"
-        elif tool_calls[0]["name"] == transfer_to_traffic_updates_agent.__name__:
-            return "enter_traffic_updates"
-        elif tool_calls[0]["name"] == transfer_to_transit_details_agent.__name__:
-            return "enter_transit_details"
-        
-    raise ValueError("Invalid route")
+def create_triage_router(intent_router, route_triage_assistant=route_triage_assistant):
+    """
+    route_triage_assistant that also logs the specialist the triage LLM picked, or "other"
+    when it answered the query itself, as training data for the intent router.
+    """
+    def route_triage(state:State):
+        route = route_triage_assistant(state)
+        if route.startswith("enter_"):
+            intent_router.log_turn(last_user_query(state), route[len("enter_"):])
+        elif route == END and not called_tools_this_turn(state):
+            ## Answers after a specialist handed control back belong to that specialist's turn
+            intent_router.log_turn(last_user_query(state), OTHER)
+        return route
+
+    return route_triage
 
 def return_control(state:State):
     """
@@ -1,12 +1,12 @@
-from typing import Annotated
+from typing import Annotated, Optional
 from typing_extensions import TypedDict
 from langgraph.graph.message import AnyMessage, add_messages
-from langchain_openai import ChatOpenAI
-from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.runnables import Runnable, RunnableConfig
+from langchain_core.messages import AIMessage
 from pydantic import BaseModel
 
 from tools import *
+from common.resilience import llm_resilience, session_budgets
 
 class State(TypedDict):
     messages: Annotated[list[AnyMessage], add_messages]
@@ -19,6 +19,14 @@ class Agent(BaseModel):
     model: str = "gpt-4o-mini"
     instructions: str = "Your are a helpful Agent"
     tools: list = []
+    ## None caches completions unless they are sampled with a temperature above 0.
+    ## True also caches sampled completions, False never serves this agent from the completion cache.
+    cache_completions: Optional[bool] = None
+    temperature: float = 0.7
+
+## Re-prompts after an empty response before the turn ends with EMPTY_RESPONSE_FALLBACK
+MAX_EMPTY_RESPONSES = 2
+EMPTY_RESPONSE_FALLBACK = "Sorry, I could not come up with an answer. Could you rephrase your question?"
 
 ## Executing the runnable assistant agent
 class Assistant:
@@ -28,8 +36,11 @@ class Assistant:
     
     def __call__(self, state: State, config: RunnableConfig):
 
-        while True:
-            result = self.runnable.invoke(state)
+        ## Retries of failed LLM calls count against the budget of the conversation
+        budget = session_budgets.get(config.get("configurable", {}).get("thread_id"))
+
+        for _ in range(MAX_EMPTY_RESPONSES + 1):
+            result = llm_resilience.call(self.runnable.invoke, state, budget=budget)
             # If the LLM happens to return an empty response, we will re-prompt it
             # for an actual response.
             if not result.tool_calls and (
@@ -40,9 +51,9 @@ class Assistant:
                 messages = state["messages"] + [("user", "Respond with a real output.")]
                 state = {**state, "messages": messages}
             else:
-                break
+                return {"messages": result}
 
-        return {"messages": result}
+        return {"messages": AIMessage(content=EMPTY_RESPONSE_FALLBACK)}
 
 ## Supervising agent that calls the tools as it sees fit.
 triage_agent = Agent(
@@ -29,22 +29,41 @@ AI assistant that answers questions related to travel information including trav
 This implementation is a graph-based model implemented using LangGraph
 
 """
+import functools
 import uuid
 import os
+import sys
 
-from langgraph.checkpoint.memory import MemorySaver
-from langgraph.graph import END, StateGraph, START
+## Shared modules live in core/common
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from langgraph.graph import StateGraph, START
 from langgraph.prebuilt import tools_condition
 from langchain_openai import ChatOpenAI
 from langchain_core.prompts import ChatPromptTemplate
 
 from agents import State, Assistant, triage_agent
-from utils import create_tool_node_with_fallback
+from utils import create_tool_node
+from common.langchain_cache import langchain_cache_for
+from common.checkpointer import SQLiteCheckpointSaver, DEFAULT_CHECKPOINT_PATH
+from common.streaming import stream_graph
+from common.tracing import tracer
+from common.langchain_tracing import LangGraphTracer
+from common.resilience import llm_resilience, LLMUnavailableError, UNAVAILABLE_MESSAGE
 
 def build_graph(agent):
 
     builder = StateGraph(State)
-    llm = ChatOpenAI(temperature = 0.7, model=agent.model)
+    ## Retries are made by llm_resilience, with a budget per conversation
+    llm = ChatOpenAI(
+        temperature = agent.temperature,
+        model=agent.model,
+        cache=langchain_cache_for(agent),
+        timeout=llm_resilience.policy.timeout,
+        max_retries=0,
+        ## Streamed responses report their usage too, including the cached prompt tokens
+        stream_usage=True,
+    )
     tools = agent.tools
     primary_prompt = ChatPromptTemplate.from_messages(
         [
@@ -55,7 +74,7 @@ def build_graph(agent):
     assistant_runnable = primary_prompt | llm.bind_tools(tools)
 
     builder.add_node("assistant", Assistant(assistant_runnable))
-    builder.add_node("tools", create_tool_node_with_fallback(tools))
+    builder.add_node("tools", create_tool_node(tools, TOOL_TIMEOUTS, DEFAULT_TOOL_TIMEOUT))
     builder.add_edge(START, "assistant")
     ## edge from assistant to tools
     ## tools_condition adds an edge between assistant and END
@@ -66,7 +85,8 @@ def build_graph(agent):
     ## edge from tools to assistant
     builder.add_edge("tools", "assistant")
 
-    memory = MemorySaver()
+    ## Checkpoints persist in SQLite, bounded per thread. Idle threads are evicted.
+    memory = SQLiteCheckpointSaver(os.getenv("CHECKPOINT_PATH", DEFAULT_CHECKPOINT_PATH))
     graph = builder.compile(checkpointer=memory)
 
     return graph
@@ -74,6 +94,7 @@ def build_graph(agent):
 #graph = build_graph(triage_agent)
 #graph.get_graph().draw_mermaid_png(output_file_path="my_graph.png")
 
+@tracer.traced("turn")
 def run_assistant(config, graph, question):
 
     """
@@ -87,14 +108,19 @@ def run_assistant(config, graph, question):
     str: Output displayed on stdout.
     """
 
-    events = graph.stream(
-        {"messages": ("user", question)}, config, stream_mode="values"
-    )
-    for event in events:
-        if "messages" in event:
-            event["messages"][-1].pretty_print()
-            snapshot = graph.get_state(config)
-            print(snapshot.next)
+    if DEBUG_STATE:
+        events = graph.stream(
+            {"messages": ("user", question)}, config, stream_mode="values"
+        )
+        for event in events:
+            if "messages" in event:
+                event["messages"][-1].pretty_print()
+                snapshot = graph.get_state(config)
+                print(snapshot.next)
+        return
+
+    ## Only new tokens and messages are rendered, without reading the state after every step
+    stream_graph(graph, {"messages": ("user", question)}, config)
     
     ## Return recent messages
     #return Response(agent=current_agent, messages=messages[num_init_messages:])
@@ -104,11 +130,33 @@ def run_assistant(config, graph, question):
 
 messages = []
 
+## Print the full message list and the next nodes after every step.
+## Reads a checkpoint per step, so the cost of a turn grows with the conversation.
+DEBUG_STATE = False
+
+## Seconds a tool may run before its result is replaced by an error message
+DEFAULT_TOOL_TIMEOUT = 30
+TOOL_TIMEOUTS = {
+    "compute_travel_duration": 10,
+}
+
 ## Creating a unique ID and configuration
 thread_id = str(uuid.uuid4())
-config = {"configurable": {"thread_id": thread_id},}
+## LangGraphTracer records every node and LLM call of the graph as a span
+config = {"configurable": {"thread_id": thread_id}, "callbacks": [LangGraphTracer()]}
+
+@functools.cache
+def get_graph():
+    """
+    The graph of the assistant, compiled on first use so that the first prompt does not wait for it.
+    """
+    return build_graph(triage_agent)
 
-graph = build_graph(triage_agent)
+def __getattr__(name):
+    ## Importers such as graph_server.py read main.graph
+    if name == "graph":
+        return get_graph()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 questions = [
     "How much time will it take me to go from Sunnyvale to Mountain View by car?",
@@ -123,10 +171,14 @@ questions = [
 ]
 
 
-## We don't have to append messages to a list because we use MemorySaver() to maintain memory
-while True:
-    user_query = input("User: ")
-    run_assistant(config, graph, user_query)
+## We don't have to append messages to a list because the checkpointer maintains memory
+if __name__ == "__main__":
+    while True:
+        user_query = input("User: ")
+        try:
+            run_assistant(config, get_graph(), user_query)
+        except LLMUnavailableError:
+            print("Assistant:", UNAVAILABLE_MESSAGE)
 
 
 
@@ -25,25 +25,11 @@ SOFTWARE.
 
 """
 
-from langchain_core.messages import ToolMessage
-from langchain_core.runnables import RunnableLambda
-
-from langgraph.prebuilt import ToolNode
-
-def handle_tool_error(state) -> dict:
-    error = state.get("error")
-    tool_calls = state["messages"][-1].tool_calls
-    return {
-        "messages": [
-            ToolMessage(
-                content=f"Error: {repr(error)}\n please fix your mistakes.",
-                tool_call_id=tc["id"],
-            )
-            for tc in tool_calls
-        ]
-    }
-
-def create_tool_node_with_fallback(tools: list) -> dict:
-    return ToolNode(tools).with_fallbacks(
-        [RunnableLambda(handle_tool_error)], exception_key="error"
-    )
\ No newline at end of file
+from common.tool_node import ConcurrentToolNode
+
+def create_tool_node(tools: list, timeouts=None, default_timeout=None):
+    """
+    Tool node that runs the tool calls of a message concurrently. A call that fails or times out
+    gets its own error message, and the results of the other calls are kept.
+    """
+    return ConcurrentToolNode(tools, timeouts=timeouts, default_timeout=default_timeout)
\ No newline at end of file